@@ -0,0 +1,72 @@
+"""Lazy asset handles and a frame-sliced preloader.
+
+Sprites and sounds are wrapped in Asset handles that load on first get(),
+so importing the game costs the same whatever the size of the roster. A
+Preloader warms a queue of handles a few milliseconds per frame (the web
+build has no threads), starting with what the first screens show, so most
+assets are ready before anything asks for them.
+
+Startup milestones are recorded in `startup` (seconds since STARTUP_START)
+and printed when POKEMON_STARTUP_TIMING=1.
+"""
+import os
+import time
+from collections import deque
+
+STARTUP_START = time.perf_counter()
+REPORT_STARTUP = os.environ.get("POKEMON_STARTUP_TIMING", "0") == "1"
+startup = {}
+
+
+def mark_startup(label):
+    """Record the first time a startup milestone is reached."""
+    if label not in startup:
+        startup[label] = time.perf_counter() - STARTUP_START
+        if REPORT_STARTUP:
+            print(f"startup: {label} at {startup[label] * 1000:.1f} ms")
+
+
+class Asset:
+    """A sprite, sound or other resource that is loaded by loader(*args) on first use."""
+    __slots__ = ("loader", "args", "value", "loaded")
+
+    def __init__(self, loader, *args):
+        self.loader = loader
+        self.args = args
+        self.value = None
+        self.loaded = False
+
+    def get(self):
+        if not self.loaded:
+            self.value = self.loader(*self.args)
+            self.loaded = True
+        return self.value
+
+
+class Preloader:
+    """Loads queued assets within a per-frame time budget."""
+
+    def __init__(self, budget=0.004):
+        self.budget = budget
+        self.queue = deque()
+        self.total = 0
+
+    def add(self, *handles):
+        self.queue.extend(handles)
+        self.total += len(handles)
+
+    @property
+    def done(self):
+        return not self.queue
+
+    def step(self):
+        """Load assets until the budget is spent; at least one per call."""
+        if not self.queue:
+            return
+        deadline = time.perf_counter() + self.budget
+        while self.queue:
+            self.queue.popleft().get()
+            if time.perf_counter() > deadline:
+                break
+        if not self.queue:
+            mark_startup(f"preloaded {self.total} assets")
@@ -0,0 +1,108 @@
+"""Build-time sprite atlas.
+
+The source art in art/ is large and gets scaled down on every launch. The
+build step packs every sprite, already scaled, into pages of PAGE_COLUMNS x
+PAGE_ROWS sprites plus a JSON index, so the game decodes a few small images
+and hands out subsurfaces:
+
+    python atlas.py                  # art/*.png -> data/atlas-N.png + data/atlas.json
+
+Sprites are packed in roster order, so the species shown together on the
+selection screen mostly share a page. Loading the atlas reads only the
+index; a page is decoded the first time one of its sprites is asked for.
+Sprites are looked up by their source path (e.g. "art/cyn.png"), so code
+that asks for a sprite by path works the same with or without an atlas.
+"""
+import argparse
+import glob
+import json
+import os
+
+import pygame
+
+import roster
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ATLAS_INDEX = os.path.join(ROOT, "data", "atlas.json")
+SPRITE_SIZE = (100, 100)
+PAGE_COLUMNS = PAGE_ROWS = 4
+
+
+def default_sources():
+    """Sprite paths in roster order, then any other art."""
+    rost = roster.Roster.load()
+    sources = list(dict.fromkeys(rost.visuals(name)["sprite"] for name in rost.names))
+    art = sorted(os.path.relpath(path, ROOT).replace(os.sep, "/") for path in glob.glob(os.path.join(ROOT, "art", "*.png")))
+    return sources + [source for source in art if source not in sources]
+
+
+def build(sources, index_path=ATLAS_INDEX, size=SPRITE_SIZE):
+    """Scale each source to size, pack them into pages and write the pages and the index."""
+    directory = os.path.dirname(index_path)
+    per_page = PAGE_COLUMNS * PAGE_ROWS
+    for stale in glob.glob(os.path.join(directory, "atlas-*.png")):
+        os.remove(stale)
+    pages = []
+    index = {}
+    for start in range(0, len(sources), per_page):
+        chunk = sources[start:start + per_page]
+        rows = (len(chunk) + PAGE_COLUMNS - 1) // PAGE_COLUMNS
+        sheet = pygame.Surface((min(len(chunk), PAGE_COLUMNS) * size[0], rows * size[1]), pygame.SRCALPHA)
+        for i, source in enumerate(chunk):
+            # Same scaling as the game's load_sprite(), so pixels match a direct load
+            image = pygame.transform.scale(pygame.image.load(os.path.join(ROOT, source)), size)
+            x, y = (i % PAGE_COLUMNS) * size[0], (i // PAGE_COLUMNS) * size[1]
+            sheet.blit(image, (x, y))
+            index[source] = [len(pages), x, y, size[0], size[1]]
+        name = f"atlas-{len(pages)}.png"
+        pygame.image.save(sheet, os.path.join(directory, name))
+        pages.append(name)
+    with open(index_path, "w") as f:
+        json.dump({"pages": pages, "sprites": index}, f, indent=1)
+    return index, [os.path.join(directory, name) for name in pages]
+
+
+class SpriteAtlas:
+    def __init__(self, directory, pages, index):
+        self.directory = directory
+        self.page_files = pages
+        self.pages = [None] * len(pages)   # decoded on first use
+        self.index = index    # source path -> [page, x, y, w, h]
+
+    @classmethod
+    def load(cls, index_path=ATLAS_INDEX):
+        """Read the atlas index, or None if it was not built; no page is decoded yet."""
+        try:
+            with open(index_path) as f:
+                data = json.load(f)
+            return cls(os.path.dirname(index_path), data["pages"], data["sprites"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def page(self, number):
+        # convert_alpha needs a display; a failure raises and leaves the page to be retried
+        if self.pages[number] is None:
+            self.pages[number] = pygame.image.load(os.path.join(self.directory, self.page_files[number])).convert_alpha()
+        return self.pages[number]
+
+    def sprite(self, source, size=SPRITE_SIZE):
+        entry = self.index.get(source)
+        if entry is None:
+            return None
+        number, *rect = entry
+        image = self.page(number).subsurface(rect)
+        if image.get_size() != tuple(size):
+            image = pygame.transform.scale(image, size)
+        return image
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack pre-scaled sprites into data/atlas-N.png pages.")
+    parser.add_argument("sources", nargs="*", help="source PNGs relative to the repo (default: roster sprites, then art/*.png)")
+    args = parser.parse_args()
+
+    sources = args.sources or default_sources()
+    index, page_paths = build(sources)
+    before = sum(os.path.getsize(os.path.join(ROOT, source)) for source in sources)
+    after = sum(os.path.getsize(path) for path in page_paths) + os.path.getsize(ATLAS_INDEX)
+    print(f"packed {len(index)} sprites into {len(page_paths)} pages: {before} bytes of source art -> {after} bytes")
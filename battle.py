@@ -0,0 +1,183 @@
+"""Battle rules without pygame.
+
+The GUI in main.py, the simulators and the AI all drive the same Battle
+object, so a whole battle can be resolved in a few microseconds on a box
+without a display.
+"""
+import random
+
+import roster
+
+POTION_HEAL = 20
+POTION_COUNT = 3
+AI_HEAL_THRESHOLD = 0.4
+AI_MOVE_WEIGHT = 70
+AI_TACKLE_WEIGHT = 30
+
+# Stats and moves for each Pokémon, compiled from data/roster/ by roster.py and
+# decoded per species on first use (sprites, colors and sounds live in main.py)
+ROSTER = roster.load_default()
+POKEMON_STATS = roster.LazyTable(ROSTER, ROSTER.stats)
+
+
+def move_order(name):
+    stats = POKEMON_STATS[name]
+    return stats.get("button_order") or list(stats["attacks"].keys())
+
+
+class Battle:
+    """Mutable state of one battle: HP, potions, whose turn it is and the winner."""
+    __slots__ = ("names", "hp", "max_hp", "potions", "turn", "winner", "turns")
+
+    def __init__(self, name1, name2, first_turn=0, potions=POTION_COUNT):
+        self.names = (name1, name2)
+        self.max_hp = (POKEMON_STATS[name1]["max_hp"], POKEMON_STATS[name2]["max_hp"])
+        self.hp = [POKEMON_STATS[name1]["hp"], POKEMON_STATS[name2]["hp"]]
+        self.potions = [potions, potions]
+        self.turn = first_turn
+        self.winner = None   # index of the winning side once the battle is over
+        self.turns = 0
+
+    @property
+    def over(self):
+        return self.winner is not None
+
+    def copy(self):
+        other = Battle.__new__(Battle)
+        other.names = self.names
+        other.max_hp = self.max_hp
+        other.hp = self.hp[:]
+        other.potions = self.potions[:]
+        other.turn = self.turn
+        other.winner = self.winner
+        other.turns = self.turns
+        return other
+
+    def attacks(self, idx):
+        return POKEMON_STATS[self.names[idx]]["attacks"]
+
+    def can_use_potion(self, idx):
+        return self.potions[idx] > 0 and self.hp[idx] < self.max_hp[idx]
+
+    def legal_actions(self, idx=None):
+        if idx is None:
+            idx = self.turn
+        # A fresh list every time: callers may consume it
+        actions = list(move_order(self.names[idx]))
+        if self.can_use_potion(idx):
+            actions.append("potion")
+        return actions
+
+    def pass_turn(self):
+        self.turn = 1 - self.turn
+        self.turns += 1
+
+    def use_potion(self, idx):
+        """Heal idx by POTION_HEAL and pass the turn. Returns False if not allowed."""
+        if not self.can_use_potion(idx):
+            return False
+        self.potions[idx] -= 1
+        self.hp[idx] = min(self.hp[idx] + POTION_HEAL, self.max_hp[idx])
+        self.pass_turn()
+        return True
+
+    def deal_damage(self, attacker_idx, damage):
+        """Apply damage to the defender. Returns True if it knocked them out."""
+        target_idx = 1 - attacker_idx
+        self.hp[target_idx] -= damage
+        if self.hp[target_idx] <= 0:
+            self.hp[target_idx] = 0
+            self.winner = attacker_idx
+            return True
+        return False
+
+
+def roll_damage(attack, rng=random):
+    return rng.randint(*attack["damage_range"])
+
+
+def apply_action(state, action, rng=random):
+    """Resolve one action for the side whose turn it is, including the damage roll.
+
+    Returns the damage dealt (0 for a potion), or None if the action is not allowed.
+    """
+    attacker_idx = state.turn
+    if action == "potion":
+        return 0 if state.use_potion(attacker_idx) else None
+    attack = state.attacks(attacker_idx).get(action)
+    if attack is None:
+        return None
+    state.pass_turn()
+    damage = roll_damage(attack, rng)
+    state.deal_damage(attacker_idx, damage)
+    return damage
+
+
+# --- Policies: (state, idx, rng) -> action key ---
+
+def ai_action(state, idx, rng=random):
+    # Heal below 40% HP if potions are left, else weighted random move
+    if state.potions[idx] > 0 and state.hp[idx] < state.max_hp[idx] * AI_HEAL_THRESHOLD:
+        return "potion"
+    move_keys = [k for k in state.attacks(idx) if k != "tackle"]
+    weights = [AI_MOVE_WEIGHT] * len(move_keys)
+    move_keys.append("tackle")
+    weights.append(AI_TACKLE_WEIGHT)
+    return rng.choices(move_keys, weights=weights, k=1)[0]
+
+
+def random_action(state, idx, rng=random):
+    return rng.choice(state.legal_actions(idx))
+
+
+def greedy_action(state, idx, rng=random):
+    # Always the move with the best average damage, never heals
+    attacks = state.attacks(idx)
+    return max(attacks, key=lambda k: sum(attacks[k]["damage_range"]))
+
+
+POLICIES = {
+    "ai": ai_action,
+    "random": random_action,
+    "greedy": greedy_action,
+}
+
+
+def simulate_battle(name1, name2, policies=("ai", "ai"), rng=None, first_turn=0, log=None, battle_id=""):
+    """Play a whole battle with no animations and return the finished Battle.
+
+    With log (an events.EventLog) every action is recorded, ticks being turn numbers.
+    """
+    if rng is None:
+        rng = random.Random()
+    state = Battle(name1, name2, first_turn)
+    choose = [POLICIES[p] if isinstance(p, str) else p for p in policies]
+    while state.winner is None:
+        idx = state.turn
+        action = choose[idx](state, idx, rng)
+        damage = apply_action(state, action, rng)
+        if log is not None:
+            tick = state.turns
+            if action == "potion":
+                log.record(battle_id, tick, "potion", idx, action, damage, state)
+            else:
+                log.record(battle_id, tick, "attack", idx, action, None, state)
+                log.record(battle_id, tick, "hit", idx, action, damage, state)
+                if state.winner is not None:
+                    log.record(battle_id, tick, "ko", idx, None, None, state)
+    return state
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rng = random.Random(0)
+    names = list(POKEMON_STATS.keys())
+    start = time.perf_counter()
+    wins = 0
+    for i in range(count):
+        wins += simulate_battle(names[i % len(names)], names[(i + 1) % len(names)], rng=rng).winner == 0
+    elapsed = time.perf_counter() - start
+    print(f"{count} battles in {elapsed:.3f}s ({count / elapsed:.0f}/s), P1 won {wins / count:.1%}")
@@ -0,0 +1,72 @@
+"""Import-time benchmark for main.py.
+
+Imports main in fresh interpreters and checks two things: that the import
+has no side effects (pygame is not initialised, no window is opened and
+NumPy-only modules are not pulled in), and that main's own import cost,
+on top of importing pygame itself, stays under a fixed budget:
+
+    python benchmarks/bench_import.py --runs 7 --budget-ms 100
+
+Exits non-zero when either check fails.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+report = {{"seconds": elapsed}}
+if "{module}" == "main":
+    import pygame
+    report["pygame_init"] = pygame.get_init()
+    report["display_init"] = pygame.display.get_init()
+    report["window"] = main.screen is not None
+    report["heavy_modules"] = sorted(name for name in ("winprob", "montecarlo") if name in sys.modules)
+print(json.dumps(report))
+"""
+
+
+def probe(module):
+    env = dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1", SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy")
+    result = subprocess.run([sys.executable, "-c", PROBE.format(module=module)], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that importing main.py is cheap and side-effect free.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=100.0,
+                        help="allowed import time for main on top of pygame (best of --runs)")
+    args = parser.parse_args()
+
+    # Best of several runs filters out a cold disk cache and scheduler noise
+    pygame_ms = min(probe("pygame")["seconds"] for _ in range(args.runs)) * 1000
+    reports = [probe("main") for _ in range(args.runs)]
+    main_ms = min(report["seconds"] for report in reports) * 1000
+    own_ms = main_ms - pygame_ms
+    print(f"import pygame {pygame_ms:.1f} ms, import main {main_ms:.1f} ms "
+          f"(main's own cost {own_ms:.1f} ms, budget {args.budget_ms:.0f} ms)")
+
+    failures = []
+    report = reports[-1]
+    if report["pygame_init"] or report["display_init"] or report["window"]:
+        failures.append("importing main initialised pygame or opened a window")
+    if report["heavy_modules"]:
+        failures.append(f"importing main pulled in {', '.join(report['heavy_modules'])}")
+    if own_ms > args.budget_ms:
+        failures.append(f"main's import cost {own_ms:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+    for failure in failures:
+        print("FAIL:", failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
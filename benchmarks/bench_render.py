@@ -0,0 +1,193 @@
+"""Rendering benchmarks under the SDL dummy video driver.
+
+Drives main.draw_frame() and present_frame() headlessly through scripted
+scenarios and reports frames per second plus the bytes allocated per frame
+(tracemalloc peak over each frame, in a separate pass so tracing does not
+skew the timings). Results are written as JSON and can be compared with a
+saved baseline:
+
+    python benchmarks/bench_render.py --save-baseline     # record benchmarks/render_baseline.json
+    python benchmarks/bench_render.py                     # compare, exit 1 on a regression
+
+The baseline is machine specific; record it on the machine that runs the
+comparison.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pygame  # noqa: E402
+
+import main  # noqa: E402
+
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "render_baseline.json")
+
+
+# --- Scenarios: setup() puts the game in a state, tick() runs before each frame ---
+
+def start_battle(name1="Cyndaquil", name2="Totodile"):
+    main.reset_game()
+    main.mode_select = False
+    main.mode_selected = 1   # two local players, so no AI task is scheduled
+    main.battle_start = True
+    main.player_choices = [main.player_choice_names.index(name1), main.player_choice_names.index(name2)]
+    main.start_battle()
+    main.dirty_state["full"] = True
+
+
+def keep_alive():
+    # Hits land every few frames; keep both sides alive so the HUD stays the same
+    state = main.battle_state
+    state.hp[:] = list(state.max_hp)
+    state.winner = None
+    main.game_over = False
+
+
+def spawn_every_projectile():
+    # Every move of every species, fired from both sides
+    main.projectiles.clear()
+    for attacker_idx in (0, 1):
+        attacker = main.players[attacker_idx]
+        for name, data in main.pokemon_data.items():
+            attacker["attacks"] = data["attacks"]
+            for key, attack in data["attacks"].items():
+                main.spawn_projectile(attack["type"], main.battle_positions[attacker_idx],
+                                      main.battle_positions[1 - attacker_idx], attacker_idx, key)
+        attacker["attacks"] = main.pokemon_data[attacker["name"]]["attacks"]
+
+
+def projectiles_tick():
+    main.update_projectiles()
+    main.update_particles()
+    keep_alive()
+    if not main.projectiles:
+        spawn_every_projectile()
+
+
+def particles_tick(count):
+    def tick():
+        main.update_particles()
+        while len(main.particles) < count:
+            main.spawn_particles(random.choice(("fire", "leaf", "water", "physical")),
+                                 (random.randint(100, 700), random.randint(80, 320)))
+    return tick
+
+
+def mode_screen():
+    main.reset_game()
+
+
+def select_screen():
+    main.reset_game()
+    main.mode_select = False
+    main.pokemon_select = True
+
+
+SCENARIOS = {
+    "idle_battle": (start_battle, keep_alive),
+    "all_projectiles": (start_battle, projectiles_tick),
+    "particles_1k": (start_battle, particles_tick(1000)),
+    "particles_10k": (start_battle, particles_tick(10000)),
+    "mode_screen": (mode_screen, None),
+    "select_screen": (select_screen, None),
+}
+
+
+def frame(tick):
+    if tick:
+        tick()
+    main.sim_ticks += 1
+    main.draw_frame(1.0)
+    main.present_frame(dirty_scene=main.battle_start and not main.mode_select and not main.pokemon_select)
+
+
+def run_scenario(name, frames, alloc_frames):
+    setup, tick = SCENARIOS[name]
+    random.seed(1)
+    setup()
+    for _ in range(10):
+        frame(tick)
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        frame(tick)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    allocated = 0
+    for _ in range(alloc_frames):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        frame(tick)
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return {"fps": frames / elapsed, "ms_per_frame": elapsed / frames * 1000,
+            "alloc_bytes_per_frame": allocated / alloc_frames}
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        if result["fps"] < base["fps"] * (1 - tolerance):
+            regressions.append(f"{name}: {result['fps']:.0f} fps vs {base['fps']:.0f} in the baseline")
+        # Small absolute slack so near-zero allocations do not flap
+        if result["alloc_bytes_per_frame"] > base["alloc_bytes_per_frame"] * (1 + tolerance) + 4096:
+            regressions.append(f"{name}: {result['alloc_bytes_per_frame']:.0f} B/frame allocated "
+                               f"vs {base['alloc_bytes_per_frame']:.0f} in the baseline")
+    return regressions
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Headless rendering benchmarks.")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--alloc-frames", type=int, default=60)
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--out", help="write the results as JSON")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown / allocation growth")
+    args = parser.parse_args()
+
+    main.init_display()
+    results = {}
+    for name in args.scenarios:
+        results[name] = result = run_scenario(name, args.frames, args.alloc_frames)
+        print(f"{name:<16}{result['fps']:9.0f} fps {result['ms_per_frame']:8.2f} ms/frame "
+              f"{result['alloc_bytes_per_frame'] / 1024:9.1f} KiB allocated/frame")
+
+    report = {"python": platform.python_version(), "pygame": pygame.version.ver,
+              "machine": platform.machine(), "frames": args.frames, "scenarios": results}
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"saved baseline to {args.baseline}")
+        return
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION:", regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,104 @@
+"""Startup cost against roster size.
+
+Generates synthetic rosters of increasing size, compiles each with roster.py
+and imports main.py in a fresh process with POKEMON_ROSTER pointing at it.
+Reports the import time, the memory allocated by the import (tracemalloc,
+in a separate run so tracing does not skew the timing), the time to draw
+the selection screen on a page in the middle of the roster, and, for
+comparison, what decoding every species up front would cost:
+
+    python benchmarks/bench_roster.py --sizes 3 100 500
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import roster  # noqa: E402
+
+PROBE = r"""
+import json, os, sys, time, tracemalloc
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, sys.argv[1])
+import pygame
+if sys.argv[2] == "memory":
+    tracemalloc.start()
+    import main
+    print(json.dumps({"import_bytes": tracemalloc.get_traced_memory()[0]}))
+    sys.exit()
+start = time.perf_counter()
+import main
+imported = time.perf_counter() - start
+main.init_display()
+main.reset_game()
+main.mode_select = False
+main.pokemon_select = True
+main.player_choices = [len(main.player_choice_names) // 2, 0]
+start = time.perf_counter()
+main.draw_frame()
+select = time.perf_counter() - start
+start = time.perf_counter()
+stats = dict(main.battle.POKEMON_STATS)
+decode_all = time.perf_counter() - start
+print(json.dumps({"import_s": imported, "select_s": select, "decode_all_s": decode_all, "species": len(stats)}))
+"""
+
+
+def synthetic_sources(count, directory):
+    """Write a roster of count species, two moves of their own plus Tackle each."""
+    with open(roster.MOVES_SOURCE) as f:
+        moves = json.load(f)
+    art = ["art/cyn.png", "art/chi.png", "art/toto.png"]
+    types = ["fire", "leaf", "water"]
+    species = []
+    for i in range(count):
+        own = [f"move_{i}_a", f"move_{i}_b"]
+        for j, key in enumerate(own):
+            moves[key] = {"name": f"Move {i}{'ab'[j]}", "type": types[i % 3],
+                          "damage_range": [8 + j * 7, 18 + j * 5]}
+        species.append({"name": f"Species{i:04d}", "max_hp": 50 + i % 30, "moves": own + ["tackle"],
+                        "sprite": art[i % 3], "color": [(i * 37) % 256, (i * 91) % 256, (i * 53) % 256]})
+    paths = (os.path.join(directory, "species.json"), os.path.join(directory, "moves.json"))
+    for path, data in zip(paths, (species, moves)):
+        with open(path, "w") as f:
+            json.dump(data, f)
+    return paths
+
+
+def probe(roster_path, mode):
+    env = dict(os.environ, POKEMON_ROSTER=roster_path)
+    out = subprocess.run([sys.executable, "-c", PROBE, ROOT, mode], env=env, capture_output=True, text=True,
+                         check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Startup time and memory against roster size.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3, 100, 500])
+    parser.add_argument("--repeat", type=int, default=3, help="timing runs per size; the best is kept")
+    args = parser.parse_args()
+
+    print(f"{'species':>8} {'roster.bin':>11} {'import main':>12} {'import alloc':>13} "
+          f"{'select page':>12} {'decode all':>11}")
+    with tempfile.TemporaryDirectory() as directory:
+        for count in args.sizes:
+            sources = synthetic_sources(count, directory)
+            path = os.path.join(directory, f"roster-{count}.bin")
+            size = roster.build(path, sources)
+            runs = [probe(path, "time") for _ in range(args.repeat)]
+            timing = {key: min(run[key] for run in runs) for key in ("import_s", "select_s", "decode_all_s")}
+            memory = probe(path, "memory")
+            print(f"{count:>8} {size / 1024:>9.1f}KB {timing['import_s'] * 1000:>10.1f}ms "
+                  f"{memory['import_bytes'] / 1024:>11.0f}KB {timing['select_s'] * 1000:>10.2f}ms "
+                  f"{timing['decode_all_s'] * 1000:>9.2f}ms")
+
+
+if __name__ == "__main__":
+    run()
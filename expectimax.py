@@ -0,0 +1,139 @@
+"""Depth-limited expectimax search for the "Hard" AI.
+
+Max/min nodes pick an action for the side to move, chance nodes average
+over every damage value in the move's uniform damage_range. Values are
+always from side 0's point of view (+1 means side 0 wins), so one
+transposition table keyed by (hp0, hp1, potions0, potions1, turn) serves
+both sides and is kept between turns of the same matchup. Iterative
+deepening stops at the time budget and returns the best move of the last
+completed depth.
+"""
+import time
+
+import battle
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class ExpectimaxAI:
+    def __init__(self, time_budget=0.012, max_depth=20):
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        self.tables = {}      # (name0, name1) -> {state: (depth, value)}
+        self.last_depth = 0
+        self.nodes = 0
+
+    def choose(self, state, idx=None):
+        """Best action for idx (default: the side to move) within the time budget."""
+        if idx is None:
+            idx = state.turn
+        self.setup(state.names)
+        deadline = time.perf_counter() + self.time_budget
+        hp0, hp1 = state.hp
+        pot0, pot1 = state.potions
+        self.nodes = 0
+
+        # Depth 1 always completes so there is an answer however small the budget
+        best = self.best_action(hp0, hp1, pot0, pot1, idx, 1, None)
+        self.last_depth = 1
+        for depth in range(2, self.max_depth + 1):
+            try:
+                best = self.best_action(hp0, hp1, pot0, pot1, idx, depth, deadline)
+            except SearchTimeout:
+                break
+            self.last_depth = depth
+        return best
+
+    def setup(self, names):
+        self.max_hp = tuple(battle.POKEMON_STATS[name]["max_hp"] for name in names)
+        self.moves = []
+        for name in names:
+            attacks = battle.POKEMON_STATS[name]["attacks"]
+            self.moves.append([(key,) + tuple(attacks[key]["damage_range"]) for key in battle.move_order(name)])
+        self.table = self.tables.setdefault(tuple(names), {})
+
+    def best_action(self, hp0, hp1, pot0, pot1, side, depth, deadline):
+        self.deadline = deadline
+        values = self.action_values(hp0, hp1, pot0, pot1, side, depth)
+        pick = max if side == 0 else min
+        return pick(values, key=values.get)
+
+    def action_values(self, hp0, hp1, pot0, pot1, side, depth):
+        values = {}
+        for key, low, high in self.moves[side]:
+            values[key] = self.attack_value(hp0, hp1, pot0, pot1, side, low, high, depth)
+        hp = hp0 if side == 0 else hp1
+        potions = pot0 if side == 0 else pot1
+        if potions > 0 and hp < self.max_hp[side]:
+            healed = min(hp + battle.POTION_HEAL, self.max_hp[side])
+            if side == 0:
+                values["potion"] = self.value(healed, hp1, pot0 - 1, pot1, 1, depth - 1)
+            else:
+                values["potion"] = self.value(hp0, healed, pot0, pot1 - 1, 0, depth - 1)
+        return values
+
+    def attack_value(self, hp0, hp1, pot0, pot1, side, low, high, depth):
+        # Chance node: every damage roll in [low, high] is equally likely
+        target_hp = hp1 if side == 0 else hp0
+        win = 1.0 if side == 0 else -1.0
+        total = 0.0
+        for damage in range(low, high + 1):
+            left = target_hp - damage
+            if left <= 0:
+                # Every bigger roll is also a knockout
+                total += win * (high - damage + 1)
+                break
+            if side == 0:
+                total += self.value(hp0, left, pot0, pot1, 1, depth - 1)
+            else:
+                total += self.value(left, hp1, pot0, pot1, 0, depth - 1)
+        return total / (high - low + 1)
+
+    def value(self, hp0, hp1, pot0, pot1, turn, depth):
+        key = (hp0, hp1, pot0, pot1, turn)
+        entry = self.table.get(key)
+        if entry is not None and entry[0] >= depth:
+            return entry[1]
+        if depth <= 0:
+            return self.evaluate(hp0, hp1, pot0, pot1)
+
+        self.nodes += 1
+        # Each node expands ~30 leaves, so the clock is read every 32 nodes to keep within the budget
+        if self.deadline is not None and not self.nodes & 31 and time.perf_counter() > self.deadline:
+            raise SearchTimeout
+        values = self.action_values(hp0, hp1, pot0, pot1, turn, depth).values()
+        result = max(values) if turn == 0 else min(values)
+        self.table[key] = (depth, result)
+        return result
+
+    def evaluate(self, hp0, hp1, pot0, pot1):
+        # HP share plus a little for each potion in hand, squashed into (-1, 1)
+        heal0 = battle.POTION_HEAL * pot0 / self.max_hp[0]
+        heal1 = battle.POTION_HEAL * pot1 / self.max_hp[1]
+        score = (hp0 / self.max_hp[0] + 0.5 * heal0) - (hp1 / self.max_hp[1] + 0.5 * heal1)
+        return max(-0.99, min(0.99, score / 2))
+
+
+default_ai = ExpectimaxAI()
+
+
+def expectimax_action(state, idx, rng=None):
+    return default_ai.choose(state, idx)
+
+
+if __name__ == "__main__":
+    import random
+
+    rng = random.Random(1)
+    names = list(battle.POKEMON_STATS.keys())
+    wins = games = 0
+    for name1 in names:
+        for name2 in names:
+            for _ in range(20):
+                # Expectimax plays side 1 against the normal AI
+                result = battle.simulate_battle(name1, name2, ("ai", expectimax_action), rng)
+                wins += result.winner == 1
+                games += 1
+    print(f"expectimax as P2 won {wins}/{games} ({wins / games:.0%}), last search depth {default_ai.last_depth}")
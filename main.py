@@ -1,17 +1,35 @@
+import argparse
 import asyncio
+import copy
 import pygame
 import sys
 import random
 import math
 import os
-
-pygame.init()
-pygame.mixer.init()
+import time
+import zlib
+from collections import OrderedDict
+
+import assets
+import atlas
+import battle
+import events
+import expectimax
+import mcts
+import netplay
+import perfect
+import replay
+import roster
+import spectate
+from particle_pool import ParticlePool
+from profiler import Profiler
+
+# Importing this module has no side effects: pygame, the window and the fonts
+# are set up by init_display(), which main() calls first.
 
 # --- Window ---
 WIDTH, HEIGHT = 800, 400
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Cyndaquil vs Chikorita vs Totodile")
+screen = None
 
 # --- Colors ---
 WHITE = (255, 255, 255)
@@ -35,10 +53,73 @@ TYPE_COLORS = {
     "physical": GRAY,
 }
 
-# --- Fonts ---
-font = pygame.font.Font(None, 36)
-big_font = pygame.font.Font(None, 64)
-button_font = pygame.font.Font(None, 28)
+# --- Fonts (created by init_display) ---
+font = None
+big_font = None
+button_font = None
+profile_font = None
+
+def init_display():
+    """Initialise pygame, open the window and create the fonts; safe to call twice."""
+    global screen, font, big_font, button_font, profile_font
+    if screen is not None:
+        return screen
+    pygame.init()
+    pygame.mixer.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Cyndaquil vs Chikorita vs Totodile")
+    font = pygame.font.Font(None, 36)
+    big_font = pygame.font.Font(None, 64)
+    button_font = pygame.font.Font(None, 28)
+    profile_font = pygame.font.Font(None, 20)
+    return screen
+
+# --- Profiler ---
+# F3 (or POKEMON_PROFILE=1) times each phase of the main loop and shows p50/p99
+# per phase; F4 writes the recorded spans as a Chrome trace (POKEMON_TRACE_FILE).
+profiler = Profiler(enabled=os.environ.get("POKEMON_PROFILE", "0") == "1")
+PROFILE_KEY = pygame.K_F3
+TRACE_KEY = pygame.K_F4
+TRACE_FILE = os.environ.get("POKEMON_TRACE_FILE", "frame_trace.json")
+profile_overlay = {"lines": [], "frame": 0}
+
+def export_trace():
+    count = profiler.export_trace(TRACE_FILE)
+    print(f"wrote {count} trace events to {TRACE_FILE}")
+
+def draw_profile_overlay():
+    if not profiler.enabled:
+        return
+    # Refresh the numbers twice a second so the text cache is not flooded
+    profile_overlay["frame"] += 1
+    if profile_overlay["frame"] % 30 == 1:
+        profile_overlay["lines"] = [(name, f"p50 {p50:.2f}  p99 {p99:.2f} ms")
+                                    for name, p50, p99 in profiler.summary()[:6]]
+    for i, (name, timings) in enumerate(profile_overlay["lines"]):
+        draw_text(name, (8, 8 + i * 16), profile_font)
+        draw_text(timings, (140, 8 + i * 16), profile_font)
+
+# --- Text cache ---
+# Most labels (HP, potions, turn banner, buttons) change rarely, so rendered
+# text surfaces are kept in a small LRU instead of calling font.render every frame.
+TEXT_CACHE_SIZE = 256
+text_cache = OrderedDict()
+text_cache_stats = {"hits": 0, "misses": 0}
+
+def render_text(font_obj, text, color, antialias=True):
+    with profiler.phase("text"):
+        key = (font_obj, text, color, antialias)
+        surface = text_cache.get(key)
+        if surface is not None:
+            text_cache.move_to_end(key)
+            text_cache_stats["hits"] += 1
+            return surface
+        text_cache_stats["misses"] += 1
+        surface = font_obj.render(text, antialias, color)
+        text_cache[key] = surface
+        if len(text_cache) > TEXT_CACHE_SIZE:
+            text_cache.popitem(last=False)
+        return surface
 
 PLAYER_KEYBINDS = [
     {"moves": [pygame.K_SPACE, pygame.K_t, pygame.K_y], "potion": pygame.K_p},
@@ -46,21 +127,39 @@ PLAYER_KEYBINDS = [
 ]
 
 # --- Sounds ---
+# Sounds and sprites are assets.Asset handles: nothing is read from disk until
+# get() or the preloader in main() gets to them.
 def load_sound(name):
     path = os.path.join(os.path.dirname(__file__), name)
     if os.path.exists(path):
         return pygame.mixer.Sound(path)
     return None
 
-fire_sound = load_sound("fire.wav")
-leaf_sound = load_sound("leaf.wav")
-water_sound = load_sound("water.wav")
-tackle_sound = load_sound("tackle.wav")
-victory_sound = load_sound("victory.wav")
-potion_sound = load_sound("potion.wav")
+fire_sound = assets.Asset(load_sound, "fire.wav")
+leaf_sound = assets.Asset(load_sound, "leaf.wav")
+water_sound = assets.Asset(load_sound, "water.wav")
+tackle_sound = assets.Asset(load_sound, "tackle.wav")
+victory_sound = assets.Asset(load_sound, "victory.wav")
+potion_sound = assets.Asset(load_sound, "potion.wav")
 
 # --- Load sprites ---
+# Pre-scaled sprites come from the atlas built by atlas.py; the source art is
+# only decoded when the atlas is missing or lacks the sprite. Loading the atlas
+# reads its index; each page is decoded when one of its sprites is first drawn
+sprite_atlas = assets.Asset(atlas.SpriteAtlas.load)
+
 def load_sprite(path, size=(100,100)):
+    # convert_alpha needs the window; raising here keeps callers from caching a placeholder
+    if pygame.display.get_surface() is None:
+        raise pygame.error("load_sprite() called before init_display()")
+    sheet = sprite_atlas.get()
+    if sheet:
+        try:
+            sprite = sheet.sprite(path, size)
+        except (OSError, pygame.error):
+            sprite = None   # page missing or unreadable; fall back to the source art
+        if sprite:
+            return sprite
     try:
         img = pygame.image.load(path).convert_alpha()
         return pygame.transform.scale(img, size)
@@ -70,57 +169,30 @@ def load_sprite(path, size=(100,100)):
         surf.fill((random.randint(50,200),random.randint(50,200),random.randint(50,200),255))
         return surf
 
-# Pokémon data with stats, sprites, and attacks
-pokemon_data = {
-    "Cyndaquil": {
-        "sprite": load_sprite("data/cyn.png"),
-        "hp": 60,
-        "max_hp": 60,
-        "color": RED,
-        "attacks": {
-            "ember": {"name": "Ember", "type": "fire", "damage_range": (8, 18), "sound": fire_sound},
-            "flamethrower": {"name": "Flamethrower", "type": "fire", "damage_range": (15, 23), "sound": fire_sound},
-            "tackle": {"name": "Tackle", "type": "physical", "damage_range": (5, 12), "sound": tackle_sound}
-        },
-        "button_order": ["ember", "flamethrower", "tackle"]
-    },
-    "Chikorita": {
-        "sprite": load_sprite("data/chi.png"),
-        "hp": 60,
-        "max_hp": 60,
-        "color": GREEN,
-        "attacks": {
-            "razor_leaf": {"name": "Razor Leaf", "type": "leaf", "damage_range": (10, 20), "sound": leaf_sound},
-            "vine_whip": {"name": "Vine Whip", "type": "leaf", "damage_range": (15, 23), "sound": leaf_sound},
-            "tackle": {"name": "Tackle", "type": "physical", "damage_range": (5, 12), "sound": tackle_sound}
-        },
-        "button_order": ["razor_leaf", "vine_whip", "tackle"]
-    },
-    "Totodile": {
-        "sprite": load_sprite("data/toto.png"),
-        "hp": 70,
-        "max_hp": 70,
-        "color": BLUE,
-        "attacks": {
-            "water_gun": {"name": "Water Gun", "type": "water", "damage_range": (8, 18), "sound": water_sound},
-            "aqua_tail": {"name": "Aqua Tail", "type": "water", "damage_range": (15, 23), "sound": water_sound},
-            "tackle": {"name": "Tackle", "type": "physical", "damage_range": (5, 12), "sound": tackle_sound}
-        },
-        "button_order": ["water_gun", "aqua_tail", "tackle"]
-    }
+ATTACK_SOUNDS = {
+    "fire": fire_sound,
+    "leaf": leaf_sound,
+    "water": water_sound,
+    "physical": tackle_sound,
 }
 
-# --- Positions ---
-cyndaquil_base = [200, 250]
-chikorita_base = [600, 150]
-totodile_base = [600, 250]
+# Pokémon data with stats, sprites, and attacks; stats come from battle.POKEMON_STATS
+# and sprite paths and colors from the roster file
+def load_pokemon_data(name):
+    stats = battle.POKEMON_STATS[name]
+    visuals = battle.ROSTER.visuals(name)
+    return {
+        "sprite": assets.Asset(load_sprite, visuals["sprite"]),
+        "hp": stats["hp"],
+        "max_hp": stats["max_hp"],
+        "color": visuals["color"],
+        "attacks": {key: dict(attack, sound=ATTACK_SOUNDS.get(attack["type"]))
+                    for key, attack in stats["attacks"].items()},
+        "button_order": stats["button_order"],
+    }
 
-# Base positions for each pokemon (for convenience)
-pokemon_positions = {
-    "Cyndaquil": cyndaquil_base,
-    "Chikorita": chikorita_base,
-    "Totodile": totodile_base,
-}
+# Built per species on first use, so startup does not grow with the roster
+pokemon_data = roster.LazyTable(battle.ROSTER, load_pokemon_data)
 
 # --- Button Class for Touch Input ---
 class Button:
@@ -131,15 +203,17 @@ class Button:
         self.text_color = text_color
         self.hover = False
     
-    def draw(self, surface, font_obj=font):
+    def draw(self, surface, font_obj=None):
         # Draw button with border
         color = tuple(min(c + 30, 255) for c in self.color) if self.hover else self.color
         pygame.draw.rect(surface, color, self.rect)
         pygame.draw.rect(surface, BLACK, self.rect, 3)
         # Draw text centered
-        text_surface = font_obj.render(self.text, True, self.text_color)
+        text_surface = render_text(font_obj or font, self.text, self.text_color)
         text_rect = text_surface.get_rect(center=self.rect.center)
         surface.blit(text_surface, text_rect)
+        # Long move names can spill past the button edges
+        return self.rect.union(text_rect)
     
     def is_clicked(self, pos):
         return self.rect.collidepoint(pos)
@@ -150,18 +224,32 @@ class Button:
 # --- Game variables ---
 mode_select = True   # True when selecting mode (1P or 2P)
 mode_options = ["1 Player (vs AI)", "2 Player (Local)"]
+ONLINE_MODE = len(mode_options)
+if netplay.AVAILABLE:
+    mode_options.append("2 Player (Online)")
 mode_selected = 0
+difficulty_options = ["Normal", "Hard", "MCTS", "Perfect"]
+difficulty_selected = 0
 
 pokemon_select = False
-# Each player selects one from the three pokemon
+# Each player selects one species from the roster, shown a page at a time
 player_choices = [0, 0]  # indices into list below
-player_choice_names = list(pokemon_data.keys())
+player_choice_names = battle.ROSTER.names
+SELECT_PAGE_SIZE = 3
+select_pages_preloaded = {0}
+
+# Warm the selection screen's sprites first, then the sounds, a slice per frame
+preloader = assets.Preloader()
+preloader.add(*(pokemon_data[name]["sprite"] for name in player_choice_names[:SELECT_PAGE_SIZE]))
+preloader.add(fire_sound, leaf_sound, water_sound, tackle_sound, victory_sound, potion_sound)
 player_selecting = 0     # 0 or 1 indicating which player selecting
 battle_start = False
 
 # --- UI Buttons ---
 mode_buttons = []
+difficulty_button = None
 pokemon_selection_rects = []
+select_page_buttons = []
 battle_buttons_p1 = []
 battle_buttons_p2 = []
 restart_button = None
@@ -169,11 +257,12 @@ restart_button = None
 player_move_keys = [[None, None, None], [None, None, None]]
 
 def create_mode_buttons():
-    global mode_buttons
+    global mode_buttons, difficulty_button
     mode_buttons = []
     for i, option in enumerate(mode_options):
-        btn = Button(WIDTH // 2 - 150, 150 + i * 70, 300, 50, option, GRAY, BLACK)
+        btn = Button(WIDTH // 2 - 150, 130 + i * 60, 300, 50, option, GRAY, BLACK)
         mode_buttons.append(btn)
+    difficulty_button = Button(WIDTH // 2 - 150, 130 + len(mode_options) * 60, 300, 40, "", WHITE, BLACK)
 
 def create_battle_buttons():
     global battle_buttons_p1, battle_buttons_p2, player_move_keys
@@ -200,10 +289,12 @@ def create_restart_button():
 
 
 def choose_ai_pokemon(exclude_index=None):
-    options = [i for i in range(len(player_choice_names)) if i != exclude_index]
-    if not options:
+    # Same draw as choosing from every index but exclude_index, without building that list
+    count = len(player_choice_names) - (exclude_index is not None)
+    if count <= 0:
         return 0
-    return random.choice(options)
+    index = ai_rng.randrange(count)
+    return index + 1 if exclude_index is not None and index >= exclude_index else index
 
 
 def configure_move_buttons():
@@ -265,16 +356,16 @@ message_timer = 0
 damage_popup = None
 animation_timer = 0
 attacking = False
-action_lockout = 0  # Timer to prevent actions during animations (in frames)
+action_lockout = 0  # Timer to prevent actions during animations (in sim ticks)
 
-# Potion usage: 3 each
-potion_counts = [3,3]
+# Rules state (HP, potions, turn) shared with the headless engine in battle.py
+battle_state = None
 
 # Positions in battle for chosen pokemon
 battle_positions = [[200, 250], [600, 150]]
 
 # Particles and projectiles
-particles = []
+particles = ParticlePool()
 projectiles = []
 
 # --- PARTICLES & PROJECTILES ---
@@ -301,31 +392,174 @@ def spawn_particles(p_type, target_pos):
             radius = random.randint(2, 4)
             dx = random.uniform(-2, 2)
             dy = random.uniform(-1, 0)
-        particles.append({"x": target_pos[0] + random.randint(-20, 20),
-                          "y": target_pos[1] + random.randint(-10, 10),
-                          "dx": dx, "dy": dy, "radius": radius, "color": color,
-                          "life": random.randint(25, 45)})
+        particles.add(target_pos[0] + random.randint(-20, 20),
+                      target_pos[1] + random.randint(-10, 10),
+                      dx, dy, random.randint(25, 45), color, radius)
 
 def update_particles():
-    for p in particles[:]:
-        p["x"] += p["dx"]
-        p["y"] += p["dy"]
-        p["life"] -= 1
-        if p["life"] <= 0:
-            particles.remove(p)
-
-def draw_particles():
-    for p in particles:
-        pygame.draw.circle(screen, p["color"], (int(p["x"]), int(p["y"])), p["radius"])
+    particles.update()
 
-def spawn_projectile(p_type, start_pos, target_pos, attacker_idx, attack_key):
-    attacker = players[attacker_idx]
-    attacker_name = attacker.get("name", "")
-    start_vec = pygame.math.Vector2(start_pos[0], start_pos[1])
-    target_vec = pygame.math.Vector2(target_pos[0], target_pos[1])
+def draw_particles(alpha=1.0):
+    mark_dirty(particles.draw(screen, alpha))
 
-    if attack_key == "flamethrower":
-        if attacker_name == "Cyndaquil":
+def resolve_hit(attacker_idx, attack, impact_pos, particle_type=None, move=None):
+    global game_over, winner, damage_popup
+    if spectating:
+        # HP and the popup arrive with the spectator feed; only the effects are local
+        if particle_type:
+            spawn_particles(particle_type, impact_pos)
+        return
+    # Damage the defender (opposite of attacker)
+    if attack and "damage_range" in attack:
+        damage = battle.roll_damage(attack, damage_rng)
+    else:
+        damage = 12
+    knocked_out = battle_state.deal_damage(attacker_idx, damage)
+    if recording is not None:
+        recording.note(battle_ticks, battle_state)
+    log_event("hit", attacker_idx, move, damage)
+    muted = effects_muted(attacker_idx)
+    if knocked_out:
+        log_event("ko", attacker_idx)
+        game_over = True
+        winner = players[attacker_idx]["name"]
+        if not muted:
+            play_sound(victory_sound)
+        if net is None:
+            # Online battles are saved on reset, once a rollback can no longer change them
+            save_recording()
+    if particle_type and not muted:
+        spawn_particles(particle_type, impact_pos)
+    damage_popup = (f"-{damage}", impact_pos[0], impact_pos[1] - 50, 60)
+    update_win_odds()
+
+# Each projectile kind is a small class: update() advances one sim tick and returns
+# False once it is finished, draw() renders it (alpha is how far we are between
+# the previous tick and this one) and impact() applies the hit.
+class Projectile:
+    __slots__ = ("attacker_idx", "attack_key", "attack")
+
+    def __init__(self, attacker_idx, attack_key):
+        self.attacker_idx = attacker_idx
+        self.attack_key = attack_key
+        self.attack = players[attacker_idx]["attacks"].get(attack_key)
+
+    def impact(self, impact_pos, particle_type=None):
+        resolve_hit(self.attacker_idx, self.attack, impact_pos, particle_type, self.attack_key)
+
+    def update(self):
+        return False
+
+    def draw(self, surface, alpha=1.0):
+        pass
+
+
+def interpolated_progress(p, alpha):
+    # Lingering projectiles hold at 1.0, moving ones are drawn part-way into the last tick
+    if p.progress >= 1.0:
+        return p.progress
+    return max(0.0, p.progress - p.speed * (1 - alpha))
+
+
+class Shot(Projectile):
+    """Straight ball for Ember and Water Gun."""
+    __slots__ = ("x", "y", "dx", "dy", "target")
+    color = ORANGE
+    particle_type = "fire"
+
+    def __init__(self, start_pos, target_pos, attacker_idx, attack_key):
+        super().__init__(attacker_idx, attack_key)
+        self.x, self.y = start_pos[0], start_pos[1]
+        self.dx = (target_pos[0] - start_pos[0]) / 30
+        self.dy = (target_pos[1] - start_pos[1]) / 30
+        self.target = target_pos
+
+    def update(self):
+        self.x += self.dx
+        self.y += self.dy
+        if abs(self.x - self.target[0]) < 10 and abs(self.y - self.target[1]) < 10:
+            self.impact(self.target, self.particle_type)
+            return False
+        return True
+
+    def draw(self, surface, alpha=1.0):
+        back = 1 - alpha
+        mark_dirty(pygame.draw.circle(surface, self.color, (int(self.x - self.dx * back), int(self.y - self.dy * back)), 8))
+
+
+class FireShot(Shot):
+    __slots__ = ()
+
+
+class WaterShot(Shot):
+    __slots__ = ()
+    color = SKY_BLUE
+    particle_type = "water"
+
+
+class LeafBoomerang(Projectile):
+    __slots__ = ("x", "y", "prev_x", "prev_y", "center", "angle", "distance", "target_idx")
+
+    def __init__(self, start_pos, target_pos, attacker_idx, attack_key):
+        super().__init__(attacker_idx, attack_key)
+        self.x, self.y = start_pos[0], start_pos[1]
+        self.prev_x, self.prev_y = self.x, self.y
+        self.center = target_pos
+        self.angle = 0
+        self.distance = 0
+        self.target_idx = 1 - attacker_idx
+
+    def update(self):
+        self.prev_x, self.prev_y = self.x, self.y
+        self.angle += 0.2
+        self.distance += 1
+        swing = 100 * math.sin(self.distance / 30)
+        self.x = self.center[0] + swing * math.cos(self.angle)
+        self.y = self.center[1] + swing * math.sin(self.angle)
+        if self.distance > 60:
+            self.impact(battle_positions[self.target_idx], "leaf")
+            return False
+        return True
+
+    def draw(self, surface, alpha=1.0):
+        x = self.prev_x + (self.x - self.prev_x) * alpha
+        y = self.prev_y + (self.y - self.prev_y) * alpha
+        mark_dirty(pygame.draw.circle(surface, LEAF_GREEN, (int(x), int(y)), 8))
+
+
+class Tackle(Projectile):
+    """Instant hit on the first frame, then a red circle for a few frames."""
+    __slots__ = ("target", "timer", "damage_dealt")
+
+    def __init__(self, start_pos, target_pos, attacker_idx, attack_key):
+        super().__init__(attacker_idx, attack_key)
+        self.target = target_pos
+        self.timer = 20
+        self.damage_dealt = False
+
+    def update(self):
+        if not self.damage_dealt:
+            self.impact(self.target)
+            self.damage_dealt = True
+        self.timer -= 1
+        return self.timer > 0
+
+    def draw(self, surface, alpha=1.0):
+        mark_dirty(pygame.draw.circle(surface, RED, (int(self.target[0]), int(self.target[1])), 50))
+
+
+class FireStream(Projectile):
+    """Flamethrower: a widening stream of flame blobs that lingers after the hit."""
+    __slots__ = ("start", "target", "direction", "length", "progress", "noise", "linger")
+    speed = 0.12
+    max_linger = 12
+    step_count = 12
+
+    def __init__(self, start_pos, target_pos, attacker_idx, attack_key):
+        super().__init__(attacker_idx, attack_key)
+        start_vec = pygame.math.Vector2(start_pos[0], start_pos[1])
+        target_vec = pygame.math.Vector2(target_pos[0], target_pos[1])
+        if players[attacker_idx].get("name") == "Cyndaquil":
             start_vec += pygame.math.Vector2(40, -30)
         direction = target_vec - start_vec
         length = direction.length()
@@ -334,24 +568,52 @@ def spawn_projectile(p_type, start_pos, target_pos, attacker_idx, attack_key):
             length = 1
         else:
             direction = direction.normalize()
-        projectiles.append({
-            "type": "fire_stream",
-            "start": start_vec,
-            "target": target_vec,
-            "direction": direction,
-            "length": length,
-            "progress": 0.0,
-            "speed": 0.12,
-            "attacker_idx": attacker_idx,
-            "attack_key": attack_key,
-            "noise": [random.uniform(0, math.pi * 2) for _ in range(12)],
-            "linger": 0,
-            "max_linger": 12,
-        })
-        return
-
-    if attack_key == "vine_whip":
-        if attacker_name == "Chikorita":
+        self.start = start_vec
+        self.target = target_vec
+        self.direction = direction
+        self.length = length
+        self.progress = 0.0
+        self.noise = [random.uniform(0, math.pi * 2) for _ in range(self.step_count)]
+        self.linger = 0
+
+    def update(self):
+        self.progress = min(1.0, self.progress + self.speed)
+        if self.progress >= 1.0:
+            if self.linger == 0:
+                self.impact(self.target, "fire")
+            self.linger += 1
+            return self.linger < self.max_linger
+        return True
+
+    def draw(self, surface, alpha=1.0):
+        progress = interpolated_progress(self, alpha)
+        start = self.start
+        direction = self.direction
+        side = pygame.math.Vector2(direction.y, -direction.x)
+        step_count = self.step_count
+        for i in range(step_count):
+            t = (i / (step_count - 1)) * progress
+            eased_t = t * t
+            point = start + direction * (self.length * eased_t)
+            offset = side * math.sin(self.noise[i] + progress * 3) * 10 * (1 - eased_t)
+            radius = int(20 * (1 - eased_t) + 4)
+            color = (255, int(140 + 60 * (1 - eased_t)), 50)
+            mark_dirty(pygame.draw.circle(surface, color, (int(point.x + offset.x), int(point.y + offset.y)), radius))
+
+
+class VineWhip(Projectile):
+    """Vine that grows out of the attacker, then sweeps down through the target."""
+    __slots__ = ("base_path", "tip_path", "progress", "impact_timer", "base_static")
+    speed = 0.12
+    segments = 40
+    growth_portion = 0.4
+
+    def __init__(self, start_pos, target_pos, attacker_idx, attack_key):
+        super().__init__(attacker_idx, attack_key)
+        attacker = players[attacker_idx]
+        start_vec = pygame.math.Vector2(start_pos[0], start_pos[1])
+        target_vec = pygame.math.Vector2(target_pos[0], target_pos[1])
+        if attacker.get("name") == "Chikorita":
             sprite = attacker.get("sprite")
             if sprite:
                 start_vec += pygame.math.Vector2(-sprite.get_width() * 0.08, sprite.get_height() * 0.1)
@@ -364,8 +626,8 @@ def spawn_projectile(p_type, start_pos, target_pos, attacker_idx, attack_key):
         else:
             direction = direction.normalize()
 
-        segments = 40
-        growth_portion = 0.4
+        segments = self.segments
+        growth_portion = self.growth_portion
         base_static_idx = int(growth_portion * (segments - 1))
 
         core_path = []
@@ -395,21 +657,56 @@ def spawn_projectile(p_type, start_pos, target_pos, attacker_idx, attack_key):
         for i in range(min(base_static_idx + 1, len(sweep_path))):
             sweep_path[i] = core_path[i]
 
-        projectiles.append({
-            "type": "vine_whip",
-            "base_path": core_path,
-            "tip_path": sweep_path,
-            "progress": 0.0,
-            "speed": 0.12,
-            "attacker_idx": attacker_idx,
-            "attack_key": attack_key,
-            "impact_timer": 0,
-            "base_static": base_static_idx,
-        })
-        return
-
-    if attack_key == "aqua_tail":
-        if attacker_name == "Totodile":
+        self.base_path = core_path
+        self.tip_path = sweep_path
+        self.progress = 0.0
+        self.impact_timer = 0
+        self.base_static = base_static_idx
+
+    def update(self):
+        self.progress = min(1.0, self.progress + self.speed)
+        if self.progress >= 1.0:
+            if self.impact_timer == 0:
+                self.impact(self.tip_path[-1], "leaf")
+            self.impact_timer += 1
+            return self.impact_timer <= 8
+        return True
+
+    def draw(self, surface, alpha=1.0):
+        base_path = self.base_path
+        tip_path = self.tip_path
+        reveal = int(interpolated_progress(self, alpha) * (len(tip_path) - 1))
+
+        for i in range(1, reveal + 1):
+            base_a = base_path[min(i - 1, len(base_path) - 1)]
+            base_b = base_path[min(i, len(base_path) - 1)]
+            tip_a = tip_path[i - 1]
+            tip_b = tip_path[i]
+
+            width_main = int(30 * (1 - i / len(tip_path)) + 6)
+            mark_dirty(pygame.draw.line(surface, (60, 180, 80), (int(base_a.x), int(base_a.y)), (int(base_b.x), int(base_b.y)), max(5, width_main)))
+
+            sweep_width = int(26 * (1 - i / len(tip_path)) + 4)
+            mark_dirty(pygame.draw.line(surface, (40, 200, 90), (int(tip_a.x), int(tip_a.y)), (int(tip_b.x), int(tip_b.y)), max(4, sweep_width)))
+
+        if reveal >= 0:
+            tip = tip_path[min(reveal, len(tip_path) - 1)]
+            mark_dirty(pygame.draw.circle(surface, (90, 210, 90), (int(tip.x), int(tip.y)), 24))
+
+
+class AquaTail(Projectile):
+    """Arcing tail swipe with a wavy water trail."""
+    __slots__ = ("start", "target", "center", "radius", "progress", "phase", "linger", "sweep_dir", "angle_start")
+    speed = 0.24
+    max_linger = 14
+    sweep_span = math.radians(150)
+    trail_steps = 18
+
+    def __init__(self, start_pos, target_pos, attacker_idx, attack_key):
+        super().__init__(attacker_idx, attack_key)
+        start_vec = pygame.math.Vector2(start_pos[0], start_pos[1])
+        target_vec = pygame.math.Vector2(target_pos[0], target_pos[1])
+        if players[attacker_idx].get("name") == "Totodile":
             start_vec += pygame.math.Vector2(-24, 18)
         direction = target_vec - start_vec
         length = direction.length()
@@ -420,306 +717,192 @@ def spawn_projectile(p_type, start_pos, target_pos, attacker_idx, attack_key):
             direction = direction.normalize()
         axis = pygame.math.Vector2(direction.y, -direction.x)
         axis = axis.normalize() if axis.length() != 0 else pygame.math.Vector2(0, -1)
-        sweep_radius = max(80, length * 0.65)
-        sweep_center = start_vec + axis * sweep_radius * 0.4
-        sweep_span = math.radians(150)
-        sweep_dir = 1 if direction.x >= 0 else -1
-        sweep_center = start_vec + axis * sweep_radius * 0.6
-        sweep_dir = 1 if direction.x >= 0 else -1
-
-        projectiles.append({
-            "type": "aqua_tail",
-            "start": start_vec,
-            "target": target_vec,
-            "center": sweep_center,
-            "radius": sweep_radius,
-            "progress": 0.0,
-            "speed": 0.24,
-            "attacker_idx": attacker_idx,
-            "attack_key": attack_key,
-            "phase": random.uniform(0, math.pi * 2),
-            "linger": 0,
-            "max_linger": 14,
-            "sweep_dir": sweep_dir,
-            "sweep_span": sweep_span,
-            "base_direction": direction,
-        })
-        return
+        self.radius = max(80, length * 0.65)
+        self.center = start_vec + axis * self.radius * 0.6
+        self.sweep_dir = 1 if direction.x >= 0 else -1
+        self.start = start_vec
+        self.target = target_vec
+        self.angle_start = math.atan2(start_vec.y - self.center.y, start_vec.x - self.center.x)
+        self.progress = 0.0
+        self.phase = random.uniform(0, math.pi * 2)
+        self.linger = 0
+
+    def update(self):
+        self.progress = min(1.0, self.progress + self.speed)
+        if self.progress >= 1.0:
+            if self.linger == 0:
+                self.impact(self.target, "water")
+            self.linger += 1
+            return self.linger < self.max_linger
+        return True
+
+    def draw(self, surface, alpha=1.0):
+        progress = interpolated_progress(self, alpha)
+        center = self.center
+        radius = self.radius
+        sweep_dir = self.sweep_dir
+        sweep_span = self.sweep_span
+        angle_start = self.angle_start
+        current_angle = angle_start + sweep_span * (progress ** 1.1) * sweep_dir
+        tail_tip = pygame.math.Vector2(center.x + math.cos(current_angle) * radius,
+                                      center.y + math.sin(current_angle) * radius)
+
+        trail_points = []
+        trail_steps = self.trail_steps
+        for i in range(trail_steps + 1):
+            t = i / trail_steps
+            eased = (progress ** 0.8) * t
+            angle = angle_start + sweep_span * (eased ** 1.1) * sweep_dir
+            point = pygame.math.Vector2(center.x + math.cos(angle) * radius,
+                                        center.y + math.sin(angle) * radius)
+            wave = math.sin(self.phase + eased * 5) * (35 * (1 - eased))
+            offset_dir = pygame.math.Vector2(-math.sin(angle), math.cos(angle)) * wave
+            trail_points.append(point + offset_dir)
+
+        for i in range(1, len(trail_points)):
+            a = trail_points[i - 1]
+            b = trail_points[i]
+            width = int(36 * (1 - i / len(trail_points)) + 10)
+            mark_dirty(pygame.draw.line(surface, (150, 210, 255), (int(a.x), int(a.y)), (int(b.x), int(b.y)), max(6, width)))
+
+        mark_dirty(pygame.draw.circle(surface, (160, 220, 255), (int(tail_tip.x), int(tail_tip.y)), 26))
+        splash = max(24, int(34 * (1 - abs(math.sin(progress * math.pi)))))
+        mark_dirty(pygame.draw.circle(surface, (190, 235, 255), (int(tail_tip.x), int(tail_tip.y)), splash, 5))
+
+
+# Signature moves get their own animation, everything else is picked by type
+MOVE_PROJECTILES = {
+    "flamethrower": FireStream,
+    "vine_whip": VineWhip,
+    "aqua_tail": AquaTail,
+}
 
-    if p_type == "fire":
-        dx = (target_pos[0] - start_pos[0]) / 30
-        dy = (target_pos[1] - start_pos[1]) / 30
-        color = ORANGE
-        projectiles.append({"x": start_pos[0], "y": start_pos[1], "dx": dx, "dy": dy,
-                            "radius": 8, "color": color, "target": target_pos, "type": "fire",
-                            "attacker_idx": attacker_idx, "attack_key": attack_key})
-    elif p_type == "leaf":
-        projectiles.append({"x": start_pos[0], "y": start_pos[1],
-                            "center": target_pos, "angle": 0, "radius": 8, "color": LEAF_GREEN,
-                            "distance": 0, "type": "leaf_boomerang", "start": start_pos,
-                            "attacker_idx": attacker_idx, "attack_key": attack_key})
-    elif p_type == "water":
-        dx = (target_pos[0] - start_pos[0]) / 30
-        dy = (target_pos[1] - start_pos[1]) / 30
-        color = SKY_BLUE
-        projectiles.append({"x": start_pos[0], "y": start_pos[1], "dx": dx, "dy": dy,
-                            "radius": 8, "color": color, "target": target_pos, "type": "water",
-                            "attacker_idx": attacker_idx, "attack_key": attack_key})
-    elif p_type == "physical":
-        # Tackle: instant hit with red circle effect
-        projectiles.append({"x": target_pos[0], "y": target_pos[1],
-                            "radius": 50, "color": RED, "target": target_pos, "type": "physical",
-                            "attacker_idx": attacker_idx, "timer": 20, "attack_key": attack_key})
+TYPE_PROJECTILES = {
+    "fire": FireShot,
+    "leaf": LeafBoomerang,
+    "water": WaterShot,
+    "physical": Tackle,
+}
+
+def spawn_projectile(p_type, start_pos, target_pos, attacker_idx, attack_key):
+    kind = MOVE_PROJECTILES.get(attack_key) or TYPE_PROJECTILES.get(p_type)
+    if kind:
+        projectiles.append(kind(start_pos, target_pos, attacker_idx, attack_key))
 
 def update_projectiles():
-    global game_over, winner, damage_popup
-    for p in projectiles[:]:
-        if p.get("attack_key") and p["attack_key"] not in players[p["attacker_idx"]]["attacks"]:
-            projectiles.remove(p)
-            continue
-        if p["type"] == "fire":
-            p["x"] += p["dx"]
-            p["y"] += p["dy"]
-            if abs(p["x"] - p["target"][0]) < 10 and abs(p["y"] - p["target"][1]) < 10:
-                # Damage the defender (opposite of attacker)
-                attacker_idx = p["attacker_idx"]
-                target_index = 1 - attacker_idx
-                attack_key = p.get("attack_key")
-                damage = random.randint(*players[attacker_idx]["attacks"][attack_key]["damage_range"])
-                players[target_index]["hp"] -= damage
-                if players[target_index]["hp"] <= 0:
-                    players[target_index]["hp"] = 0
-                    game_over = True
-                    winner = players[attacker_idx]["name"]
-                    play_sound(victory_sound)
-                spawn_particles("fire", p["target"])
-                damage_popup = (f"-{damage}", p["target"][0], p["target"][1] - 50, 60)
-                projectiles.remove(p)
-
-        elif p["type"] == "fire_stream":
-            p["progress"] = min(1.0, p["progress"] + p["speed"])
-            if p["progress"] >= 1.0:
-                if p["linger"] == 0:
-                    attacker_idx = p["attacker_idx"]
-                    target_index = 1 - attacker_idx
-                    attack_key = p.get("attack_key")
-                    damage = random.randint(*players[attacker_idx]["attacks"][attack_key]["damage_range"])
-                    players[target_index]["hp"] -= damage
-                    if players[target_index]["hp"] <= 0:
-                        players[target_index]["hp"] = 0
-                        game_over = True
-                        winner = players[attacker_idx]["name"]
-                        play_sound(victory_sound)
-                    spawn_particles("fire", p["target"])
-                    damage_popup = (f"-{damage}", p["target"].x, p["target"].y - 50, 60)
-                p["linger"] += 1
-                if p["linger"] >= p["max_linger"]:
-                    projectiles.remove(p)
-
-        elif p["type"] == "vine_whip":
-            total_length = len(p["tip_path"]) - 1
-            p["progress"] = min(1.0, p["progress"] + p["speed"])
-            if p["progress"] >= 1.0:
-                if p["impact_timer"] == 0:
-                    attacker_idx = p["attacker_idx"]
-                    target_index = 1 - attacker_idx
-                    attack_key = p.get("attack_key")
-                    damage = random.randint(*players[attacker_idx]["attacks"][attack_key]["damage_range"])
-                    players[target_index]["hp"] -= damage
-                    if players[target_index]["hp"] <= 0:
-                        players[target_index]["hp"] = 0
-                        game_over = True
-                        winner = players[attacker_idx]["name"]
-                        play_sound(victory_sound)
-                    spawn_particles("leaf", p["tip_path"][-1])
-                    damage_popup = (f"-{damage}", p["tip_path"][-1].x, p["tip_path"][-1].y - 50, 60)
-                p["impact_timer"] += 1
-                if p["impact_timer"] > 8:
-                    projectiles.remove(p)
-
-        elif p["type"] == "aqua_tail":
-            p["progress"] = min(1.0, p["progress"] + p["speed"])
-            if p["progress"] >= 1.0:
-                if p["linger"] == 0:
-                    attacker_idx = p["attacker_idx"]
-                    target_index = 1 - attacker_idx
-                    attack_key = p.get("attack_key")
-                    damage = random.randint(*players[attacker_idx]["attacks"][attack_key]["damage_range"])
-                    players[target_index]["hp"] -= damage
-                    if players[target_index]["hp"] <= 0:
-                        players[target_index]["hp"] = 0
-                        game_over = True
-                        winner = players[attacker_idx]["name"]
-                        play_sound(victory_sound)
-                    spawn_particles("water", p["target"])
-                    damage_popup = (f"-{damage}", p["target"].x, p["target"].y - 50, 60)
-                p["linger"] += 1
-                if p["linger"] >= p["max_linger"]:
-                    projectiles.remove(p)
-
-        elif p["type"] == "leaf_boomerang":
-            p["angle"] += 0.2
-            p["distance"] += 1
-            x = p["center"][0] + 100 * math.cos(p["angle"]) * math.sin(p["distance"] / 30)
-            y = p["center"][1] + 100 * math.sin(p["angle"]) * math.sin(p["distance"] / 30)
-            p["x"] = x
-            p["y"] = y
-            if p["distance"] > 60:
-                attacker_idx = p["attacker_idx"]
-                target_index = 1 - attacker_idx
-                attack_key = p.get("attack_key")
-                damage = random.randint(*players[attacker_idx]["attacks"][attack_key]["damage_range"])
-                players[target_index]["hp"] -= damage
-                if players[target_index]["hp"] <= 0:
-                    players[target_index]["hp"] = 0
-                    game_over = True
-                    winner = players[attacker_idx]["name"]
-                    play_sound(victory_sound)
-                spawn_particles("leaf", battle_positions[target_index])
-                damage_popup = (f"-{damage}", battle_positions[target_index][0], battle_positions[target_index][1] - 50, 60)
-                projectiles.remove(p)
-
-        elif p["type"] == "water":
-            p["x"] += p["dx"]
-            p["y"] += p["dy"]
-            if abs(p["x"] - p["target"][0]) < 10 and abs(p["y"] - p["target"][1]) < 10:
-                attacker_idx = p["attacker_idx"]
-                target_index = 1 - attacker_idx
-                attack_key = p.get("attack_key")
-                damage = random.randint(*players[attacker_idx]["attacks"][attack_key]["damage_range"])
-                players[target_index]["hp"] -= damage
-                if players[target_index]["hp"] <= 0:
-                    players[target_index]["hp"] = 0
-                    game_over = True
-                    winner = players[attacker_idx]["name"]
-                    play_sound(victory_sound)
-                spawn_particles("water", p["target"])
-                damage_popup = (f"-{damage}", p["target"][0], p["target"][1] - 50, 60)
-                projectiles.remove(p)
-        
-        elif p["type"] == "physical":
-            # Tackle: deal damage immediately on first frame, then show circle animation
-            if "damage_dealt" not in p:
-                attacker_idx = p["attacker_idx"]
-                target_index = 1 - attacker_idx
-                attack_key = p.get("attack_key")
-                attack_data = players[attacker_idx]["attacks"].get(attack_key) if attack_key else None
-                if attack_data and "damage_range" in attack_data:
-                    damage = random.randint(*attack_data["damage_range"])
-                else:
-                    damage = 12
-                players[target_index]["hp"] -= damage
-                if players[target_index]["hp"] <= 0:
-                    players[target_index]["hp"] = 0
-                    game_over = True
-                    winner = players[attacker_idx]["name"]
-                    play_sound(victory_sound)
-                damage_popup = (f"-{damage}", p["target"][0], p["target"][1] - 50, 60)
-                p["damage_dealt"] = True
-            
-            # Count down timer and remove when done
-            p["timer"] -= 1
-            if p["timer"] <= 0:
-                projectiles.remove(p)
-
-def draw_projectiles():
+    # Compact finished projectiles out in place instead of copying the list
+    alive = 0
     for p in projectiles:
-        if p["type"] == "fire_stream":
-            progress = p["progress"]
-            start = p["start"]
-            direction = p["direction"]
-            length = p["length"]
-            step_count = 12
-            for i in range(step_count):
-                t = (i / (step_count - 1)) * progress
-                eased_t = t * t
-                point = start + direction * (length * eased_t)
-                noise_phase = p["noise"][i]
-                offset = pygame.math.Vector2(direction.y, -direction.x) * math.sin(noise_phase + progress * 3) * 10 * (1 - eased_t)
-                radius = int(20 * (1 - eased_t) + 4)
-                color = (255, int(140 + 60 * (1 - eased_t)), 50)
-                pygame.draw.circle(screen, color, (int(point.x + offset.x), int(point.y + offset.y)), radius)
-
-        elif p["type"] == "vine_whip":
-            progress = p["progress"]
-            base_path = p["base_path"]
-            tip_path = p["tip_path"]
-            reveal = int(progress * (len(tip_path) - 1))
-
-            for i in range(1, reveal + 1):
-                base_a = base_path[min(i - 1, len(base_path) - 1)]
-                base_b = base_path[min(i, len(base_path) - 1)]
-                tip_a = tip_path[i - 1]
-                tip_b = tip_path[i]
-
-                width_main = int(30 * (1 - i / len(tip_path)) + 6)
-                pygame.draw.line(screen, (60, 180, 80), (int(base_a.x), int(base_a.y)), (int(base_b.x), int(base_b.y)), max(5, width_main))
-
-                sweep_width = int(26 * (1 - i / len(tip_path)) + 4)
-                pygame.draw.line(screen, (40, 200, 90), (int(tip_a.x), int(tip_a.y)), (int(tip_b.x), int(tip_b.y)), max(4, sweep_width))
-
-            if reveal >= 0:
-                tip = tip_path[min(reveal, len(tip_path) - 1)]
-                pygame.draw.circle(screen, (90, 210, 90), (int(tip.x), int(tip.y)), 24)
-
-        elif p["type"] == "aqua_tail":
-            progress = p["progress"]
-            start = p["start"]
-            center = p["center"]
-            radius = p["radius"]
-            sweep_dir = p["sweep_dir"]
-            sweep_span = p["sweep_span"]
-            angle_start = math.atan2(start.y - center.y, start.x - center.x)
-            angle_offset = sweep_span * (progress ** 1.1)
-            current_angle = angle_start + angle_offset * sweep_dir
-            tail_tip = pygame.math.Vector2(center.x + math.cos(current_angle) * radius,
-                                          center.y + math.sin(current_angle) * radius)
-
-            trail_points = []
-            trail_steps = 18
-            for i in range(trail_steps + 1):
-                t = i / trail_steps
-                eased = (progress ** 0.8) * t
-                angle = angle_start + sweep_span * (eased ** 1.1) * sweep_dir
-                point = pygame.math.Vector2(center.x + math.cos(angle) * radius,
-                                            center.y + math.sin(angle) * radius)
-                wave = math.sin(p["phase"] + eased * 5) * (35 * (1 - eased))
-                offset_dir = pygame.math.Vector2(-math.sin(angle), math.cos(angle)) * wave
-                trail_points.append(point + offset_dir)
-
-            for i in range(1, len(trail_points)):
-                a = trail_points[i - 1]
-                b = trail_points[i]
-                width = int(36 * (1 - i / len(trail_points)) + 10)
-                pygame.draw.line(screen, (150, 210, 255), (int(a.x), int(a.y)), (int(b.x), int(b.y)), max(6, width))
-
-            pygame.draw.circle(screen, (160, 220, 255), (int(tail_tip.x), int(tail_tip.y)), 26)
-            splash = max(24, int(34 * (1 - abs(math.sin(progress * math.pi)))))
-            pygame.draw.circle(screen, (190, 235, 255), (int(tail_tip.x), int(tail_tip.y)), splash, 5)
+        if p.update():
+            projectiles[alive] = p
+            alive += 1
+    del projectiles[alive:]
 
-        else:
-            pygame.draw.circle(screen, p["color"], (int(p.get("x", p.get("start", [0, 0])[0])), int(p.get("y", p.get("start", [0, 0])[1]))), p.get("radius", 8))
+def draw_projectiles(alpha=1.0):
+    for p in projectiles:
+        p.draw(screen, alpha)
+
+# --- Dirty rectangles ---
+# With POKEMON_DIRTY_RECTS=1 the battle scene only restores the background under
+# what was drawn last frame and pushes the changed regions with
+# display.update(rects). Moving things (sprites, particles, projectiles) are
+# always pushed; HUD pieces are keyed and only pushed when they change.
+DIRTY_RECTS = os.environ.get("POKEMON_DIRTY_RECTS", "0") == "1"
+DIRTY_FLIP_RATIO = 0.5  # full flip once the dirty area passes this fraction of the screen
+dirty_state = {
+    "enabled": DIRTY_RECTS,
+    "full": True,       # next battle frame repaints and flips the whole screen
+    "erase": [],        # everything drawn last frame
+    "moving": [],       # last frame's moving rects
+    "static": {},       # last frame's keyed HUD rects: key -> (rect, signature)
+    "frame_erase": [],
+    "frame_moving": [],
+    "frame_static": {},
+}
+
+def mark_dirty(rect, key=None, signature=None):
+    if not dirty_state["enabled"] or rect is None:
+        return rect
+    rect = pygame.Rect(rect).clip(screen.get_rect())
+    if rect.width == 0 or rect.height == 0:
+        return rect
+    dirty_state["frame_erase"].append(rect)
+    if key is None:
+        dirty_state["frame_moving"].append(rect)
+    else:
+        dirty_state["frame_static"][key] = (rect, signature)
+    return rect
+
+def present_frame(dirty_scene=False):
+    state = dirty_state
+    if not state["enabled"] or not dirty_scene or state["full"]:
+        pygame.display.flip()
+        state["full"] = not dirty_scene
+    else:
+        updates = state["moving"] + state["frame_moving"]
+        old_static, new_static = state["static"], state["frame_static"]
+        for key in old_static.keys() | new_static.keys():
+            old, new = old_static.get(key), new_static.get(key)
+            if old != new:
+                updates.extend(entry[0] for entry in (old, new) if entry)
+        if sum(r.width * r.height for r in updates) > DIRTY_FLIP_RATIO * WIDTH * HEIGHT:
+            pygame.display.flip()
+        elif updates:
+            pygame.display.update(updates)
+    state["erase"], state["moving"], state["static"] = state["frame_erase"], state["frame_moving"], state["frame_static"]
+    state["frame_erase"], state["frame_moving"], state["frame_static"] = [], [], {}
 
 # --- Background ---
-def draw_background():
-    screen.fill(SKY_BLUE)
+# The sky, sun, rays and ground are pre-rendered into opaque surfaces and only
+# rebuilt when the battle positions or sprite sizes change. The flickering rays
+# are baked into RAY_VARIANTS frames that are cycled instead of re-rolled.
+RAY_VARIANTS = 6
+RAY_FRAMES_PER_VARIANT = 1
+background_cache = {"key": None, "frames": [], "tick": 0}
+
+def background_cache_key():
+    sprite_sizes = tuple(p["sprite"].get_size() if p.get("sprite") else None for p in players)
+    return (tuple(tuple(pos) for pos in battle_positions), sprite_sizes)
+
+def render_background():
+    surface = pygame.Surface((WIDTH, HEIGHT)).convert()
+    surface.fill(SKY_BLUE)
     sun_pos = (700, 80)
-    pygame.draw.circle(screen, SUN_YELLOW, sun_pos, 50)
+    pygame.draw.circle(surface, SUN_YELLOW, sun_pos, 50)
     ray_surface = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
     for i in range(0, 360, 20):
         length = random.randint(150, 250)
         end_x = sun_pos[0] + int(length * pygame.math.Vector2(1, 0).rotate(i).x)
         end_y = sun_pos[1] + int(length * pygame.math.Vector2(1, 0).rotate(i).y)
         pygame.draw.line(ray_surface, (255, 255, 150, 30), sun_pos, (end_x, end_y), 4)
-    screen.blit(ray_surface, (0, 0))
-    draw_ground_perspective()
+    surface.blit(ray_surface, (0, 0))
+    draw_ground_perspective(surface)
+    return surface
+
+def draw_background():
+    key = background_cache_key()
+    if background_cache["key"] != key:
+        background_cache["frames"] = [render_background() for _ in range(max(1, RAY_VARIANTS))]
+        background_cache["key"] = key
+        dirty_state["full"] = True
+    frames = background_cache["frames"]
+    if dirty_state["enabled"]:
+        # Rays stay still so only the regions drawn last frame need restoring
+        if dirty_state["full"]:
+            screen.blit(frames[0], (0, 0))
+        else:
+            for rect in dirty_state["erase"]:
+                screen.blit(frames[0], rect, rect)
+        return
+    background_cache["tick"] += 1
+    screen.blit(frames[(background_cache["tick"] // RAY_FRAMES_PER_VARIANT) % len(frames)], (0, 0))
 
 
-def draw_ground_perspective():
+def draw_ground_perspective(surface):
     far_ground_left = HEIGHT // 2 + 60
     far_ground_right = HEIGHT // 2 + 20
     pygame.draw.polygon(
-        screen,
+        surface,
         GRASS_GREEN,
         [
             (0, far_ground_left),
@@ -731,7 +914,7 @@ def draw_ground_perspective():
 
     shadow_color = tuple(max(c - 40, 0) for c in DARK_GREEN)
     pygame.draw.polygon(
-        screen,
+        surface,
         shadow_color,
         [
             (0, far_ground_left),
@@ -743,7 +926,7 @@ def draw_ground_perspective():
 
     highlight_color = tuple(min(c + 30, 255) for c in GRASS_GREEN)
     pygame.draw.polygon(
-        screen,
+        surface,
         highlight_color,
         [
             (WIDTH // 2 + 60, far_ground_right),
@@ -767,12 +950,12 @@ def draw_ground_perspective():
         base_color = tuple(max(c - 20, 0) for c in GRASS_GREEN)
         inner_color = tuple(min(c + 25, 255) for c in GRASS_GREEN)
 
-        pygame.draw.ellipse(screen, base_color, pad_rect)
+        pygame.draw.ellipse(surface, base_color, pad_rect)
         inner_rect = pad_rect.inflate(-int(pad_width * 0.3), -int(pad_height * 0.4))
         if inner_rect.width > 0 and inner_rect.height > 0:
-            pygame.draw.ellipse(screen, inner_color, inner_rect)
+            pygame.draw.ellipse(surface, inner_color, inner_rect)
         rim_rect = pad_rect.inflate(-4, -4)
-        pygame.draw.ellipse(screen, DARK_GREEN, rim_rect, 3)
+        pygame.draw.ellipse(surface, DARK_GREEN, rim_rect, 3)
 
 # --- Health bar ---
 def draw_health_bar(x, y, hp, max_hp, color):
@@ -780,82 +963,154 @@ def draw_health_bar(x, y, hp, max_hp, color):
     fill = max(0, (hp / max_hp) * bar_width)
     pygame.draw.rect(screen, BLACK, (x, y, bar_width, bar_height), 2)
     pygame.draw.rect(screen, color, (x, y, fill, bar_height))
+    mark_dirty((x, y, bar_width, bar_height), ("health", x, y), (hp, max_hp, color))
+
+# --- Win probability overlay ---
+# Both sides are modelled with the normal AI's policy; the odds only change when
+# HP or potions do, so they are refreshed on hits and potions, not every frame
+WIN_ODDS_POLICIES = ("ai", "ai")
+win_odds = None   # (P(player 1 wins), expected actions left)
+
+def import_winprob():
+    try:
+        import winprob
+    except ImportError:
+        # The overlay needs NumPy
+        return None
+    return winprob
+
+# Kept out of importing main (benchmarks/bench_import.py checks); the first battle loads it
+winprob_module = assets.Asset(import_winprob)
+
+def update_win_odds():
+    global win_odds
+    winprob = winprob_module.get()
+    if winprob is not None and battle_state is not None:
+        win_odds = winprob.win_probability(battle_state, WIN_ODDS_POLICIES)
+
+def draw_win_odds():
+    if win_odds is None:
+        return
+    p1_win, actions_left = win_odds
+    draw_text(f"{p1_win:.0%} win, ~{actions_left:.0f} moves left", (310, 152), button_font)
+    draw_text(f"{1 - p1_win:.0%} win", (710, 52), button_font)
+
+# --- Text ---
+def draw_text(text, pos, font_obj=None, color=BLACK):
+    text_surface = render_text(font_obj or font, text, color)
+    return mark_dirty(screen.blit(text_surface, pos), ("text", pos), (text, color))
 
 # --- Draw scene ---
-def draw_scene():
-    draw_background()
+def draw_scene(alpha=1.0):
+    with profiler.phase("draw_background"):
+        draw_background()
 
     # Draw Pokémon sprites with bobbing effect
+    bob_ms = (sim_ticks - 1 + alpha) * 1000 / SIM_HZ
     for i in (0, 1):
         p = players[i]
         pos = battle_positions[i]
-        y_bob = pos[1] + 5 * math.sin(pygame.time.get_ticks() / 200)
+        y_bob = pos[1] + 5 * math.sin(bob_ms / 200)
         sprite = p["sprite"]
-        screen.blit(sprite, (pos[0] - sprite.get_width() // 2, y_bob - sprite.get_height() // 2))
+        mark_dirty(screen.blit(sprite, (pos[0] - sprite.get_width() // 2, y_bob - sprite.get_height() // 2)))
 
     # Draw health bars & names
-    draw_health_bar(100, 150, players[0]["hp"], players[0]["max_hp"], players[0]["color"])
-    screen.blit(font.render(f"{players[0]['name']}: {players[0]['hp']} HP", True, BLACK), (100, 120))
-
-    draw_health_bar(500, 50, players[1]["hp"], players[1]["max_hp"], players[1]["color"])
-    screen.blit(font.render(f"{players[1]['name']}: {players[1]['hp']} HP", True, BLACK), (500, 20))
-
-    draw_particles()
-    draw_projectiles()
+    draw_health_bar(100, 150, battle_state.hp[0], battle_state.max_hp[0], players[0]["color"])
+    draw_text(f"{players[0]['name']}: {battle_state.hp[0]} HP", (100, 120))
+
+    draw_health_bar(500, 50, battle_state.hp[1], battle_state.max_hp[1], players[1]["color"])
+    draw_text(f"{players[1]['name']}: {battle_state.hp[1]} HP", (500, 20))
+    draw_win_odds()
+    if mcts_active() and mcts_ai.stats["rollouts"]:
+        stats = mcts_ai.stats
+        draw_text(f"MCTS {stats['rollouts_per_sec'] / 1000:.1f}k rollouts/s, depth {stats['max_depth']}",
+                  (500, 75), button_font)
+    if net is not None:
+        stats = net.stats
+        status = f"DESYNC at tick {net.desync}" if net.desync else \
+            f"Online: {stats['rollbacks']} rollbacks, max {stats['max_depth']} ticks"
+        draw_text(status, (500, 75), button_font, RED if net.desync else BLACK)
+
+    with profiler.phase("draw_particles"):
+        draw_particles(alpha)
+    with profiler.phase("draw_projectiles"):
+        draw_projectiles(alpha)
 
     # Draw damage popup
     if damage_popup:
         text, x, y, timer = damage_popup
-        screen.blit(font.render(text, True, YELLOW), (x, y))
+        draw_text(text, (x, y), color=YELLOW)
 
     # Draw attack message or turn info
     if game_over:
-        screen.blit(big_font.render(f"{winner} Wins!", True, BLACK), (WIDTH // 2 - 120, HEIGHT // 2 - 50))
+        draw_text(f"{winner} Wins!", (WIDTH // 2 - 120, HEIGHT // 2 - 50), big_font)
         if restart_button:
-            restart_button.draw(screen)
+            mark_dirty(restart_button.draw(screen), ("button", id(restart_button)), (restart_button.text, restart_button.hover))
     else:
-        turn_name = "Player 1" if turn == 0 else ("Player 2" if mode_selected == 1 else "AI")
-        screen.blit(font.render(f"{turn_name}'s turn", True, BLACK), (WIDTH // 2 - 60, HEIGHT - 110))
+        turn_name = "AI" if mode_selected == 0 and turn == 1 else f"Player {turn + 1}"
+        if net is not None and human_controls(turn):
+            turn_name += " (you)"
+        draw_text(f"{turn_name}'s turn", (WIDTH // 2 - 60, HEIGHT - 110))
         if attack_message:
-            screen.blit(font.render(attack_message, True, BLACK), (WIDTH // 2 - 100, HEIGHT - 90))
+            draw_text(attack_message, (WIDTH // 2 - 100, HEIGHT - 90))
         
         # Draw battle action buttons for current player (only for human turns and no lockout)
-        if action_lockout == 0:
-            if turn == 0:  # Player 1's turn - show buttons on left
-                for btn in battle_buttons_p1:
-                    btn.draw(screen)
-            elif turn == 1 and mode_selected == 1:  # Player 2's turn in 2P mode - show buttons on right
-                for btn in battle_buttons_p2:
-                    btn.draw(screen)
+        if action_lockout == 0 and human_controls(turn):
+            # Player 1's buttons on the left, player 2's on the right
+            for btn in battle_buttons_p1 if turn == 0 else battle_buttons_p2:
+                mark_dirty(btn.draw(screen), ("button", id(btn)), (btn.text, btn.color, btn.text_color, btn.hover))
 
     # Draw potion counts on screen (above buttons)
-    screen.blit(font.render(f"P1 Potions: {potion_counts[0]}", True, BLACK), (20, HEIGHT - 110))
-    screen.blit(font.render(f"P2 Potions: {potion_counts[1]}", True, BLACK), (WIDTH - 190, HEIGHT - 110))
+    draw_text(f"P1 Potions: {battle_state.potions[0]}", (20, HEIGHT - 110))
+    draw_text(f"P2 Potions: {battle_state.potions[1]}", (WIDTH - 190, HEIGHT - 110))
 
 # --- Play sound safely ---
-def play_sound(sound):
+def play_sound(handle):
+    sound = handle.get() if handle else None
     if sound:
         sound.play()
 
+# --- Event log ---
+# POKEMON_EVENT_LOG=path streams attacks, hits, potions and knockouts to a JSONL
+# file through a background writer (see events.py); rows are keyed by the
+# battle's replay seed and sim tick. The log is opened by main(), so importing
+# this module (benchmarks, tools) never starts a writer.
+EVENT_LOG_PATH = os.environ.get("POKEMON_EVENT_LOG")
+event_log = None
+
+def open_event_log():
+    global event_log
+    if event_log is None and EVENT_LOG_PATH:
+        event_log = events.EventLog(EVENT_LOG_PATH)
+    return event_log
+
+def log_event(kind, player, move=None, damage=None):
+    if event_log is not None and not effects_muted(player):
+        event_log.record(battle_id, battle_ticks, kind, player, move, damage, battle_state)
+
 # --- Attack execution ---
 def perform_attack(attacker_idx, action_key):
-    global attacking, attack_message, turn, animation_timer, damage_popup, game_over, winner, action_lockout
+    global attacking, attack_message, turn, animation_timer, damage_popup, action_lockout
     attacker = players[attacker_idx]
     defender_idx = 1 - attacker_idx
     defender = players[defender_idx]
 
+    state_before = battle_state.copy()
+    muted = effects_muted(attacker_idx)
     if action_key == "potion":
-        if potion_counts[attacker_idx] > 0 and attacker["hp"] < attacker["max_hp"]:
-            potion_counts[attacker_idx] -= 1
-            heal_amount = 20
-            attacker["hp"] = min(attacker["hp"] + heal_amount, attacker["max_hp"])
-            attack_message = f"{attacker['name']} used Potion! +20 HP"
-            play_sound(potion_sound)
-            damage_popup = (f"+20", battle_positions[attacker_idx][0], battle_positions[attacker_idx][1] - 50, 60)
+        if battle_state.use_potion(attacker_idx):
+            log_event("potion", attacker_idx, "potion", 0)
+            update_win_odds()
+            if mcts_active():
+                mcts_ai.ponder(state_before, action_key)
+            attack_message = f"{attacker['name']} used Potion! +{battle.POTION_HEAL} HP"
+            if not muted:
+                play_sound(potion_sound)
+            damage_popup = (f"+{battle.POTION_HEAL}", battle_positions[attacker_idx][0], battle_positions[attacker_idx][1] - 50, 60)
             attacking = True
             animation_timer = 30
-            action_lockout = 60  # 1 second at 60 FPS
-            turn = defender_idx
+            action_lockout = 60  # 1 second at SIM_HZ
+            turn = battle_state.turn
         else:
             attack_message = "No potions left or HP full!"
         return
@@ -867,35 +1122,97 @@ def perform_attack(attacker_idx, action_key):
     attack = attacker["attacks"][action_key]
 
     attack_message = f"{attacker['name']} used {attack['name']}!"
-    play_sound(attack["sound"])
+    if not muted:
+        play_sound(attack["sound"])
 
     start_pos = battle_positions[attacker_idx]
     target_pos = battle_positions[defender_idx]
 
     spawn_projectile(attack["type"], start_pos, target_pos, attacker_idx, action_key)
-
+    if broadcast is not None and not muted:
+        broadcast_spawns.append((attacker_idx, action_key))
+
+    # Damage is rolled when the projectile lands, see resolve_hit()
+    battle_state.pass_turn()
+    log_event("attack", attacker_idx, action_key)
+    if mcts_active():
+        # Search the likely follow-ups while the attack animates
+        mcts_ai.ponder(state_before, action_key)
     attacking = True
     animation_timer = 30
     action_lockout = 60
-    turn = defender_idx
+    turn = battle_state.turn
 
 # --- AI logic for 1P mode ---
-def ai_turn():
-    global turn
-    attacker_idx = 1
-    defender_idx = 0
-    attacker = players[attacker_idx]
+# The AI thinks in an asyncio task so frames keep rendering and input stays live
+# during its pause; the chosen move is applied on a later sim tick.
+AI_THINK_DELAY = 0.6  # seconds, so the player can follow what happened
+ai_task = None
+
+def normal_ai_action(state):
+    # Simple AI: heal below 40% HP if potions are left, else weighted random attack
+    return battle.ai_action(state, 1, ai_rng)
+
+def hard_ai_action(state):
+    # Expectimax search over moves, potions and damage rolls within a frame's budget
+    return expectimax.default_ai.choose(state, 1)
+
+# Browser builds have no threads or processes, so MCTS searches inline in small slices there
+THREADS_AVAILABLE = sys.platform != "emscripten"
+if THREADS_AVAILABLE:
+    mcts_ai = mcts.SearchProcess(time_budget=0.25)
+else:
+    mcts_ai = mcts.MCTSAI(time_budget=0.012)
+
+def mcts_ai_action(state):
+    # Tree search with random rollouts, reusing the tree pondered during animations
+    return mcts_ai.choose(state, 1)
+
+# Optimal action for every state, memory-mapped from data/policy.bin (built by perfect.py)
+perfect_table = assets.Asset(perfect.PolicyTable.load)
+
+def perfect_ai_action(state):
+    table = perfect_table.get()
+    if table is None or not table.covers(state.names):
+        # Table missing, built for other stats or without this matchup
+        return hard_ai_action(state)
+    return table.action(state)
+
+AI_DIFFICULTIES = {
+    "Normal": normal_ai_action,
+    "Hard": hard_ai_action,
+    "MCTS": mcts_ai_action,
+    "Perfect": perfect_ai_action,
+}
 
-    # Simple AI: heal if HP < 25 and potions left, else random attack
-    if potion_counts[attacker_idx] > 0 and attacker["hp"] < attacker["max_hp"] * 0.4:
-        perform_attack(attacker_idx, "potion")
-    else:
-        move_keys = [k for k in attacker["attacks"] if k != "tackle"]
-        weights = [70] * len(move_keys)
-        move_keys.append("tackle")
-        weights.append(30)
-        choice = random.choices(move_keys, weights=weights, k=1)[0]
-        perform_attack(attacker_idx, choice)
+def mcts_active():
+    return mode_selected == 0 and difficulty_options[difficulty_selected] == "MCTS" and playback is None
+
+def choose_ai_action(state):
+    return AI_DIFFICULTIES[difficulty_options[difficulty_selected]](state)
+
+async def think_ai_turn(state):
+    await asyncio.sleep(AI_THINK_DELAY / sim_speed)
+    if not THREADS_AVAILABLE or (difficulty_options[difficulty_selected] == "Perfect" and perfect_table.get()):
+        # A table lookup is cheaper than handing off to a thread
+        return choose_ai_action(state)
+    return await asyncio.get_running_loop().run_in_executor(None, choose_ai_action, state)
+
+def ai_turn():
+    global ai_task
+    if ai_task is None:
+        ai_task = asyncio.ensure_future(think_ai_turn(battle_state.copy()))
+    elif ai_task.done():
+        task, ai_task = ai_task, None
+        if not task.cancelled():
+            queue_action(1, task.result())
+
+def cancel_ai_turn():
+    global ai_task
+    if ai_task is not None:
+        ai_task.cancel()
+        ai_task = None
+    mcts_ai.reset()
 
 # --- Handle key events in battle ---
 def handle_battle_input(event):
@@ -909,27 +1226,36 @@ def handle_battle_input(event):
     if action_lockout > 0:
         return
 
-    active_player = 0 if turn == 0 else (1 if turn == 1 and mode_selected == 1 else None)
-
-    if active_player is None:
+    if not human_controls(turn):
         return
+    active_player = turn
 
-    keybinds = PLAYER_KEYBINDS[active_player]
+    # Online each side plays from player 1's keys
+    keybinds = PLAYER_KEYBINDS[0 if net is not None else active_player]
 
     if event.key == keybinds["potion"]:
-        perform_attack(active_player, "potion")
+        queue_action(active_player, "potion")
         return
 
     for idx, key in enumerate(keybinds["moves"]):
         if event.key == key:
             move_key = player_move_keys[active_player][idx]
             if move_key:
-                perform_attack(active_player, move_key)
+                queue_action(active_player, move_key)
             return
 
 # --- Reset game to mode select ---
 def reset_game():
-    global mode_select, pokemon_select, battle_start, player_choices, player_selecting, players, turn, game_over, winner, potion_counts, attacking, attack_message, damage_popup, projectiles, particles, restart_button, action_lockout
+    global mode_select, pokemon_select, battle_start, player_choices, player_selecting, players, battle_state, turn, game_over, winner, attacking, attack_message, damage_popup, projectiles, particles, restart_button, action_lockout, playback, net, net_handshake
+    save_recording()
+    playback = None
+    if net is not None:
+        net.close()
+        net = None
+    if net_handshake is not None:
+        net_handshake.peer.close()
+        net_handshake = None
+    pending_actions.clear()
     mode_select = True
     pokemon_select = False
     battle_start = False
@@ -939,7 +1265,7 @@ def reset_game():
     turn = 0
     game_over = False
     winner = None
-    potion_counts = [3, 3]
+    battle_state = None
     attacking = False
     attack_message = ""
     damage_popup = None
@@ -947,11 +1273,12 @@ def reset_game():
     particles.clear()
     restart_button = None
     action_lockout = 0
+    cancel_ai_turn()
 
 # --- Mode select screen ---
 def draw_mode_select():
     screen.fill(WHITE)
-    screen.blit(big_font.render("Select Mode", True, BLACK), (WIDTH // 2 - 130, 50))
+    screen.blit(render_text(big_font, "Select Mode", BLACK), (WIDTH // 2 - 130, 50))
     # Draw mode buttons
     for i, btn in enumerate(mode_buttons):
         if i == mode_selected:
@@ -959,245 +1286,591 @@ def draw_mode_select():
         else:
             btn.color = GRAY
         btn.draw(screen)
-    screen.blit(font.render("Tap to select or use UP/DOWN + ENTER", True, BLACK), (WIDTH // 2 - 180, HEIGHT - 50))
+    difficulty_button.text = f"AI: {difficulty_options[difficulty_selected]}  < >"
+    difficulty_button.draw(screen, button_font)
+    footer = net_message or "Tap to select or use UP/DOWN + ENTER"
+    screen.blit(render_text(font, footer, BLACK), (WIDTH // 2 - font.size(footer)[0] // 2, HEIGHT - 40))
 
 # --- Pokemon select screen ---
+def select_page_start():
+    # Index of the first species on the page showing the current choice
+    return player_choices[player_selecting] // SELECT_PAGE_SIZE * SELECT_PAGE_SIZE
+
+def select_page_count():
+    return (len(player_choice_names) + SELECT_PAGE_SIZE - 1) // SELECT_PAGE_SIZE
+
+def turn_select_page(step):
+    page = (player_choices[player_selecting] // SELECT_PAGE_SIZE + step) % select_page_count()
+    player_choices[player_selecting] = page * SELECT_PAGE_SIZE
+
+def preload_select_page(page):
+    # Queue the sprites of a page before it is shown
+    if page < select_page_count() and page not in select_pages_preloaded:
+        select_pages_preloaded.add(page)
+        start = page * SELECT_PAGE_SIZE
+        preloader.add(*(pokemon_data[name]["sprite"] for name in player_choice_names[start:start + SELECT_PAGE_SIZE]))
+
 def draw_pokemon_select():
-    global pokemon_selection_rects
+    global pokemon_selection_rects, select_page_buttons
     screen.fill(WHITE)
-    screen.blit(big_font.render(f"Player {player_selecting + 1} Select", True, BLACK), (WIDTH // 2 - 160, 50))
+    screen.blit(render_text(big_font, f"Player {player_selecting + 1} Select", BLACK), (WIDTH // 2 - 160, 50))
     spacing = 220
     start_x = WIDTH // 2 - spacing
     y = HEIGHT // 2
+    first = select_page_start()
     pokemon_selection_rects = []
-    for i, p_name in enumerate(player_choice_names):
-        sprite = pokemon_data[p_name]["sprite"]
+    for i, p_name in enumerate(player_choice_names[first:first + SELECT_PAGE_SIZE]):
+        sprite = pokemon_data[p_name]["sprite"].get()
         x = start_x + i * spacing
         screen.blit(sprite, (x - sprite.get_width() // 2, y - sprite.get_height() // 2))
         # Draw names below
-        screen.blit(font.render(p_name, True, BLACK), (x - font.size(p_name)[0] // 2, y + 70))
+        name_surface = render_text(font, p_name, BLACK)
+        screen.blit(name_surface, (x - name_surface.get_width() // 2, y + 70))
         # Draw highlight rectangle for current selection
-        if i == player_choices[player_selecting]:
+        if first + i == player_choices[player_selecting]:
             border_color = BLUE if player_selecting == 1 else RED
             pygame.draw.rect(screen, border_color, (x - 60, y - 60, 120, 120), 4)
         # Store clickable rect for each pokemon
         pokemon_selection_rects.append(pygame.Rect(x - 60, y - 60, 120, 120))
-    
+
+    # Page arrows and number once the roster does not fit on one screen
+    pages = select_page_count()
+    select_page_buttons = []
+    if pages > 1:
+        page = first // SELECT_PAGE_SIZE
+        select_page_buttons = [Button(15, y - 25, 50, 50, "<", GRAY), Button(WIDTH - 65, y - 25, 50, 50, ">", GRAY)]
+        for btn in select_page_buttons:
+            btn.draw(screen)
+        label = render_text(button_font, f"Page {page + 1}/{pages}", BLACK)
+        screen.blit(label, (WIDTH // 2 - label.get_width() // 2, y - 100))
+        preload_select_page(page + 1)
+
     # Draw confirm button
     confirm_btn = Button(WIDTH // 2 - 100, HEIGHT - 80, 200, 50, "Confirm", GREEN, BLACK)
     confirm_btn.draw(screen)
 
-async def main():
-    global mode_select, mode_selected, animation_timer, pokemon_select, battle_start, player_choices, player_selecting, players, turn, game_over, winner, potion_counts, attacking, attack_message, damage_popup, projectiles, particles, action_lockout
-    # --- Main game loop ---
-    clock = pygame.time.Clock()
+# --- Simulation clock ---
+# Gameplay advances in fixed ticks of SIM_DT seconds, independent of how fast
+# frames are drawn, so a slow frame no longer slows the battle down. All the
+# timers above count ticks. Rendering interpolates between the last two ticks.
+SIM_HZ = 60
+SIM_DT = 1.0 / SIM_HZ
+RENDER_FPS = 60
+MAX_FRAME_TIME = 0.25  # cap the catch-up after a stall
+FAST_FORWARD_SPEED = max(1, int(os.environ.get("POKEMON_FAST_FORWARD", "4")))
+FAST_FORWARD_KEY = pygame.K_f
+sim_ticks = 0
+sim_speed = 1
+
+def toggle_fast_forward():
+    global sim_speed
+    # Both sides of an online battle have to run at the same speed
+    sim_speed = FAST_FORWARD_SPEED if sim_speed == 1 and net is None and net_handshake is None else 1
+
+# --- Replays ---
+# Damage rolls and the AI's choices draw from per-battle streams seeded in
+# start_battle(); particles and other eye candy keep the global random module.
+# Every action, human or AI, is queued and applied at the start of the next sim
+# tick, so the seed plus (tick, player, action) reproduces a battle exactly.
+REPLAY_DIR = os.environ.get("POKEMON_REPLAY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "replays"))
+RECORD_REPLAYS = os.environ.get("POKEMON_RECORD_REPLAYS", "1") == "1"
+damage_rng = random.Random()
+ai_rng = random.Random()
+battle_id = ""          # the battle's seed in hex, for the event log
+battle_ticks = 0        # sim ticks since start_battle()
+pending_actions = []    # (player, action key) for the next tick
+recording = None        # replay.Replay of the battle in progress
+playback = None         # replay.Playback while watching a replay
+
+def human_controls(idx):
+    # Whether side idx takes input from this machine
+    if playback is not None or spectating:
+        return False
+    if mode_selected == 0:
+        return idx == 0
+    if mode_selected == ONLINE_MODE:
+        return net is not None and idx == net.local_player
+    return True
+
+def queue_action(idx, action_key):
+    # One action per tick; live input is ignored while a replay plays
+    if net is not None:
+        if idx == net.local_player:
+            net.add_local_input(action_key)
+    elif playback is None and not pending_actions:
+        pending_actions.append((idx, action_key))
+
+def apply_actions():
+    if playback is not None:
+        pending_actions.extend(playback.due(battle_ticks))
+    for idx, action_key in pending_actions:
+        if game_over or idx != battle_state.turn:
+            continue
+        if recording is not None:
+            recording.record(battle_ticks, idx, action_key)
+        perform_attack(idx, action_key)
+        if recording is not None:
+            recording.note(battle_ticks, battle_state)
+    pending_actions.clear()
+
+def save_recording():
+    # Write the battle's replay once it ends or is abandoned; watched replays are not re-saved
+    global recording
+    if recording is None or playback is not None or not recording.actions:
+        return
+    recording.finish(battle_ticks, battle_state.winner if battle_state else None)
+    if RECORD_REPLAYS:
+        try:
+            recording.save(REPLAY_DIR)
+        except OSError:
+            pass
+    recording = None
+
+def start_playback(recorded):
+    """Set up a recorded battle; the main loop (or replay.play_headless) starts it."""
+    global mode_select, pokemon_select, battle_start, mode_selected, difficulty_selected, playback
+    reset_game()
+    playback = replay.Playback(recorded)
+    mode_select = False
+    pokemon_select = False
+    battle_start = True
+    mode_selected = recorded.mode
+    difficulty_selected = recorded.difficulty
+
+# --- Online play ---
+# netplay.RollbackSession drives the sim in online battles: it snapshots the
+# state before every tick, and when the opponent's input for an earlier tick
+# arrives it restores that snapshot and re-runs the ticks since with it applied.
+# Sounds, particles and log rows of the local side already happened and are
+# muted during the re-run; only the opponent's late action is new.
+net_options = {"bind": ("", netplay.DEFAULT_PORT)}   # or {"remote": (host, port)}, see --host/--join
+net_handshake = None    # netplay.Handshake while waiting for an opponent
+net = None              # netplay.RollbackSession during an online battle
+net_message = ""        # why the last online game ended, shown on the mode screen
+resimulating = False
+
+def effects_muted(player):
+    return resimulating and (net is None or player == net.local_player)
+
+def save_net_state():
+    recorded = (len(recording.actions), recording.checksum) if recording is not None else None
+    return (battle_ticks, battle_state.copy(), turn, game_over, winner, action_lockout, attacking,
+            animation_timer, attack_message, damage_popup, win_odds, [copy.copy(p) for p in projectiles],
+            damage_rng.getstate(), recorded)
+
+def load_net_state(state):
+    global battle_ticks, battle_state, turn, game_over, winner, action_lockout, attacking, animation_timer, attack_message, damage_popup, win_odds
+    (battle_ticks, saved_battle, turn, game_over, winner, action_lockout, attacking, animation_timer,
+     attack_message, damage_popup, win_odds, saved_projectiles, rng_state, recorded) = state
+    # Copies, so the same snapshot can be restored again by a later rollback
+    battle_state = saved_battle.copy()
+    projectiles[:] = [copy.copy(p) for p in saved_projectiles]
+    damage_rng.setstate(rng_state)
+    if recorded is not None and recording is not None:
+        del recording.actions[recorded[0]:]
+        recording.checksum = recorded[1]
+
+def advance_net(inputs, resim):
+    global resimulating
+    pending_actions[:] = inputs
+    resimulating = resim
+    try:
+        simulate_tick()
+    finally:
+        resimulating = False
+
+def net_checksum():
+    s = battle_state
+    return zlib.crc32(repr((battle_ticks, s.hp, s.potions, s.turn, s.winner, action_lockout,
+                            [type(p).__name__ for p in projectiles])).encode())
+
+def start_online():
+    """Leave the selection screen and wait for an opponent with the picked Pokémon."""
+    global pokemon_select, net_handshake, net_message
+    pokemon_select = False
+    try:
+        peer = netplay.Peer(bind=net_options.get("bind"), remote=net_options.get("remote"))
+    except OSError as e:
+        reset_game()
+        net_message = f"Network error: {e.strerror or e}"
+        return
+    net_message = ""
+    net_handshake = netplay.Handshake(peer, player_choice_names[player_choices[0]])
+
+def update_online(accumulator):
+    """Run the handshake or the rollback session; returns the sim time left over."""
+    global net, net_handshake, battle_start, player_choices, net_message
+    if net_handshake is not None:
+        result = net_handshake.poll()
+        if result is not None:
+            local_player, names, seed = result
+            net = netplay.RollbackSession(net_handshake.peer, local_player, names, seed,
+                                          save_net_state, load_net_state, advance_net, net_checksum)
+            net_handshake = None
+            player_choices = [player_choice_names.index(name) for name in names]
+            battle_start = True
+        return 0.0
+    if net is None or not players[0]:
+        return 0.0
+    ticks = int(accumulator / SIM_DT)
+    net.update(ticks)
+    if net.remote_left or net.timed_out:
+        message = "Opponent left" if net.remote_left else "Connection lost"
+        reset_game()
+        net_message = message
+        return 0.0
+    return accumulator - ticks * SIM_DT
+
+def draw_online_wait():
+    screen.fill(WHITE)
+    screen.blit(render_text(big_font, "Waiting for opponent", BLACK), (WIDTH // 2 - 240, 120))
+    if "remote" in net_options:
+        where = "Joining {}:{}".format(*net_options["remote"])
+    else:
+        where = f"Hosting on port {net_options['bind'][1]}"
+    screen.blit(render_text(font, where, BLACK), (WIDTH // 2 - font.size(where)[0] // 2, 200))
+    screen.blit(render_text(font, "ESC to cancel", BLACK), (WIDTH // 2 - 85, HEIGHT - 40))
+
+# --- Spectator feed ---
+# With --broadcast the rules state and projectile spawns are published to a
+# spectate.py hub after every tick; spectate.py's viewer drives draw_scene()
+# from the feed with spectating set.
+broadcast = None        # spectate.Publisher
+broadcast_spawns = []   # (attacker, action key) since the last publish
+spectating = False
+
+def spectator_state():
+    if battle_state is None or not players[0]:
+        return None
+    s = battle_state
+    return {"tick": battle_ticks, "battle": int(battle_id, 16), "mode": mode_selected, "names": s.names,
+            "hp0": s.hp[0], "hp1": s.hp[1], "potions0": s.potions[0], "potions1": s.potions[1],
+            "turn": s.turn, "winner": spectate.NO_WINNER if s.winner is None else s.winner,
+            "message": attack_message, "popup": damage_popup}
+
+def publish_spectators():
+    broadcast.publish(spectator_state(), broadcast_spawns)
+    broadcast_spawns.clear()
+
+def start_battle():
+    global battle_state, turn, damage_rng, ai_rng, battle_id, battle_ticks, recording
+    if playback is not None:
+        seed = playback.replay.seed
+    elif net is not None:
+        seed = net.seed
+    else:
+        seed = replay.new_seed()
+    battle_id = f"{seed:016x}"
+    damage_rng, ai_rng = replay.streams(seed)
+    battle_ticks = 0
+    pending_actions.clear()
+    # Setup players dict on battle start
+    if playback is not None:
+        p1_name, p2_name = playback.replay.names
+    else:
+        p1_name = player_choice_names[player_choices[0]]
+        if mode_selected == 0:
+            p2_index = choose_ai_pokemon(player_choices[0])
+            player_choices[1] = p2_index
+        else:
+            p2_index = player_choices[1]
+        p2_name = player_choice_names[p2_index]
+    for idx, name in ((0, p1_name), (1, p2_name)):
+        players[idx] = {
+            "name": name,
+            "sprite": pokemon_data[name]["sprite"].get(),
+            "color": pokemon_data[name]["color"],
+            "attacks": pokemon_data[name]["attacks"]
+        }
+    battle_state = battle.Battle(p1_name, p2_name, playback.replay.first_turn if playback is not None else 0)
+    turn = battle_state.turn
+    recording = replay.Replay(seed, battle_state.names, mode_selected, difficulty_selected, turn)
+    # Solving a new matchup takes ~0.1s once; later battles hit the cache
+    update_win_odds()
+
+    configure_move_buttons()
+
+def simulate_tick():
+    global sim_ticks, battle_ticks, damage_popup, action_lockout, attacking, animation_timer, attack_message
+    if not resimulating:
+        sim_ticks += 1
+    if battle_state is not None:
+        battle_ticks += 1
+        apply_actions()
+
+    # Update damage popup timer
+    if damage_popup:
+        text, x, y, timer = damage_popup
+        timer -= 1
+        if timer <= 0:
+            damage_popup = None
+        else:
+            damage_popup = (text, x, y, timer)
 
-    while True:
-        mouse_pos = pygame.mouse.get_pos()
-        
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-
-            if mode_select:
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_UP:
-                        mode_selected = (mode_selected - 1) % len(mode_options)
-                    elif event.key == pygame.K_DOWN:
-                        mode_selected = (mode_selected + 1) % len(mode_options)
-                    elif event.key == pygame.K_RETURN:
-                        mode_select = False
-                        pokemon_select = True
-                        player_selecting = 0
-                        player_choices = [0, 0]
-                
-                # Handle mouse/tap input for mode selection
-                if event.type == pygame.MOUSEBUTTONDOWN:
-                    for i, btn in enumerate(mode_buttons):
-                        if btn.is_clicked(mouse_pos):
-                            mode_selected = i
-                            mode_select = False
-                            pokemon_select = True
-                            player_selecting = 0
-                            player_choices = [0, 0]
-                            break
-                            
-            elif pokemon_select:
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_LEFT:
-                        player_choices[player_selecting] = (player_choices[player_selecting] - 1) % len(player_choice_names)
-                    elif event.key == pygame.K_RIGHT:
-                        player_choices[player_selecting] = (player_choices[player_selecting] + 1) % len(player_choice_names)
-                    elif event.key == pygame.K_RETURN:
-                        if player_selecting == 0:
-                            player_selecting = 1
-                            if mode_selected == 0:
-                                player_choices[1] = choose_ai_pokemon(player_choices[0])
-                                pokemon_select = False
-                                battle_start = True
-                        else:
-                            pokemon_select = False
-                            battle_start = True
-                
-                # Handle mouse/tap input for pokemon selection
-                if event.type == pygame.MOUSEBUTTONDOWN:
-                    # Check if tapped on a pokemon
-                    for i, rect in enumerate(pokemon_selection_rects):
-                        if rect.collidepoint(mouse_pos):
-                            player_choices[player_selecting] = i
-                            break
-                    
-                    # Check if tapped confirm button
-                    confirm_btn = Button(WIDTH // 2 - 100, HEIGHT - 80, 200, 50, "Confirm", GREEN, BLACK)
-                    if confirm_btn.is_clicked(mouse_pos):
-                        if player_selecting == 0:
-                            player_selecting = 1
-                            if mode_selected == 0:
-                                player_choices[1] = choose_ai_pokemon(player_choices[0])
-                                pokemon_select = False
-                                battle_start = True
-                        else:
-                            pokemon_select = False
-                            battle_start = True
-
-            elif battle_start:
-                if event.type == pygame.KEYDOWN:
-                    handle_battle_input(event)
-                
-                # Handle mouse/tap input for battle
-                if event.type == pygame.MOUSEBUTTONDOWN:
-                    if game_over:
-                        if restart_button and restart_button.is_clicked(mouse_pos):
-                            reset_game()
-                    else:
-                        # Check battle action buttons (only for human players on their turn)
-                        if not attacking and action_lockout == 0:
-                            # Player 1 can act on turn 0
-                            if turn == 0:
-                                for i, btn in enumerate(battle_buttons_p1):
-                                    if btn.is_clicked(mouse_pos):
-                                        if i == 3:
-                                            perform_attack(turn, "potion")
-                                        else:
-                                            move_key = player_move_keys[0][i]
-                                            if move_key:
-                                                perform_attack(turn, move_key)
-                                        break
-                            # Player 2 can act on turn 1 (if 2P mode)
-                            elif turn == 1 and mode_selected == 1:
-                                for i, btn in enumerate(battle_buttons_p2):
-                                    if btn.is_clicked(mouse_pos):
-                                        if i == 3:
-                                            perform_attack(turn, "potion")
-                                        else:
-                                            move_key = player_move_keys[1][i]
-                                            if move_key:
-                                                perform_attack(turn, move_key)
-                                        break
-
-        # Update damage popup timer
-        if damage_popup:
-            text, x, y, timer = damage_popup
-            timer -= 1
-            if timer <= 0:
-                damage_popup = None
-            else:
-                damage_popup = (text, x, y, timer)
-        
-        # Update action lockout timer
-        if action_lockout > 0:
-            action_lockout -= 1
-
-        # Update button hover states
-        if mode_select:
-            for btn in mode_buttons:
-                btn.update_hover(mouse_pos)
-        elif battle_start:
-            if not game_over:
-                # Only update hover for buttons when they're visible (human player's turn and no lockout)
-                if action_lockout == 0:
-                    if turn == 0:  # Player 1's buttons
-                        for btn in battle_buttons_p1:
-                            btn.update_hover(mouse_pos)
-                    elif turn == 1 and mode_selected == 1:  # Player 2's buttons in 2P mode
-                        for btn in battle_buttons_p2:
-                            btn.update_hover(mouse_pos)
-            else:
-                if restart_button:
-                    restart_button.update_hover(mouse_pos)
-        
-        # Update particles and projectiles
-        update_particles()
+    # Update action lockout timer
+    if action_lockout > 0:
+        action_lockout -= 1
+        if action_lockout == 0 and mcts_active():
+            # Pondering only borrows the animation time
+            mcts_ai.stop_pondering()
+
+    # Update particles and projectiles
+    if not resimulating:
+        with profiler.phase("update_particles"):
+            update_particles()
+    with profiler.phase("update_projectiles"):
         update_projectiles()
 
-        if battle_start and not game_over:
-            # Setup players dict on battle start
-            if not players[0]:
-                p1_name = player_choice_names[player_choices[0]]
-                if mode_selected == 1:
-                    p2_index = player_choices[1]
+    if not THREADS_AVAILABLE and mcts_active() and not game_over:
+        mcts_ai.ponder_step(0.004)
+
+    if battle_start and not game_over and players[0]:
+        # AI turn if mode 1P and turn == 1
+        if mode_selected == 0 and turn == 1 and not attacking and action_lockout == 0 and playback is None:
+            ai_turn()
+
+    # Create restart button when game is over
+    if battle_start and game_over and restart_button is None:
+        create_restart_button()
+
+    # Update timers
+    if attacking:
+        animation_timer -= 1
+        if animation_timer <= 0:
+            attacking = False
+            attack_message = ""
+
+    if broadcast is not None and not resimulating:
+        publish_spectators()
+
+def update_hover(mouse_pos):
+    # Update button hover states
+    if mode_select:
+        for btn in mode_buttons:
+            btn.update_hover(mouse_pos)
+        difficulty_button.update_hover(mouse_pos)
+    elif battle_start:
+        if not game_over:
+            # Only update hover for buttons when they're visible (human player's turn and no lockout)
+            if action_lockout == 0 and human_controls(turn):
+                for btn in battle_buttons_p1 if turn == 0 else battle_buttons_p2:
+                    btn.update_hover(mouse_pos)
+        else:
+            if restart_button:
+                restart_button.update_hover(mouse_pos)
+
+def draw_frame(alpha=1.0):
+    # Clear screen and draw appropriate screen
+    if mode_select:
+        draw_mode_select()
+    elif pokemon_select:
+        draw_pokemon_select()
+    elif battle_start:
+        draw_scene(alpha)
+    elif net_handshake is not None:
+        draw_online_wait()
+    if sim_speed > 1:
+        draw_text(f">> x{sim_speed}", (WIDTH - 90, HEIGHT - 140))
+    if playback is not None:
+        draw_text("Replay", (WIDTH - 90, HEIGHT - 170))
+
+def handle_event(event, mouse_pos):
+    global mode_select, mode_selected, difficulty_selected, pokemon_select, battle_start, player_choices, player_selecting, net_message
+    if event.type == pygame.QUIT:
+        if profiler.enabled:
+            export_trace()
+        if net is not None or net_handshake is not None:
+            reset_game()
+        save_recording()
+        if event_log is not None:
+            event_log.close()
+        if broadcast is not None:
+            broadcast.close()
+        mcts_ai.close()
+        pygame.quit()
+        sys.exit()
+
+    if event.type == pygame.WINDOWEXPOSED:
+        dirty_state["full"] = True
+
+    if event.type == pygame.KEYDOWN and event.key == FAST_FORWARD_KEY:
+        toggle_fast_forward()
+
+    if event.type == pygame.KEYDOWN and event.key == PROFILE_KEY:
+        profiler.toggle()
+        dirty_state["full"] = True
+
+    if event.type == pygame.KEYDOWN and event.key == TRACE_KEY and profiler.enabled:
+        export_trace()
+
+    if net_handshake is not None:
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+            reset_game()
+
+    elif mode_select:
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_UP:
+                mode_selected = (mode_selected - 1) % len(mode_options)
+            elif event.key == pygame.K_DOWN:
+                mode_selected = (mode_selected + 1) % len(mode_options)
+            elif event.key in (pygame.K_LEFT, pygame.K_RIGHT):
+                step = 1 if event.key == pygame.K_RIGHT else -1
+                difficulty_selected = (difficulty_selected + step) % len(difficulty_options)
+            elif event.key == pygame.K_RETURN:
+                mode_select = False
+                pokemon_select = True
+                player_selecting = 0
+                player_choices = [0, 0]
+                net_message = ""
+
+        # Handle mouse/tap input for mode selection
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            if difficulty_button.is_clicked(mouse_pos):
+                difficulty_selected = (difficulty_selected + 1) % len(difficulty_options)
+            for i, btn in enumerate(mode_buttons):
+                if btn.is_clicked(mouse_pos):
+                    mode_selected = i
+                    mode_select = False
+                    pokemon_select = True
+                    player_selecting = 0
+                    player_choices = [0, 0]
+                    net_message = ""
+                    break
+
+    elif pokemon_select:
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_LEFT:
+                player_choices[player_selecting] = (player_choices[player_selecting] - 1) % len(player_choice_names)
+            elif event.key == pygame.K_RIGHT:
+                player_choices[player_selecting] = (player_choices[player_selecting] + 1) % len(player_choice_names)
+            elif event.key in (pygame.K_UP, pygame.K_PAGEUP):
+                turn_select_page(-1)
+            elif event.key in (pygame.K_DOWN, pygame.K_PAGEDOWN):
+                turn_select_page(1)
+            elif event.key == pygame.K_RETURN:
+                if player_selecting == 0 and mode_selected == ONLINE_MODE:
+                    # The opponent picks on their own machine
+                    start_online()
+                elif player_selecting == 0:
+                    player_selecting = 1
+                    if mode_selected == 0:
+                        pokemon_select = False
+                        battle_start = True
                 else:
-                    p2_index = choose_ai_pokemon(player_choices[0])
-                    player_choices[1] = p2_index
-                p2_name = player_choice_names[p2_index]
-                players[0] = {
-                    "name": p1_name,
-                    "sprite": pokemon_data[p1_name]["sprite"],
-                    "hp": pokemon_data[p1_name]["hp"],
-                    "max_hp": pokemon_data[p1_name]["max_hp"],
-                    "color": pokemon_data[p1_name]["color"],
-                    "attacks": pokemon_data[p1_name]["attacks"]
-                }
-                if mode_selected == 1:
-                    players[1] = {
-                        "name": p2_name,
-                        "sprite": pokemon_data[p2_name]["sprite"],
-                        "hp": pokemon_data[p2_name]["hp"],
-                        "max_hp": pokemon_data[p2_name]["max_hp"],
-                        "color": pokemon_data[p2_name]["color"],
-                        "attacks": pokemon_data[p2_name]["attacks"]
-                    }
+                    pokemon_select = False
+                    battle_start = True
+
+        # Handle mouse/tap input for pokemon selection
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            # Check if tapped on a pokemon or a page arrow
+            for i, rect in enumerate(pokemon_selection_rects):
+                if rect.collidepoint(mouse_pos):
+                    player_choices[player_selecting] = select_page_start() + i
+                    break
+            for step, btn in zip((-1, 1), select_page_buttons):
+                if btn.is_clicked(mouse_pos):
+                    turn_select_page(step)
+
+            # Check if tapped confirm button
+            confirm_btn = Button(WIDTH // 2 - 100, HEIGHT - 80, 200, 50, "Confirm", GREEN, BLACK)
+            if confirm_btn.is_clicked(mouse_pos):
+                if player_selecting == 0 and mode_selected == ONLINE_MODE:
+                    # The opponent picks on their own machine
+                    start_online()
+                elif player_selecting == 0:
+                    player_selecting = 1
+                    if mode_selected == 0:
+                        pokemon_select = False
+                        battle_start = True
                 else:
-                    # AI gets player 2 pokemon
-                    players[1] = {
-                        "name": p2_name,
-                        "sprite": pokemon_data[p2_name]["sprite"],
-                        "hp": pokemon_data[p2_name]["hp"],
-                        "max_hp": pokemon_data[p2_name]["max_hp"],
-                        "color": pokemon_data[p2_name]["color"],
-                        "attacks": pokemon_data[p2_name]["attacks"]
-                    }
-
-                configure_move_buttons()
-
-            # AI turn if mode 1P and turn == 1
-            if mode_selected == 0 and turn == 1 and not attacking and action_lockout == 0:
-                pygame.time.wait(600)
-                ai_turn()
-        
-        # Create restart button when game is over
-        if battle_start and game_over and restart_button is None:
-            create_restart_button()
-
-        # Clear screen and draw appropriate screen
-        if mode_select:
-            draw_mode_select()
-        elif pokemon_select:
-            draw_pokemon_select()
-        elif battle_start:
-            draw_scene()
-
-        # Update timers
-        if attacking:
-            animation_timer -= 1
-            if animation_timer <= 0:
-                attacking = False
-                attack_message = ""
+                    pokemon_select = False
+                    battle_start = True
+
+    elif battle_start:
+        if event.type == pygame.KEYDOWN:
+            handle_battle_input(event)
+
+        # Handle mouse/tap input for battle
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            if game_over:
+                if restart_button and restart_button.is_clicked(mouse_pos):
+                    reset_game()
+            else:
+                # Check battle action buttons (only for human players on their turn)
+                if not attacking and action_lockout == 0 and human_controls(turn):
+                    # Player 1's buttons on turn 0, player 2's on turn 1
+                    for i, btn in enumerate(battle_buttons_p1 if turn == 0 else battle_buttons_p2):
+                        if btn.is_clicked(mouse_pos):
+                            if i == 3:
+                                queue_action(turn, "potion")
+                            else:
+                                move_key = player_move_keys[turn][i]
+                                if move_key:
+                                    queue_action(turn, move_key)
+                            break
 
-        pygame.display.flip()
-        clock.tick(60)
+
+async def main(replay_path=None):
+    init_display()
+    open_event_log()
+    if replay_path:
+        start_playback(replay.Replay.load(replay_path))
+    # --- Main game loop ---
+    clock = pygame.time.Clock()
+    accumulator = 0.0
+    last_time = time.perf_counter()
+
+    while True:
+        profiler.begin_frame()
+        mouse_pos = pygame.mouse.get_pos()
+
+        with profiler.phase("events"):
+            for event in pygame.event.get():
+                handle_event(event, mouse_pos)
+
+        if battle_start and not players[0]:
+            start_battle()
+        update_hover(mouse_pos)
+
+        # Run as many fixed ticks as real time (times the fast-forward speed) allows
+        now = time.perf_counter()
+        accumulator += min(now - last_time, MAX_FRAME_TIME) * sim_speed
+        last_time = now
+        with profiler.phase("simulate"):
+            if net is not None or net_handshake is not None:
+                accumulator = update_online(accumulator)
+            while accumulator >= SIM_DT:
+                simulate_tick()
+                accumulator -= SIM_DT
+
+        with profiler.phase("draw"):
+            draw_frame(accumulator / SIM_DT)
+            draw_profile_overlay()
+        with profiler.phase("display.flip"):
+            present_frame(dirty_scene=battle_start and not mode_select and not pokemon_select)
+        assets.mark_startup("first frame")
+        preloader.step()
+        if event_log is not None:
+            event_log.pump()
+        # The frame is measured up to here; the rest is waiting for the next one
+        profiler.end_frame()
+        clock.tick(RENDER_FPS)
         await asyncio.sleep(0)
 
-asyncio.run(main())
+assets.mark_startup("imported")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cyndaquil vs Chikorita vs Totodile.")
+    parser.add_argument("--replay", help="watch a recorded battle (replays are saved under replays/)")
+    parser.add_argument("--host", type=int, metavar="PORT", help="port to wait on for online opponents")
+    parser.add_argument("--join", metavar="HOST:PORT", help="play online against a host (or netplay.py relay)")
+    parser.add_argument("--broadcast", metavar="[HOST:]PORT", help="publish battles to a spectate.py hub")
+    args, _ = parser.parse_known_args()
+    if args.join:
+        net_options = {"remote": netplay.parse_address(args.join)}
+    elif args.host:
+        net_options = {"bind": ("", args.host)}
+    if args.broadcast and spectate.AVAILABLE:
+        broadcast = spectate.Publisher(spectate.parse_address(args.broadcast))
+    asyncio.run(main(args.replay))
 
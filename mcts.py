@@ -0,0 +1,313 @@
+"""Monte Carlo Tree Search AI.
+
+Decision nodes pick an action with UCT for the side to move; chance nodes
+sample a damage roll and keep one child per resulting state, so the tree
+can be reused when the real roll is known. Rollouts play both sides with
+battle.ai_action under the same rules as the game.
+
+While the GUI animates the last move the search keeps going below it
+("pondering" on the predicted next state). SearchProcess runs the whole
+thing in a worker process so the render loop keeps its frame rate, and
+root-parallel rollouts can be spread over a process pool with workers > 0.
+"""
+import math
+import multiprocessing
+import random
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import battle
+
+
+def state_key(state):
+    return (state.hp[0], state.hp[1], state.potions[0], state.potions[1], state.turn)
+
+
+class Decision:
+    __slots__ = ("key", "turn", "visits", "wins", "children", "untried")
+
+    def __init__(self, state, rng):
+        self.key = state_key(state)
+        self.turn = state.turn
+        self.visits = 0
+        self.wins = 0.0           # wins for side 0
+        self.children = {}        # action -> Chance
+        self.untried = [] if state.winner is not None else state.legal_actions()
+        rng.shuffle(self.untried)
+
+
+class Chance:
+    __slots__ = ("action", "visits", "wins", "outcomes")
+
+    def __init__(self, action):
+        self.action = action
+        self.visits = 0
+        self.wins = 0.0
+        self.outcomes = {}        # state key -> Decision
+
+
+class MCTSAI:
+    def __init__(self, time_budget=0.25, exploration=1.4, workers=0, seed=None):
+        self.time_budget = time_budget
+        self.exploration = exploration
+        self.workers = workers
+        self.rng = random.Random(seed)
+        self.root = None
+        self.root_state = None
+        self.focus = None           # chance node being pondered while its move animates
+        self.pool = None
+        self.stats = {"rollouts": 0, "rollouts_per_sec": 0.0, "max_depth": 0, "nodes": 0}
+
+    # --- Tree ---
+
+    def set_root(self, state):
+        """Move the root to state, reusing a matching subtree when there is one."""
+        if self.root_state is not None and self.root_state.names == state.names:
+            node = self.find(state_key(state))
+            if node is not None:
+                self.root = node
+                self.root_state = state.copy()
+                return
+        self.root = Decision(state, self.rng)
+        self.root_state = state.copy()
+        self.stats["nodes"] = 1
+
+    def find(self, key, max_plies=4):
+        level = [self.root]
+        for _ in range(max_plies + 1):
+            next_level = []
+            for node in level:
+                if node.key == key:
+                    return node
+                for chance in node.children.values():
+                    next_level.extend(chance.outcomes.values())
+            level = next_level
+        return None
+
+    def iterate(self, start=None):
+        """One selection/expansion/rollout/backup pass from the root (or a chance node under it)."""
+        rng = self.rng
+        state = self.root_state.copy()
+        path = [self.root]
+        node = self.root
+        if start is not None:
+            node = self.step_chance(start, state, path)
+        depth = 0
+
+        while state.winner is None:
+            if node.untried:
+                action = node.untried.pop()
+                chance = node.children[action] = Chance(action)
+                node = self.step_chance(chance, state, path)
+                depth += 1
+                break
+            chance = self.select(node)
+            node = self.step_chance(chance, state, path)
+            depth += 1
+
+        # Rollout with the normal AI for both sides
+        while state.winner is None:
+            battle.apply_action(state, battle.ai_action(state, state.turn, rng), rng)
+
+        result = 1.0 if state.winner == 0 else 0.0
+        for visited in path:
+            visited.visits += 1
+            visited.wins += result
+        self.stats["rollouts"] += 1
+        if depth > self.stats["max_depth"]:
+            self.stats["max_depth"] = depth
+
+    def step_chance(self, chance, state, path):
+        battle.apply_action(state, chance.action, self.rng)
+        key = state_key(state)
+        child = chance.outcomes.get(key)
+        if child is None:
+            child = chance.outcomes[key] = Decision(state, self.rng)
+            self.stats["nodes"] += 1
+        path.append(chance)
+        path.append(child)
+        return child
+
+    def select(self, node):
+        log_visits = math.log(node.visits or 1)
+        best = None
+        best_score = -1.0
+        for chance in node.children.values():
+            rate = chance.wins / chance.visits
+            if node.turn == 1:
+                rate = 1.0 - rate
+            score = rate + self.exploration * math.sqrt(log_visits / chance.visits)
+            if score > best_score:
+                best, best_score = chance, score
+        return best
+
+    # --- Search ---
+
+    def search(self, budget, start=None):
+        deadline = time.perf_counter() + budget
+        begin = self.stats["rollouts"]
+        started = time.perf_counter()
+        while time.perf_counter() < deadline:
+            for _ in range(16):
+                self.iterate(start)
+        elapsed = time.perf_counter() - started
+        if elapsed > 0:
+            self.stats["rollouts_per_sec"] = (self.stats["rollouts"] - begin) / elapsed
+
+    def choose(self, state, idx=None, budget=None):
+        """Best action for the side to move in state."""
+        self.stop_pondering()
+        self.set_root(state)
+        counts = {}
+        futures = []
+        if self.workers > 0:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(self.workers)
+            seeds = [self.rng.getrandbits(32) for _ in range(self.workers)]
+            futures = [self.pool.submit(root_visits, state, budget or self.time_budget, seed)
+                       for seed in seeds]
+        self.search(budget or self.time_budget)
+        for action, chance in self.root.children.items():
+            counts[action] = chance.visits
+        for future in futures:
+            for action, visits in future.result().items():
+                counts[action] = counts.get(action, 0) + visits
+        if not counts:
+            return state.legal_actions()[0]
+        return max(counts, key=counts.get)
+
+    # --- Pondering ---
+
+    def ponder(self, state, action):
+        """Search below `action` from `state` on ponder_step() calls until the next choose()."""
+        self.set_root(state)
+        focus = self.root.children.get(action)
+        if focus is None:
+            focus = self.root.children[action] = Chance(action)
+            if action in self.root.untried:
+                self.root.untried.remove(action)
+        self.focus = focus
+
+    def ponder_step(self, budget):
+        if self.focus is not None:
+            self.search(budget, self.focus)
+
+    def stop_pondering(self):
+        self.focus = None
+
+    def reset(self):
+        self.stop_pondering()
+        self.root = None
+        self.root_state = None
+
+    def close(self):
+        self.reset()
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+
+class SearchProcess:
+    """An MCTSAI running in its own process, driven over a pipe.
+
+    Rollouts are pure Python, so a search thread would hold the GIL against
+    the render loop; a process keeps the GUI at full frame rate. The tree
+    lives in the worker, so pondering and tree reuse work as in MCTSAI.
+    choose() blocks until the worker answers and is meant to be called off
+    the main thread.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+        self.process = None
+        self.conn = None
+        self.send_lock = threading.Lock()
+        # One choose() at a time, so each caller reads its own reply
+        self.choose_lock = threading.Lock()
+        self.stats = {"rollouts": 0, "rollouts_per_sec": 0.0, "max_depth": 0, "nodes": 0}
+
+    def send(self, *message):
+        with self.send_lock:
+            if self.process is None:
+                self.conn, child_conn = multiprocessing.Pipe()
+                self.process = multiprocessing.Process(target=serve, args=(child_conn, self.options), daemon=True)
+                self.process.start()
+            self.conn.send(message)
+
+    def choose(self, state, idx=None, budget=None):
+        with self.choose_lock:
+            self.send("choose", state, idx, budget)
+            action, self.stats = self.conn.recv()
+        return action
+
+    def ponder(self, state, action):
+        self.send("ponder", state, action)
+
+    def stop_pondering(self):
+        if self.process is not None:
+            self.send("stop")
+
+    def reset(self):
+        if self.process is not None:
+            self.send("reset")
+
+    def close(self):
+        if self.process is not None:
+            self.send("close")
+            self.process.join()
+            self.process = self.conn = None
+
+
+def serve(conn, options):
+    """Worker loop for SearchProcess: ponder between commands, answer choose()."""
+    # A forked child inherits SDL's SIGTERM handler; let terminate() work again
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    ai = MCTSAI(**options)
+    while True:
+        if ai.focus is not None and not conn.poll():
+            ai.ponder_step(0.02)
+            continue
+        command, *args = conn.recv()
+        if command == "choose":
+            conn.send((ai.choose(*args), ai.stats))
+        elif command == "ponder":
+            ai.ponder(*args)
+        elif command == "stop":
+            ai.stop_pondering()
+        elif command == "reset":
+            ai.reset()
+        else:
+            ai.close()
+            return
+
+
+def root_visits(state, budget, seed):
+    """Worker entry point: search a fresh tree and report the root's visit counts."""
+    ai = MCTSAI(time_budget=budget, seed=seed)
+    ai.set_root(state)
+    ai.search(budget)
+    return {action: chance.visits for action, chance in ai.root.children.items()}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Play MCTS (P2) against the normal AI.")
+    parser.add_argument("--games", type=int, default=30)
+    parser.add_argument("--budget", type=float, default=0.1, help="seconds per move")
+    parser.add_argument("--workers", type=int, default=0)
+    args = parser.parse_args()
+
+    ai = MCTSAI(time_budget=args.budget, workers=args.workers, seed=1)
+    rng = random.Random(1)
+    names = list(battle.POKEMON_STATS.keys())
+    wins = 0
+    for game in range(args.games):
+        result = battle.simulate_battle(names[game % len(names)], names[game // len(names) % len(names)],
+                                        ("ai", lambda state, idx, _: ai.choose(state, idx)), rng)
+        wins += result.winner == 1
+    ai.close()
+    print(f"MCTS as P2 won {wins}/{args.games}; {ai.stats['rollouts_per_sec']:.0f} rollouts/s, "
+          f"max depth {ai.stats['max_depth']}, {ai.stats['nodes']} nodes in the last tree")
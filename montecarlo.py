@@ -0,0 +1,150 @@
+"""Vectorized Monte Carlo matchup matrix.
+
+Runs many battles at once with NumPy arrays of HP, potions and turn state,
+using the same rules and policies as battle.py:
+
+    python montecarlo.py -n 1000000 --policies ai random greedy
+"""
+import argparse
+import itertools
+import time
+
+import numpy as np
+
+import battle
+
+
+class MoveTable:
+    """Damage bounds for one species' moves, indexed like battle.move_order()."""
+
+    def __init__(self, name):
+        stats = battle.POKEMON_STATS[name]
+        self.keys = battle.move_order(name)
+        self.low = np.array([stats["attacks"][k]["damage_range"][0] for k in self.keys], dtype=np.int16)
+        self.high = np.array([stats["attacks"][k]["damage_range"][1] for k in self.keys], dtype=np.int16)
+        self.potion = len(self.keys)   # action index used for potions
+        self.max_hp = stats["max_hp"]
+
+
+# --- Vectorized policies: (moves, hp, max_hp, potions, rng) -> action index per battle ---
+
+def ai_actions(moves, hp, max_hp, potions, rng):
+    weights = np.array([battle.AI_TACKLE_WEIGHT if k == "tackle" else battle.AI_MOVE_WEIGHT
+                        for k in moves.keys], dtype=np.float64)
+    actions = rng.choice(len(moves.keys), size=hp.shape[0], p=weights / weights.sum())
+    heal = (potions > 0) & (hp < max_hp * battle.AI_HEAL_THRESHOLD)
+    actions[heal] = moves.potion
+    return actions
+
+
+def random_actions(moves, hp, max_hp, potions, rng):
+    can_heal = (potions > 0) & (hp < max_hp)
+    choices = len(moves.keys) + can_heal
+    return (rng.random(hp.shape[0]) * choices).astype(np.int64)
+
+
+def greedy_actions(moves, hp, max_hp, potions, rng):
+    best = int(np.argmax(moves.low.astype(np.int32) + moves.high))
+    return np.full(hp.shape[0], best, dtype=np.int64)
+
+
+VECTOR_POLICIES = {
+    "ai": ai_actions,
+    "random": random_actions,
+    "greedy": greedy_actions,
+}
+
+
+def simulate_matchup(name1, name2, policies=("ai", "ai"), n=100000, rng=None, first_turn=0):
+    """Play n battles between name1 and name2 at once.
+
+    Returns (winner, turns) arrays: the index of the winning side and the
+    number of actions taken in each battle.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    tables = (MoveTable(name1), MoveTable(name2))
+    choose = [VECTOR_POLICIES[p] for p in policies]
+
+    hp = np.empty((2, n), dtype=np.int16)
+    hp[0] = battle.POKEMON_STATS[name1]["hp"]
+    hp[1] = battle.POKEMON_STATS[name2]["hp"]
+    potions = np.full((2, n), battle.POTION_COUNT, dtype=np.int8)
+    turn = np.full(n, first_turn, dtype=np.int8)
+    turns = np.zeros(n, dtype=np.int32)
+    winner = np.full(n, -1, dtype=np.int8)
+    active = np.arange(n)
+
+    while active.size:
+        for side in (0, 1):
+            idx = active[(turn[active] == side) & (winner[active] < 0)]
+            if not idx.size:
+                continue
+            moves = tables[side]
+            my_hp = hp[side, idx]
+            my_potions = potions[side, idx]
+            actions = choose[side](moves, my_hp, moves.max_hp, my_potions, rng)
+
+            heal = actions == moves.potion
+            healed = idx[heal]
+            potions[side, healed] -= 1
+            hp[side, healed] = np.minimum(hp[side, healed] + battle.POTION_HEAL, moves.max_hp)
+
+            hit = idx[~heal]
+            move = actions[~heal]
+            damage = rng.integers(moves.low[move], moves.high[move], endpoint=True, dtype=np.int16)
+            hp[1 - side, hit] = np.maximum(hp[1 - side, hit] - damage, 0)
+            winner[hit[hp[1 - side, hit] == 0]] = side
+
+            turn[idx] = 1 - side
+            turns[idx] += 1
+        active = active[winner[active] < 0]
+
+    return winner, turns
+
+
+def matchup_matrix(names=None, policies=("ai",), n=100000, seed=None):
+    """Win rate and mean turns for every species pairing and policy pairing.
+
+    Returns {(policy1, policy2): {(name1, name2): (p1_win_rate, mean_turns)}}.
+    """
+    if names is None:
+        names = list(battle.POKEMON_STATS.keys())
+    rng = np.random.default_rng(seed)
+    results = {}
+    for policy_pair in itertools.product(policies, repeat=2):
+        table = results[policy_pair] = {}
+        for pair in itertools.product(names, repeat=2):
+            winner, turns = simulate_matchup(pair[0], pair[1], policy_pair, n, rng)
+            table[pair] = (float(np.mean(winner == 0)), float(np.mean(turns)))
+    return results
+
+
+def format_matrix(names, table):
+    width = max(len(name) for name in names) + 2
+    lines = ["P1 \\ P2".ljust(width) + "".join(name.rjust(16) for name in names)]
+    for name1 in names:
+        cells = []
+        for name2 in names:
+            win_rate, mean_turns = table[(name1, name2)]
+            cells.append(f"{win_rate:6.1%} / {mean_turns:5.1f}".rjust(16))
+        lines.append(name1.ljust(width) + "".join(cells))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="P1 win rate / mean turns for every matchup.")
+    parser.add_argument("-n", "--battles", type=int, default=100000, help="battles per matchup")
+    parser.add_argument("--policies", nargs="+", default=["ai"], choices=sorted(VECTOR_POLICIES))
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    names = list(battle.POKEMON_STATS.keys())
+    start = time.perf_counter()
+    results = matchup_matrix(names, args.policies, args.battles, args.seed)
+    elapsed = time.perf_counter() - start
+    for (policy1, policy2), table in results.items():
+        print(f"\nP1 {policy1} vs P2 {policy2}  (P1 win rate / mean turns)")
+        print(format_matrix(names, table))
+    total = args.battles * len(names) ** 2 * len(args.policies) ** 2
+    print(f"\n{total} battles in {elapsed:.2f}s ({total / elapsed:.0f}/s)")
@@ -0,0 +1,467 @@
+"""Online versus over UDP with rollback.
+
+Each side runs the whole battle locally. Local input is applied on the next
+tick as in a local game; the opponent's input is predicted to be "nothing"
+and, when their packet turns out to carry an action for a tick we already
+simulated, the session restores the snapshot taken before that tick and
+re-simulates up to the present with the action in place. Battles are
+turn-based, so a misprediction only ever delays the opponent's move by the
+one-way latency: at 100+ ms the local side still responds on the next tick.
+
+Packets are tiny and sent every frame. Each carries the sender's latest
+tick (its input is final up to there), an ack of ours, every input we have
+not acked yet (so lost packets need no retransmit logic), the checksum of
+the sender's latest final tick for desync detection, and its frame
+advantage for time sync.
+
+    python main.py --host 7777                 # wait for an opponent
+    python main.py --join 192.168.1.5:7777     # play against them
+    python netplay.py relay --port 7777 --latency-ms 150 --jitter-ms 20 --loss 0.05
+    python netplay.py selftest --latency-ms 150 --loss 0.05
+
+The relay forwards between the first two peers that talk to it with the
+given delay, jitter and loss; two clients that both --join it play each
+other. selftest runs a relay and two headless bot clients and checks that
+both ended with the same battle.
+
+Packet layout (little-endian):
+    hello:  magic, type, version, nonce, pokemon name, seen-your-hello flag
+    input:  magic, type, tick, ack, checksum tick, checksum, advantage, count,
+            then count x (tick uint32, action index uint8)
+    bye:    magic, type
+"""
+import argparse
+import heapq
+import json
+import os
+import random
+import select
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+from replay import action_index, action_key
+
+AVAILABLE = sys.platform != "emscripten"   # no UDP sockets in the browser
+
+MAGIC = b"PK"
+VERSION = 1
+HELLO, INPUT, BYE = 1, 2, 3
+HELLO_PACKET = struct.Struct("<2sBBQ16sB")
+INPUT_HEADER = struct.Struct("<2sBIIIIbB")
+INPUT_ENTRY = struct.Struct("<IB")
+BYE_PACKET = struct.Struct("<2sB")
+DEFAULT_PORT = 7777
+MAX_ROLLBACK = 60      # ticks; the local side waits rather than run further ahead
+HELLO_INTERVAL = 0.1
+TIMEOUT = 5.0
+
+
+def parse_address(text, default_host=""):
+    host, _, port = text.rpartition(":")
+    return (host or default_host, int(port or DEFAULT_PORT))
+
+
+class Peer:
+    """Non-blocking UDP endpoint; a host learns the remote address from the first packet."""
+
+    def __init__(self, bind=None, remote=None):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        if bind is not None:
+            self.sock.bind(bind)
+        self.remote = remote
+        self.last_heard = time.monotonic()
+
+    def send(self, data):
+        if self.remote is not None:
+            try:
+                self.sock.sendto(data, self.remote)
+            except OSError:
+                pass
+
+    def receive(self):
+        packets = []
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                # e.g. ICMP port unreachable while the other side is not up yet
+                continue
+            if self.remote is None:
+                self.remote = addr
+            elif addr != self.remote:
+                continue
+            self.last_heard = time.monotonic()
+            packets.append(data)
+        return packets
+
+    @property
+    def timed_out(self):
+        return time.monotonic() - self.last_heard > TIMEOUT
+
+    def close(self):
+        for _ in range(3):
+            self.send(BYE_PACKET.pack(MAGIC, BYE))
+        self.sock.close()
+
+
+def packet_type(data):
+    if len(data) < BYE_PACKET.size or data[:2] != MAGIC:
+        return None
+    return data[2]
+
+
+class Handshake:
+    """Swap hellos until both sides have seen each other.
+
+    The side with the smaller random nonce plays player 1 and its nonce is
+    the battle seed, so both sides agree without a host/guest distinction.
+    """
+
+    def __init__(self, peer, name):
+        self.peer = peer
+        self.name = name
+        self.nonce = int.from_bytes(os.urandom(8), "little") >> 1
+        self.remote = None          # (nonce, name)
+        self.seen_by_remote = False
+        self.next_hello = 0.0
+
+    def poll(self):
+        """Returns (local player, names, seed) once the handshake is done, else None."""
+        for data in self.peer.receive():
+            kind = packet_type(data)
+            if kind == HELLO and len(data) >= HELLO_PACKET.size:
+                _, _, version, nonce, name, seen = HELLO_PACKET.unpack_from(data)
+                if version == VERSION:
+                    self.remote = (nonce, name.rstrip(b"\0").decode())
+                    self.seen_by_remote = self.seen_by_remote or bool(seen)
+            elif kind == INPUT:
+                # They already started, so our hello got through
+                self.seen_by_remote = True
+        now = time.monotonic()
+        if now >= self.next_hello:
+            self.peer.send(HELLO_PACKET.pack(MAGIC, HELLO, VERSION, self.nonce, self.name.encode(),
+                                             self.remote is not None))
+            self.next_hello = now + HELLO_INTERVAL
+        if self.remote is None or not self.seen_by_remote:
+            return None
+        remote_nonce, remote_name = self.remote
+        local_player = 0 if self.nonce < remote_nonce else 1
+        names = (self.name, remote_name) if local_player == 0 else (remote_name, self.name)
+        return local_player, names, min(self.nonce, remote_nonce)
+
+
+class RollbackSession:
+    """Rollback over a Peer. The game supplies four callbacks:
+
+    save() -> snapshot of the state before a tick, load(snapshot),
+    advance(inputs, resimulating) runs one tick with [(player, action)] applied
+    at its start, and checksum() of the state after a tick.
+    """
+
+    def __init__(self, peer, local_player, names, seed, save, load, advance, checksum,
+                 max_rollback=MAX_ROLLBACK):
+        self.peer = peer
+        self.local_player = local_player
+        self.remote_player = 1 - local_player
+        self.names = names
+        self.seed = seed
+        self.save = save
+        self.load = load
+        self.advance = advance
+        self.checksum = checksum
+        self.max_rollback = max_rollback
+        self.tick = 0                # last simulated tick
+        self.inputs = ({}, {})       # per player: tick -> action
+        self.remote_tick = 0         # the remote's input is final up to here
+        self.acked = 0               # the remote has our input up to here
+        self.remote_advantage = 0
+        self.snapshots = {}          # tick -> state before it ran
+        self.checksums = {}          # tick -> state checksum after it ran
+        self.remote_checksums = {}
+        self.rollback_from = None    # earliest tick to re-simulate
+        self.desync = None           # first tick whose checksums differed
+        self.remote_left = False
+        self.stats = {"rollbacks": 0, "max_depth": 0, "resimulated": 0, "stalls": 0,
+                      "rollback_ms_max": 0.0}
+
+    def add_local_input(self, action):
+        # Applied on the next tick, like local input in a local game
+        self.inputs[self.local_player].setdefault(self.tick + 1, action)
+
+    @property
+    def timed_out(self):
+        return self.peer.timed_out
+
+    @property
+    def final_tick(self):
+        """Ticks up to here will not be rolled back again."""
+        return min(self.tick, self.remote_tick)
+
+    def receive(self):
+        remote_inputs = self.inputs[self.remote_player]
+        remote_name = self.names[self.remote_player]
+        for data in self.peer.receive():
+            kind = packet_type(data)
+            if kind == BYE:
+                self.remote_left = True
+            if kind != INPUT or len(data) < INPUT_HEADER.size:
+                continue
+            _, _, tick, ack, checksum_tick, checksum, advantage, count = INPUT_HEADER.unpack_from(data)
+            if len(data) < INPUT_HEADER.size + count * INPUT_ENTRY.size:
+                continue
+            for i in range(count):
+                input_tick, index = INPUT_ENTRY.unpack_from(data, INPUT_HEADER.size + i * INPUT_ENTRY.size)
+                if input_tick in remote_inputs or input_tick <= self.remote_tick:
+                    continue
+                remote_inputs[input_tick] = action_key(remote_name, index)
+                if input_tick <= self.tick and (self.rollback_from is None or input_tick < self.rollback_from):
+                    self.rollback_from = input_tick
+            if tick > self.remote_tick:
+                self.remote_tick = tick
+                self.remote_advantage = advantage
+            self.acked = max(self.acked, ack)
+            if checksum_tick:
+                self.remote_checksums[checksum_tick] = checksum
+
+    def inputs_at(self, tick):
+        return [(player, self.inputs[player][tick]) for player in (0, 1) if tick in self.inputs[player]]
+
+    def rollback(self):
+        start = time.perf_counter()
+        first, self.rollback_from = self.rollback_from, None
+        self.load(self.snapshots[first])
+        for tick in range(first, self.tick + 1):
+            if tick != first:
+                self.snapshots[tick] = self.save()
+            self.advance(self.inputs_at(tick), True)
+            self.checksums[tick] = self.checksum()
+        depth = self.tick - first + 1
+        stats = self.stats
+        stats["rollbacks"] += 1
+        stats["resimulated"] += depth
+        stats["max_depth"] = max(stats["max_depth"], depth)
+        stats["rollback_ms_max"] = max(stats["rollback_ms_max"], (time.perf_counter() - start) * 1000)
+
+    def step(self):
+        self.tick += 1
+        self.snapshots[self.tick] = self.save()
+        self.advance(self.inputs_at(self.tick), False)
+        self.checksums[self.tick] = self.checksum()
+
+    def update(self, ticks):
+        """Receive, roll back if needed, run up to ticks new ticks and send our state."""
+        self.receive()
+        if self.rollback_from is not None:
+            self.rollback()
+        # Time sync: when we run ahead of the remote, give it a tick to catch up
+        if ticks and (self.tick - self.remote_tick) - self.remote_advantage >= 4:
+            ticks -= 1
+            self.stats["stalls"] += 1
+        for _ in range(ticks):
+            if self.tick - self.remote_tick >= self.max_rollback:
+                self.stats["stalls"] += 1
+                break
+            self.step()
+        self.check_sync()
+        self.prune()
+        self.send()
+
+    def check_sync(self):
+        final = self.final_tick
+        for tick in [tick for tick in self.remote_checksums if tick <= final]:
+            checksum = self.remote_checksums.pop(tick)
+            if tick in self.checksums and checksum != self.checksums[tick] and self.desync is None:
+                self.desync = tick
+
+    def prune(self):
+        # Rollbacks only reach ticks after remote_tick; checksums are kept a while
+        # longer for the remote's (possibly older) final tick to compare against
+        for tick in [tick for tick in self.snapshots if tick <= self.remote_tick]:
+            del self.snapshots[tick]
+        horizon = self.final_tick - 4 * self.max_rollback
+        for tick in [tick for tick in self.checksums if tick < horizon]:
+            del self.checksums[tick]
+
+    def send(self):
+        name = self.names[self.local_player]
+        entries = [INPUT_ENTRY.pack(tick, action_index(name, action))
+                   for tick, action in self.inputs[self.local_player].items() if self.acked < tick <= self.tick]
+        final = self.final_tick
+        advantage = max(-128, min(127, self.tick - self.remote_tick))
+        self.peer.send(INPUT_HEADER.pack(MAGIC, INPUT, self.tick, self.remote_tick, final,
+                                         self.checksums.get(final, 0), advantage, len(entries)) + b"".join(entries))
+
+    def close(self):
+        self.peer.close()
+
+
+# --- Loopback relay ---
+
+class Relay:
+    """Forwards datagrams between the first two peers that talk to it.
+
+    Each direction is delayed by half the round-trip latency plus up to
+    jitter (which can reorder packets), and a loss fraction is dropped.
+    """
+
+    def __init__(self, port=DEFAULT_PORT, latency=0.0, jitter=0.0, loss=0.0, seed=None):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", port))
+        self.port = self.sock.getsockname()[1]
+        self.delay = latency / 2
+        self.jitter = jitter
+        self.loss = loss
+        self.rng = random.Random(seed)
+        self.peers = []
+        self.queue = []       # (deliver at, sequence, data, address)
+        self.sequence = 0
+        self.stop = threading.Event()
+
+    def serve(self):
+        while not self.stop.is_set():
+            now = time.monotonic()
+            while self.queue and self.queue[0][0] <= now:
+                _, _, data, addr = heapq.heappop(self.queue)
+                self.sock.sendto(data, addr)
+            timeout = min(0.01, max(0.0, self.queue[0][0] - now)) if self.queue else 0.01
+            if not select.select([self.sock], [], [], timeout)[0]:
+                continue
+            try:
+                data, addr = self.sock.recvfrom(2048)
+            except OSError:
+                continue
+            if addr not in self.peers:
+                if len(self.peers) == 2:
+                    continue
+                self.peers.append(addr)
+            if len(self.peers) < 2 or self.rng.random() < self.loss:
+                continue
+            other = self.peers[1 - self.peers.index(addr)]
+            deliver = now + self.delay + self.rng.uniform(0, self.jitter)
+            self.sequence += 1
+            heapq.heappush(self.queue, (deliver, self.sequence, data, other))
+        self.sock.close()
+
+
+# --- Headless bot and self-test ---
+
+def run_bot(address, seed, max_seconds=120.0):
+    """Play one online battle headlessly with random moves; returns a summary of how it ended."""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    os.environ["POKEMON_RECORD_REPLAYS"] = "0"
+    import main
+
+    rng = random.Random(seed)
+    main.init_display()
+    main.net_options = {"remote": address}
+    main.mode_select = False
+    main.mode_selected = main.ONLINE_MODE
+    main.player_choices = [rng.randrange(len(main.player_choice_names)), 0]
+    main.start_online()
+
+    deadline = time.monotonic() + max_seconds
+    last = time.perf_counter()
+    accumulator = 0.0
+    finished_at = None
+    frame_ms = []
+    while time.monotonic() < deadline:
+        frame_start = time.perf_counter()
+        if main.battle_start and not main.players[0]:
+            main.start_battle()
+        session = main.net
+        if (session is not None and main.battle_state is not None and not main.game_over
+                and main.human_controls(main.turn) and main.action_lockout == 0 and not main.attacking
+                and rng.random() < 0.05):
+            main.queue_action(main.turn, rng.choice(main.battle_state.legal_actions(main.turn)))
+        now = time.perf_counter()
+        accumulator += min(now - last, main.MAX_FRAME_TIME)
+        last = now
+        accumulator = main.update_online(accumulator)
+        if session is not None:
+            frame_ms.append((time.perf_counter() - frame_start) * 1000)
+            if main.game_over and finished_at is None:
+                finished_at = time.monotonic()
+            # Keep exchanging packets for a moment so both sides see the end confirmed
+            if finished_at is not None and time.monotonic() - finished_at > 1.5:
+                break
+            if session.remote_left or session.timed_out:
+                break
+        time.sleep(max(0.0, main.SIM_DT - (time.perf_counter() - frame_start)))
+
+    session = main.net
+    if session is None:
+        return {"error": "no opponent"}
+    frame_ms.sort()
+    return {
+        "player": session.local_player,
+        "names": list(session.names),
+        "winner": main.battle_state.winner,
+        "hp": main.battle_state.hp,
+        "actions": [list(action) for action in main.recording.actions],
+        "checksum": main.recording.checksum,
+        "desync": session.desync,
+        "stats": session.stats,
+        "frame_ms_p99": frame_ms[len(frame_ms) * 99 // 100] if frame_ms else 0.0,
+    }
+
+
+def selftest(latency, jitter, loss, battles):
+    failures = 0
+    for battle_no in range(battles):
+        relay = Relay(0, latency, jitter, loss, seed=battle_no)
+        thread = threading.Thread(target=relay.serve, daemon=True)
+        thread.start()
+        command = [sys.executable, os.path.abspath(__file__), "bot", "--join", f"127.0.0.1:{relay.port}"]
+        bots = [subprocess.Popen(command + ["--seed", str(battle_no * 2 + i)], stdout=subprocess.PIPE, text=True)
+                for i in range(2)]
+        results = [json.loads(bot.communicate()[0].strip().splitlines()[-1]) for bot in bots]
+        relay.stop.set()
+        thread.join()
+
+        same = all(result.get("checksum") is not None for result in results) and \
+            results[0]["checksum"] == results[1]["checksum"] and results[0]["actions"] == results[1]["actions"]
+        ok = same and not any(result["desync"] for result in results) and results[0]["winner"] is not None
+        failures += not ok
+        first = results[0]
+        print(f"battle {battle_no + 1}: {' vs '.join(first.get('names', []))}, {len(first.get('actions', []))} actions, "
+              f"{'same result on both sides' if ok else 'MISMATCH'}")
+        for result in results:
+            stats = result.get("stats", {})
+            print(f"  player {result.get('player', 0) + 1}: {stats.get('rollbacks', 0)} rollbacks "
+                  f"(max {stats.get('max_depth', 0)} ticks, {stats.get('rollback_ms_max', 0):.1f} ms), "
+                  f"{stats.get('stalls', 0)} stalls, frame p99 {result.get('frame_ms_p99', 0):.1f} ms")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Online play tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    relay_cmd = commands.add_parser("relay", help="forward between two clients with simulated network conditions")
+    test_cmd = commands.add_parser("selftest", help="relay plus two headless bots; check both agree")
+    for command in (relay_cmd, test_cmd):
+        command.add_argument("--latency-ms", type=float, default=150.0, help="round trip")
+        command.add_argument("--jitter-ms", type=float, default=20.0)
+        command.add_argument("--loss", type=float, default=0.05)
+    relay_cmd.add_argument("--port", type=int, default=DEFAULT_PORT)
+    test_cmd.add_argument("--battles", type=int, default=3)
+    bot_cmd = commands.add_parser("bot", help="play one battle headlessly with random moves")
+    bot_cmd.add_argument("--join", required=True)
+    bot_cmd.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "relay":
+        relay = Relay(args.port, args.latency_ms / 1000, args.jitter_ms / 1000, args.loss)
+        print(f"relaying on 127.0.0.1:{relay.port}")
+        relay.serve()
+    elif args.command == "selftest":
+        sys.exit(1 if selftest(args.latency_ms / 1000, args.jitter_ms / 1000, args.loss, args.battles) else 0)
+    else:
+        print(json.dumps(run_bot(parse_address(args.join, "127.0.0.1"), args.seed)))
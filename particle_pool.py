@@ -0,0 +1,145 @@
+"""Struct-of-arrays particle pool.
+
+Particles live in parallel preallocated arrays instead of one dict each.
+Updates are vectorized with NumPy when it is installed (plain lists with
+swap-removal otherwise) and drawing is a single Surface.blits() call over
+pre-rendered circle sprites.
+"""
+import pygame
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class ParticlePool:
+    FIELDS = ("x", "y", "dx", "dy", "life", "style")
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.count = 0
+        self.styles = {}      # (color, radius) -> style index
+        self.style_info = []  # style index -> (color, radius)
+        self.sprites = []     # style index -> pre-rendered circle surface
+        if np is not None:
+            self.x = np.zeros(capacity, dtype=np.float32)
+            self.y = np.zeros(capacity, dtype=np.float32)
+            self.dx = np.zeros(capacity, dtype=np.float32)
+            self.dy = np.zeros(capacity, dtype=np.float32)
+            self.life = np.zeros(capacity, dtype=np.int32)
+            self.style = np.zeros(capacity, dtype=np.int32)
+        else:
+            for field in self.FIELDS:
+                setattr(self, field, [0] * capacity)
+
+    def __len__(self):
+        return self.count
+
+    def style_index(self, color, radius):
+        key = (tuple(color), radius)
+        index = self.styles.get(key)
+        if index is None:
+            index = self.styles[key] = len(self.style_info)
+            self.style_info.append(key)
+        return index
+
+    def grow(self):
+        self.capacity *= 2
+        for field in self.FIELDS:
+            values = getattr(self, field)
+            if np is not None:
+                bigger = np.zeros(self.capacity, dtype=values.dtype)
+                bigger[:self.count] = values[:self.count]
+            else:
+                bigger = values + [0] * (self.capacity - len(values))
+            setattr(self, field, bigger)
+
+    def add(self, x, y, dx, dy, life, color, radius):
+        if self.count == self.capacity:
+            self.grow()
+        i = self.count
+        self.x[i] = x
+        self.y[i] = y
+        self.dx[i] = dx
+        self.dy[i] = dy
+        self.life[i] = life
+        self.style[i] = self.style_index(color, radius)
+        self.count += 1
+
+    def clear(self):
+        self.count = 0
+
+    def update(self):
+        n = self.count
+        if not n:
+            return
+        if np is not None:
+            self.x[:n] += self.dx[:n]
+            self.y[:n] += self.dy[:n]
+            self.life[:n] -= 1
+            alive = self.life[:n] > 0
+            kept = int(alive.sum())
+            if kept != n:
+                # Compact the live particles to the front of every array
+                for field in self.FIELDS:
+                    values = getattr(self, field)
+                    values[:kept] = values[:n][alive]
+                self.count = kept
+            return
+
+        x, y, dx, dy, life, style = self.x, self.y, self.dx, self.dy, self.life, self.style
+        i = 0
+        while i < n:
+            life[i] -= 1
+            if life[i] <= 0:
+                # Swap the last particle into this slot
+                n -= 1
+                x[i], y[i], dx[i], dy[i], life[i], style[i] = x[n], y[n], dx[n], dy[n], life[n], style[n]
+                continue
+            x[i] += dx[i]
+            y[i] += dy[i]
+            i += 1
+        self.count = n
+
+    def sprite(self, style):
+        while len(self.sprites) <= style:
+            color, radius = self.style_info[len(self.sprites)]
+            surf = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
+            pygame.draw.circle(surf, color, (radius, radius), radius)
+            self.sprites.append(surf)
+        return self.sprites[style]
+
+    def draw(self, surface, alpha=1.0):
+        """Blit every particle; returns the bounding rect of what was drawn, or None.
+
+        alpha in [0, 1] places particles between their previous and current
+        positions for interpolated rendering.
+        """
+        n = self.count
+        if not n:
+            return None
+        for style in range(len(self.sprites), len(self.style_info)):
+            self.sprite(style)
+        sprites = self.sprites
+        radii = [info[1] for info in self.style_info]
+        max_radius = max(radii)
+        if np is not None:
+            offsets = np.array(radii, dtype=np.int32)[self.style[:n]]
+            back = np.float32(1 - alpha)
+            lefts = (self.x[:n] - self.dx[:n] * back).astype(np.int32) - offsets
+            tops = (self.y[:n] - self.dy[:n] * back).astype(np.int32) - offsets
+            bounds = (int(lefts.min()), int(tops.min()), int(lefts.max()), int(tops.max()))
+            positions = zip(lefts.tolist(), tops.tolist())
+            images = map(sprites.__getitem__, self.style[:n].tolist())
+        else:
+            styles = self.style[:n]
+            back = 1 - alpha
+            lefts = [int(x - dx * back) - radii[s] for x, dx, s in zip(self.x[:n], self.dx[:n], styles)]
+            tops = [int(y - dy * back) - radii[s] for y, dy, s in zip(self.y[:n], self.dy[:n], styles)]
+            bounds = (min(lefts), min(tops), max(lefts), max(tops))
+            positions = zip(lefts, tops)
+            images = map(sprites.__getitem__, styles)
+        surface.blits(zip(images, positions), doreturn=False)
+        left, top, right, bottom = bounds
+        return pygame.Rect(left, top, right - left + 2 * max_radius, bottom - top + 2 * max_radius)
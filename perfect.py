@@ -0,0 +1,258 @@
+"""Optimal policy for every battle state, precomputed into a lookup table.
+
+Each side maximises its own chance of winning. Every action either lowers
+the opponent's HP or spends a potion, so the state graph has no cycles and
+value iteration settles in a single bottom-up sweep over (potions0,
+potions1, hp0): one sweep per matchup gives the exact optimal action for
+every (turn, potions0, potions1, hp0, hp1). Building needs NumPy:
+
+    python perfect.py            # writes data/policy.bin
+
+The table file is memory-mapped by PolicyTable and read with plain byte
+indexing, so the game needs neither NumPy nor any search to use it. Actions
+are stored as indexes into battle.move_order() (len(moves) = potion),
+packed ACTION_BITS to a byte along the hp1 axis.
+
+File layout (little-endian):
+    header: magic, version, action bits, matchup count, potions
+    index:  per matchup name1, name2, max_hp0, max_hp1, data offset, rules digest;
+            sorted by (name1, name2) and binary-searched, so opening the table
+            costs the same for 3 species or 500
+    data:   packed actions[turn][potions0][potions1][hp0][hp1]
+"""
+import argparse
+import hashlib
+import json
+import os
+import struct
+import time
+
+import battle
+import roster
+
+try:
+    import mmap
+except ImportError:
+    mmap = None
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "policy.bin")
+MAGIC = b"PKPT"
+VERSION = 3
+ACTION_BITS = 2
+HEADER = struct.Struct("<4sHBIB")
+ENTRY = struct.Struct("<16s16sBBI16s")
+KEY_BYTES = 2 * roster.NAME_BYTES   # name1, name2: the sort key at the start of each entry
+MAX_DATA = 1 << 32       # data offsets are uint32
+
+
+def rules_digest(name1, name2):
+    """Hash of everything one matchup's policy depends on, so a stale entry is never used."""
+    rules = {"stats": [battle.POKEMON_STATS[name1], battle.POKEMON_STATS[name2]],
+             "heal": battle.POTION_HEAL, "potions": battle.POTION_COUNT}
+    return hashlib.sha1(json.dumps(rules, sort_keys=True).encode()).digest()[:16]
+
+
+def row_bytes(max_hp1, bits=ACTION_BITS):
+    per_byte = 8 // bits
+    return (max_hp1 + 1 + per_byte - 1) // per_byte
+
+
+# --- Solver ---
+
+def solve_policy(name1, name2):
+    """Optimal action index for every state, as a uint8 array [turn, p0, p1, hp0, hp1].
+
+    Also returns the values (P(side 0 wins) under optimal play by both sides).
+    """
+    import numpy as np
+    from montecarlo import MoveTable
+
+    tables = (MoveTable(name1), MoveTable(name2))
+    max0, max1 = tables[0].max_hp, tables[1].max_hp
+    pots = battle.POTION_COUNT + 1
+    size = int(max(t.high.max() for t in tables)) + 1
+    damages = np.arange(size)
+    h1s = np.arange(max1 + 1)
+    healed1 = np.minimum(h1s + battle.POTION_HEAL, max1)
+    shifted = np.maximum(h1s[:, None] - damages, 0)
+    # uniform[m, d] = P(move m rolls d)
+    uniform = []
+    for moves in tables:
+        pmf = np.zeros((len(moves.keys), size))
+        for m in range(len(moves.keys)):
+            pmf[m, moves.low[m]:moves.high[m] + 1] = 1.0 / (moves.high[m] - moves.low[m] + 1)
+        uniform.append(pmf)
+
+    value = np.zeros((2, pots, pots, max0 + 1, max1 + 1))
+    action = np.zeros(value.shape, dtype=np.uint8)
+    for p0 in range(pots):
+        for p1 in range(pots):
+            value[:, p0, p1, 1:, 0] = 1.0
+            for h0 in range(1, max0 + 1):
+                # Side 1 to move minimises side 0's chance
+                rows = value[0, p0, p1][np.maximum(h0 - damages, 0)]       # (damage, hp1)
+                options = uniform[1] @ rows                                # (move, hp1)
+                potion = np.full(max1 + 1, np.inf)
+                if p1:
+                    potion = np.where(h1s < max1, value[0, p0, p1 - 1, h0, healed1], np.inf)
+                options = np.vstack((options, potion))
+                action[1, p0, p1, h0] = options.argmin(axis=0)
+                value[1, p0, p1, h0, 1:] = options.min(axis=0)[1:]
+
+                # Side 0 to move maximises it
+                row = value[1, p0, p1, h0][shifted]                        # (hp1, damage)
+                options = uniform[0] @ row.T                               # (move, hp1)
+                potion = np.full(max1 + 1, -np.inf)
+                if p0 and h0 < max0:
+                    potion = value[1, p0 - 1, p1, min(h0 + battle.POTION_HEAL, max0)].copy()
+                options = np.vstack((options, potion))
+                action[0, p0, p1, h0] = options.argmax(axis=0)
+                value[0, p0, p1, h0, 1:] = options.max(axis=0)[1:]
+    return action, value
+
+
+def pack(action):
+    """Pack the hp1 axis ACTION_BITS per action, lowest bits first."""
+    import numpy as np
+
+    per_byte = 8 // ACTION_BITS
+    width = action.shape[-1]
+    padded = np.zeros(action.shape[:-1] + (row_bytes(width - 1) * per_byte,), dtype=np.uint8)
+    padded[..., :width] = action
+    grouped = padded.reshape(action.shape[:-1] + (-1, per_byte))
+    packed = np.zeros(grouped.shape[:-1], dtype=np.uint8)
+    for slot in range(per_byte):
+        packed |= grouped[..., slot] << (slot * ACTION_BITS)
+    return packed
+
+
+def build(path=TABLE_PATH, names=None):
+    if names is None:
+        names = list(battle.POKEMON_STATS.keys())
+    pairs = sorted((a, b) for a in names for b in names)
+    blocks = []
+    for name1, name2 in pairs:
+        action, _ = solve_policy(name1, name2)
+        if action.max() >= 1 << ACTION_BITS:
+            raise ValueError(f"{name1} vs {name2} needs more than {ACTION_BITS} bits per action")
+        blocks.append(pack(action).tobytes())
+
+    offset = HEADER.size + ENTRY.size * len(pairs)
+    if offset + sum(len(block) for block in blocks) > MAX_DATA:
+        raise ValueError(f"a full table for {len(names)} species does not fit in {MAX_DATA >> 30} GiB; "
+                         "pass names= to build it for a subset")
+    entries = []
+    for (name1, name2), block in zip(pairs, blocks):
+        entries.append(ENTRY.pack(name1.encode(), name2.encode(), battle.POKEMON_STATS[name1]["max_hp"],
+                                  battle.POKEMON_STATS[name2]["max_hp"], offset, rules_digest(name1, name2)))
+        offset += len(block)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, ACTION_BITS, len(pairs), battle.POTION_COUNT))
+        f.write(b"".join(entries))
+        f.write(b"".join(blocks))
+    os.replace(tmp_path, path)
+    return offset
+
+
+# --- Lookup ---
+
+class PolicyTable:
+    """Memory-mapped optimal-action table; action() is one byte read."""
+
+    def __init__(self, data):
+        self.data = data
+        magic, version, bits, count, potions = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a policy table")
+        if potions != battle.POTION_COUNT:
+            raise ValueError("policy table was built for different rules; rerun perfect.py")
+        self.bits = bits
+        self.per_byte = 8 // bits
+        self.mask = (1 << bits) - 1
+        self.pots = potions + 1
+        self.count = count
+        self.matchups = {}    # (name1, name2) -> (offset, max_hp0, bytes per hp1 row), once looked up
+        self.checked = {}     # (name1, name2) -> entry matches the current stats
+
+    def find(self, names):
+        """Index entry for a matchup, by binary search over the sorted index; None if absent."""
+        key = b"".join(name.encode().ljust(roster.NAME_BYTES, b"\0") for name in names)
+        if len(key) != KEY_BYTES:
+            return None
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            start = HEADER.size + mid * ENTRY.size
+            entry = bytes(self.data[start:start + KEY_BYTES])
+            if entry == key:
+                return ENTRY.unpack_from(self.data, start)
+            if entry < key:
+                low = mid + 1
+            else:
+                high = mid
+        return None
+
+    def covers(self, names):
+        """True if the table has this matchup, built for the current stats of both species."""
+        if names not in self.checked:
+            entry = self.find(names)
+            # Only the two species are decoded, the first time the matchup is played
+            self.checked[names] = entry is not None and all(name in battle.POKEMON_STATS for name in names) \
+                and entry[5] == rules_digest(*names)
+            if self.checked[names]:
+                _, _, max0, max1, offset, _ = entry
+                self.matchups[names] = (offset, max0, row_bytes(max1, self.bits))
+        return self.checked[names]
+
+    @classmethod
+    def load(cls, path=TABLE_PATH):
+        """Map the table file, or return None if it is missing or stale."""
+        try:
+            with open(path, "rb") as f:
+                try:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (AttributeError, OSError, ValueError):
+                    # No mmap on this platform (web build): read it instead
+                    data = f.read()
+            return cls(data)
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def action_index(self, names, turn, potions0, potions1, hp0, hp1):
+        if names not in self.matchups and not self.covers(names):
+            raise KeyError(names)
+        offset, max0, row = self.matchups[names]
+        index = offset + (((turn * self.pots + potions0) * self.pots + potions1) * (max0 + 1) + hp0) * row
+        byte = self.data[index + hp1 // self.per_byte]
+        return (byte >> (hp1 % self.per_byte * self.bits)) & self.mask
+
+    def action(self, state, idx=None, rng=None):
+        """Optimal action key for the side to move; usable as a battle.py policy."""
+        index = self.action_index(state.names, state.turn, state.potions[0], state.potions[1],
+                                  state.hp[0], state.hp[1])
+        moves = battle.move_order(state.names[state.turn])
+        return moves[index] if index < len(moves) else "potion"
+
+
+if __name__ == "__main__":
+    import random
+
+    parser = argparse.ArgumentParser(description="Build the optimal-policy table and check it against the normal AI.")
+    parser.add_argument("--out", default=TABLE_PATH)
+    parser.add_argument("--games", type=int, default=3000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    size = build(args.out)
+    print(f"wrote {args.out}: {size} bytes in {time.perf_counter() - start:.1f}s")
+
+    table = PolicyTable.load(args.out)
+    rng = random.Random(1)
+    names = list(battle.POKEMON_STATS.keys())
+    wins = 0
+    for game in range(args.games):
+        result = battle.simulate_battle(names[game % len(names)], names[game // len(names) % len(names)],
+                                        ("ai", table.action), rng)
+        wins += result.winner == 1
+    print(f"perfect policy as P2 won {wins}/{args.games} ({wins / args.games:.1%}) against the normal AI")
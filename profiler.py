@@ -0,0 +1,103 @@
+"""Per-phase frame profiler.
+
+Phases of the main loop are timed with `with profiler.phase("name"):`.
+A phase may run several times in a frame (text rendering does); its time
+is summed per frame. Per-frame totals go into fixed-size ring buffers for
+p50/p99 readouts, and every span is also kept, in a bounded buffer, as a
+Chrome trace event. export_trace() writes those events to a JSON file that
+chrome://tracing or https://ui.perfetto.dev can open.
+
+When the profiler is disabled, phase() returns a shared no-op context,
+so leaving the calls in the loop costs almost nothing.
+"""
+import json
+import os
+import time
+from collections import deque
+from contextlib import nullcontext
+
+NULL_SPAN = nullcontext()
+
+
+class Span:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        self.profiler.record(self.name, self.start, end)
+        return False
+
+
+class Profiler:
+    def __init__(self, enabled=False, frames=600, max_events=100000):
+        self.enabled = enabled
+        self.frames = frames
+        self.rings = {}          # phase -> deque of per-frame totals (seconds)
+        self.events = deque(maxlen=max_events)
+        self.current = {}        # phase -> seconds so far this frame
+        self.frame_start = None
+        self.origin = time.perf_counter()
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.current = {}
+        self.frame_start = None
+
+    def phase(self, name):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name)
+
+    def record(self, name, start, end):
+        self.current[name] = self.current.get(name, 0.0) + (end - start)
+        self.events.append((name, start, end))
+
+    def begin_frame(self):
+        if self.enabled:
+            self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        if not self.enabled or self.frame_start is None:
+            return
+        end = time.perf_counter()
+        self.record("frame", self.frame_start, end)
+        for name, ring in self.rings.items():
+            if name not in self.current:
+                ring.append(0.0)
+        for name, total in self.current.items():
+            ring = self.rings.get(name)
+            if ring is None:
+                ring = self.rings[name] = deque(maxlen=self.frames)
+            ring.append(total)
+        self.current = {}
+        self.frame_start = None
+
+    def percentiles(self, name, points=(50, 99)):
+        """Per-frame time of a phase at each percentile, in milliseconds."""
+        values = sorted(self.rings.get(name, ()))
+        if not values:
+            return tuple(0.0 for _ in points)
+        return tuple(values[min(len(values) - 1, len(values) * p // 100)] * 1000 for p in points)
+
+    def summary(self):
+        """[(phase, p50 ms, p99 ms)], the whole frame first, then the slowest phases by p99."""
+        rows = [(name,) + self.percentiles(name) for name in self.rings if name != "frame"]
+        rows.sort(key=lambda row: -row[2])
+        return [("frame",) + self.percentiles("frame")] + rows
+
+    def export_trace(self, path):
+        """Write the buffered spans as Chrome trace-event JSON."""
+        events = [{"name": name, "ph": "X", "pid": os.getpid(), "tid": 1,
+                   "ts": (start - self.origin) * 1e6, "dur": (end - start) * 1e6}
+                  for name, start, end in self.events]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return len(events)
@@ -0,0 +1,192 @@
+"""Seeded battle replays.
+
+Everything that decides a battle's outcome draws from per-battle random
+streams derived from one seed: damage rolls from one, the AI's pick of
+opponent and its move choices from another. Particles, projectile wobble
+and the background keep using the global random module, so eye candy can
+never shift a damage roll. The GUI applies every action, human or AI, at
+the start of a sim tick, so a battle is fully determined by its seed, its
+setup and the list of (tick, player, action).
+
+A replay file stores just that, plus a CRC of the battle state after every
+action and hit. Playback recomputes the CRC to show that it matched the
+recorded session exactly:
+
+    python main.py --replay replays/FILE.pkr      # watch it in the window
+    python replay.py replays/*.pkr                # headless, as fast as the sim runs
+
+File layout (little-endian):
+    header:  magic, version, matchup digest, seed, mode, difficulty, first turn,
+             name1, name2, winner (255 = none), end tick, checksum, action count
+    actions: per action tick (uint32), player (uint8), action index (uint8);
+             indexes are into battle.move_order(), len(moves) = potion
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import struct
+import sys
+import time
+import zlib
+
+import battle
+
+MAGIC = b"PKRP"
+VERSION = 2
+HEADER = struct.Struct("<4sH16sQBBB16s16sBIII")
+ACTION = struct.Struct("<IBB")
+STATE = struct.Struct("<IhhBBB")
+NO_WINNER = 255
+
+
+def new_seed():
+    return int.from_bytes(os.urandom(8), "little")
+
+
+def streams(seed):
+    """(damage rng, ai rng) for a battle; string seeds hash the same on every run."""
+    return random.Random(f"{seed}:damage"), random.Random(f"{seed}:ai")
+
+
+def matchup_digest(names):
+    """Hash of the two species' stats and the potion rules; changes to other species keep replays valid."""
+    rules = {"stats": [battle.POKEMON_STATS[name] for name in names],
+             "heal": battle.POTION_HEAL, "potions": battle.POTION_COUNT}
+    return hashlib.sha1(json.dumps(rules, sort_keys=True).encode()).digest()[:16]
+
+
+def action_index(name, action):
+    moves = battle.move_order(name)
+    return len(moves) if action == "potion" else moves.index(action)
+
+
+def action_key(name, index):
+    moves = battle.move_order(name)
+    return moves[index] if index < len(moves) else "potion"
+
+
+class Replay:
+    """Setup, inputs and state checksum of one battle."""
+    __slots__ = ("seed", "names", "mode", "difficulty", "first_turn", "actions", "winner", "end_tick", "checksum")
+
+    def __init__(self, seed, names, mode=0, difficulty=0, first_turn=0):
+        self.seed = seed
+        self.names = tuple(names)
+        self.mode = mode
+        self.difficulty = difficulty
+        self.first_turn = first_turn
+        self.actions = []     # (battle tick, player, action key)
+        self.winner = None
+        self.end_tick = 0
+        self.checksum = 0
+
+    def record(self, tick, player, action):
+        self.actions.append((tick, player, action))
+
+    def note(self, tick, state):
+        """Fold the battle state into the checksum; called after every action and hit."""
+        self.checksum = zlib.crc32(STATE.pack(tick, state.hp[0], state.hp[1], state.potions[0],
+                                              state.potions[1], state.turn), self.checksum)
+
+    def finish(self, tick, winner):
+        self.end_tick = tick
+        self.winner = winner
+
+    def matches(self, other):
+        return (self.checksum, self.winner, self.end_tick, self.actions) == \
+               (other.checksum, other.winner, other.end_tick, other.actions)
+
+    def to_bytes(self):
+        winner = NO_WINNER if self.winner is None else self.winner
+        header = HEADER.pack(MAGIC, VERSION, matchup_digest(self.names), self.seed, self.mode, self.difficulty,
+                             self.first_turn, self.names[0].encode(), self.names[1].encode(), winner,
+                             self.end_tick, self.checksum, len(self.actions))
+        body = b"".join(ACTION.pack(tick, player, action_index(self.names[player], action))
+                        for tick, player, action in self.actions)
+        return header + body
+
+    @classmethod
+    def from_bytes(cls, data):
+        (magic, version, digest, seed, mode, difficulty, first_turn, name1, name2, winner,
+         end_tick, checksum, count) = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a replay file")
+        names = (name1.rstrip(b"\0").decode(), name2.rstrip(b"\0").decode())
+        if any(name not in battle.POKEMON_STATS for name in names):
+            raise ValueError("replay uses a species missing from the roster")
+        if digest != matchup_digest(names):
+            raise ValueError("replay was recorded with different stats")
+        replay = cls(seed, names, mode, difficulty, first_turn)
+        for i in range(count):
+            tick, player, index = ACTION.unpack_from(data, HEADER.size + i * ACTION.size)
+            replay.actions.append((tick, player, action_key(names[player], index)))
+        replay.finish(end_tick, None if winner == NO_WINNER else winner)
+        replay.checksum = checksum
+        return replay
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, time.strftime("%Y%m%d-%H%M%S") + f"-{self.seed & 0xffffffff:08x}.pkr")
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+class Playback:
+    """Feeds a replay's actions back in on the ticks they were recorded at."""
+
+    def __init__(self, replay):
+        self.replay = replay
+        self.next = 0
+
+    def due(self, tick):
+        actions = self.replay.actions
+        start = self.next
+        while self.next < len(actions) and actions[self.next][0] <= tick:
+            self.next += 1
+        return [(player, action) for _, player, action in actions[start:self.next]]
+
+
+# --- Headless playback ---
+
+def play_headless(replay):
+    """Run a replay through main's own sim loop without drawing; returns the new recording."""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    import main
+
+    # Sprites are needed for projectile placement, so a (dummy) display is opened
+    main.init_display()
+    main.start_playback(replay)
+    main.start_battle()
+    while main.battle_ticks < replay.end_tick:
+        main.simulate_tick()
+    main.recording.finish(main.battle_ticks, main.battle_state.winner)
+    return main.recording
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play replays back headlessly and check they match.")
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+
+    failed = 0
+    for path in args.files:
+        recorded = Replay.load(path)
+        start = time.perf_counter()
+        result = play_headless(recorded)
+        elapsed = time.perf_counter() - start
+        ok = result.matches(recorded)
+        failed += not ok
+        winner = "none" if result.winner is None else recorded.names[result.winner]
+        print(f"{path}: {' vs '.join(recorded.names)}, {len(recorded.actions)} actions, "
+              f"{recorded.end_tick} ticks in {elapsed * 1000:.0f} ms, winner {winner}: "
+              f"{'OK' if ok else 'MISMATCH'}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,388 @@
+"""Species and moves, compiled from data files into an indexed binary.
+
+The roster is edited as JSON under data/roster/ (species.json lists the
+species in selection order, moves.json the moves they reference) and
+compiled at build time, with validation, into data/roster.bin:
+
+    python roster.py              # validate data/roster/*.json and write data/roster.bin
+    python roster.py --check      # validate only
+
+The game memory-maps the binary and decodes a species only when it is first
+used. Species records have a fixed size and a name-sorted index sits next
+to them, so opening the roster, finding a species by position or by name
+and listing a page of names cost the same for 3 species or 500. The game
+trusts the binary and never reads the JSON, which does not need to ship;
+the build step checks it against the sources and rewrites it when they
+change (--check fails on a stale binary). POKEMON_ROSTER=path uses another
+compiled roster; POKEMON_ROSTER_DEV=1 compiles data/roster/ in memory when
+the binary is missing or stale, so edits show up without a rebuild.
+
+File layout (little-endian):
+    header:  magic, version, species count, move count, sources digest
+    species: per species name, hp, max_hp, move count, 3 move ids,
+             sprite path (string offset, length), color (r, g, b)
+    index:   per species name, species id; sorted by name
+    moves:   per move key (string offset, length), name (offset, length),
+             type (index into MOVE_TYPES), min damage, max damage
+    strings: UTF-8 text referenced by the records above
+"""
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import time
+from collections.abc import Mapping, Sequence
+
+try:
+    import mmap
+except ImportError:
+    mmap = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SPECIES_SOURCE = os.path.join(ROOT, "data", "roster", "species.json")
+MOVES_SOURCE = os.path.join(ROOT, "data", "roster", "moves.json")
+SOURCES = (SPECIES_SOURCE, MOVES_SOURCE)
+ROSTER_PATH = os.path.join(ROOT, "data", "roster.bin")
+
+MAGIC = b"PKRS"
+VERSION = 1
+HEADER = struct.Struct("<4sHHH16s")
+SPECIES = struct.Struct("<16sBBB3HIB3B")
+NAME = struct.Struct("<16sH")
+MOVE = struct.Struct("<IBIBBBB")
+
+NAME_BYTES = 16          # replays, the policy table and the spectator feed store names in 16 bytes
+MAX_MOVES = 3            # one battle button each, next to the potion
+MOVE_TYPES = ("fire", "leaf", "water", "physical")   # what main.py has projectiles and sounds for
+SPECIES_FIELDS = {"name", "hp", "max_hp", "moves", "sprite", "color"}
+MOVE_FIELDS = {"name", "type", "damage_range"}
+
+
+# --- Building ---
+
+def read_sources(species_path=SPECIES_SOURCE, moves_path=MOVES_SOURCE):
+    with open(species_path) as f:
+        species = json.load(f)
+    with open(moves_path) as f:
+        moves = json.load(f)
+    if not isinstance(species, list) or not isinstance(moves, dict):
+        raise ValueError("species.json must hold a list and moves.json an object")
+    return species, moves
+
+
+def source_digest(paths=SOURCES):
+    """Hash of the source files, or None if any is missing."""
+    digest = hashlib.sha1()
+    try:
+        for path in paths:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    except OSError:
+        return None
+    return digest.digest()[:16]
+
+
+def is_int(value, low, high):
+    return isinstance(value, int) and not isinstance(value, bool) and low <= value <= high
+
+
+def is_text(value, max_bytes=255):
+    return isinstance(value, str) and 0 < len(value.encode()) <= max_bytes
+
+
+def validate(species, moves):
+    """Everything wrong with the roster, as a list of messages."""
+    problems = []
+    for key, move in moves.items():
+        where = f"move {key!r}"
+        if not is_text(key):
+            problems.append(f"{where}: key must be 1-255 bytes")
+        if not isinstance(move, dict):
+            problems.append(f"{where}: must be an object")
+            continue
+        for field in sorted(set(move) - MOVE_FIELDS):
+            problems.append(f"{where}: unknown field {field!r}")
+        if not is_text(move.get("name")):
+            problems.append(f"{where}: name must be 1-255 bytes")
+        if move.get("type") not in MOVE_TYPES:
+            problems.append(f"{where}: type must be one of {', '.join(MOVE_TYPES)}")
+        damage = move.get("damage_range")
+        # Every attack must do damage, or battles could loop (see perfect.py)
+        if not (isinstance(damage, list) and len(damage) == 2 and is_int(damage[0], 1, 255)
+                and is_int(damage[1], damage[0], 255)):
+            problems.append(f"{where}: damage_range must be [min, max] with 1 <= min <= max <= 255")
+
+    seen = set()
+    for i, entry in enumerate(species):
+        if not isinstance(entry, dict):
+            problems.append(f"species #{i + 1}: must be an object")
+            continue
+        name = entry.get("name")
+        where = f"species #{i + 1} ({name})"
+        for field in sorted(set(entry) - SPECIES_FIELDS):
+            problems.append(f"{where}: unknown field {field!r}")
+        if not is_text(name, NAME_BYTES):
+            problems.append(f"{where}: name must be 1-{NAME_BYTES} bytes")
+        elif name in seen:
+            problems.append(f"{where}: duplicate name")
+        seen.add(name)
+        max_hp = entry.get("max_hp")
+        if not is_int(max_hp, 1, 255):
+            problems.append(f"{where}: max_hp must be 1-255")
+        elif not is_int(entry.get("hp", max_hp), 1, max_hp):
+            problems.append(f"{where}: hp must be 1-max_hp")
+        keys = entry.get("moves")
+        if not (isinstance(keys, list) and 1 <= len(keys) <= MAX_MOVES and len(set(map(str, keys))) == len(keys)):
+            problems.append(f"{where}: moves must list 1-{MAX_MOVES} different moves")
+        else:
+            problems.extend(f"{where}: unknown move {key!r}" for key in keys if key not in moves)
+        sprite = entry.get("sprite")
+        if not is_text(sprite):
+            problems.append(f"{where}: sprite must be a path of 1-255 bytes")
+        elif not os.path.isfile(os.path.join(ROOT, sprite)):
+            problems.append(f"{where}: sprite {sprite} not found")
+        color = entry.get("color")
+        if not (isinstance(color, list) and len(color) == 3 and all(is_int(c, 0, 255) for c in color)):
+            problems.append(f"{where}: color must be [r, g, b] with values 0-255")
+    if not species:
+        problems.append("the roster has no species")
+    if len(species) > 0xffff or len(moves) > 0xffff:
+        problems.append("at most 65535 species and 65535 moves")
+    return problems
+
+
+def compile_roster(species, moves, digest=bytes(16)):
+    """Validate the roster and return the binary; raises ValueError listing every problem."""
+    problems = validate(species, moves)
+    if problems:
+        raise ValueError("invalid roster:\n  " + "\n  ".join(problems))
+    strings = bytearray()
+    offsets = {}
+
+    def text(value):
+        if value not in offsets:
+            data = value.encode()
+            offsets[value] = (len(strings), len(data))
+            strings.extend(data)
+        return offsets[value]
+
+    move_ids = {key: i for i, key in enumerate(moves)}
+    move_records = [MOVE.pack(*text(key), *text(move["name"]), MOVE_TYPES.index(move["type"]), *move["damage_range"])
+                    for key, move in moves.items()]
+    species_records = []
+    for entry in species:
+        ids = [move_ids[key] for key in entry["moves"]]
+        ids += [0] * (MAX_MOVES - len(ids))
+        species_records.append(SPECIES.pack(entry["name"].encode(), entry.get("hp", entry["max_hp"]),
+                                            entry["max_hp"], len(entry["moves"]), *ids, *text(entry["sprite"]),
+                                            *entry["color"]))
+    index = sorted((entry["name"].encode(), i) for i, entry in enumerate(species))
+    return b"".join([HEADER.pack(MAGIC, VERSION, len(species), len(moves), digest), *species_records,
+                     *(NAME.pack(name, i) for name, i in index), *move_records, bytes(strings)])
+
+
+def is_current(path=ROSTER_PATH, sources=SOURCES):
+    """True if the compiled roster at path was built from these sources."""
+    try:
+        with open(path, "rb") as f:
+            header = HEADER.unpack(f.read(HEADER.size))
+    except (OSError, struct.error):
+        return False
+    return header[:2] == (MAGIC, VERSION) and header[4] == source_digest(sources)
+
+
+def build(path=ROSTER_PATH, sources=SOURCES):
+    data = compile_roster(*read_sources(*sources), digest=source_digest(sources))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return len(data)
+
+
+# --- Loading ---
+
+class Roster:
+    """A compiled roster; species are decoded on request, nothing is read up front."""
+
+    def __init__(self, data):
+        self.data = data
+        magic, version, self.count, self.move_count, self.digest = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a roster file")
+        self.index_offset = HEADER.size + self.count * SPECIES.size
+        self.moves_offset = self.index_offset + self.count * NAME.size
+        self.strings_offset = self.moves_offset + self.move_count * MOVE.size
+        self.names = NameList(self)
+
+    @classmethod
+    def load(cls, path=ROSTER_PATH, sources=None):
+        """Map the compiled roster as it is.
+
+        Given sources (development only), they are compiled in memory instead
+        if the file is missing or was built from something else.
+        """
+        digest = source_digest(sources) if sources else None
+        try:
+            with open(path, "rb") as f:
+                try:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (AttributeError, OSError, ValueError):
+                    # No mmap on this platform (web build): read it instead
+                    data = f.read()
+            roster = cls(data)
+            if digest is None or roster.digest == digest:
+                return roster
+        except (OSError, ValueError, struct.error):
+            if not sources:
+                raise
+        return cls(compile_roster(*read_sources(*sources), digest=digest))
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, name):
+        return self.find(name) is not None
+
+    def text(self, offset, length):
+        start = self.strings_offset + offset
+        return bytes(self.data[start:start + length]).decode()
+
+    def name(self, i):
+        start = HEADER.size + i * SPECIES.size
+        return bytes(self.data[start:start + NAME_BYTES]).rstrip(b"\0").decode()
+
+    def find(self, name):
+        """Position of a species in the roster, by binary search over the name index; None if absent."""
+        if not isinstance(name, str):
+            return None
+        key = name.encode().ljust(NAME_BYTES, b"\0")
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            entry, i = NAME.unpack_from(self.data, self.index_offset + mid * NAME.size)
+            if entry == key:
+                return i
+            if entry < key:
+                low = mid + 1
+            else:
+                high = mid
+        return None
+
+    def record(self, name):
+        i = self.find(name)
+        if i is None:
+            raise KeyError(name)
+        return SPECIES.unpack_from(self.data, HEADER.size + i * SPECIES.size)
+
+    def move(self, move_id):
+        key_offset, key_length, name_offset, name_length, kind, low, high = \
+            MOVE.unpack_from(self.data, self.moves_offset + move_id * MOVE.size)
+        return (self.text(key_offset, key_length),
+                {"name": self.text(name_offset, name_length), "type": MOVE_TYPES[kind], "damage_range": (low, high)})
+
+    def stats(self, name):
+        """HP and moves of a species, in the shape of battle.POKEMON_STATS entries."""
+        _, hp, max_hp, move_count, *rest = self.record(name)
+        attacks = dict(self.move(move_id) for move_id in rest[:move_count])
+        return {"hp": hp, "max_hp": max_hp, "attacks": attacks, "button_order": list(attacks)}
+
+    def visuals(self, name):
+        *_, sprite_offset, sprite_length, r, g, b = self.record(name)
+        return {"sprite": self.text(sprite_offset, sprite_length), "color": (r, g, b)}
+
+
+class NameList(Sequence):
+    """Species names in roster order, read from the file as they are asked for."""
+
+    def __init__(self, roster):
+        self.roster = roster
+
+    def __len__(self):
+        return len(self.roster)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.roster.name(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("species index out of range")
+        return self.roster.name(i)
+
+    def __contains__(self, name):
+        return name in self.roster
+
+    def index(self, name, *args):
+        i = self.roster.find(name)
+        if i is None:
+            raise ValueError(f"{name!r} is not in the roster")
+        return i
+
+
+class LazyTable(Mapping):
+    """Read-only name -> factory(name) mapping over a roster, built per species on first access."""
+
+    def __init__(self, roster, factory):
+        self.roster = roster
+        self.factory = factory
+        self.loaded = {}
+
+    def __getitem__(self, name):
+        value = self.loaded.get(name)
+        if value is None:
+            if name not in self.roster:
+                raise KeyError(name)
+            value = self.loaded[name] = self.factory(name)
+        return value
+
+    def __contains__(self, name):
+        return name in self.roster
+
+    def __iter__(self):
+        return iter(self.roster.names)
+
+    def __len__(self):
+        return len(self.roster)
+
+
+def load_default():
+    """The game's roster: POKEMON_ROSTER=path if set, else data/roster.bin."""
+    override = os.environ.get("POKEMON_ROSTER")
+    if override:
+        return Roster.load(override)
+    if os.environ.get("POKEMON_ROSTER_DEV", "0") == "1":
+        return Roster.load(sources=SOURCES)
+    return Roster.load()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate the roster sources and compile data/roster.bin.")
+    parser.add_argument("--species", default=SPECIES_SOURCE)
+    parser.add_argument("--moves", default=MOVES_SOURCE)
+    parser.add_argument("--out", default=ROSTER_PATH)
+    parser.add_argument("--check", action="store_true", help="validate and fail if --out is stale, without writing")
+    parser.add_argument("--force", action="store_true", help="rewrite --out even if it is up to date")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        species, moves = read_sources(args.species, args.moves)
+        if args.check:
+            problems = validate(species, moves)
+            if problems:
+                raise ValueError("invalid roster:\n  " + "\n  ".join(problems))
+            print(f"{len(species)} species and {len(moves)} moves are valid")
+            if not is_current(args.out, (args.species, args.moves)):
+                raise ValueError(f"{args.out} is out of date; run python roster.py")
+        elif is_current(args.out, (args.species, args.moves)) and not args.force:
+            print(f"{args.out} is up to date")
+        else:
+            size = build(args.out, (args.species, args.moves))
+            print(f"wrote {args.out}: {len(species)} species, {len(moves)} moves, {size} bytes "
+                  f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,460 @@
+"""Asyncio battle server.
+
+One process hosts thousands of concurrent player-vs-AI battles, using the
+rules in battle.py and the game's AIs. Clients speak a line protocol over
+TCP, so netcat is enough to play a battle by hand:
+
+    python server.py --port 8765
+    python server.py loadtest --battles 5000 --concurrency 500
+    python server.py loadtest --difficulty normal hard perfect   # mixed, latency reported per difficulty
+
+Protocol, one command per line, space separated, "-" meaning none:
+    new TOKEN NAME [OPPONENT|random] [normal|hard|perfect]
+        -> battle TOKEN ID NAME1 NAME2 HP0 HP1 POTIONS0 POTIONS1
+    move ID ACTION
+        -> state ID HP0 HP1 POTIONS0 POTIONS1 WINNER YOUR_DAMAGE AI_ACTION AI_DAMAGE
+    quit ID   -> bye ID
+    stats     -> stats active=N started=N finished=N evicted=N moves=N queued=N searching=N timeouts=N failures=N
+    on errors -> error REF REASON
+
+The client is side 0 and moves first; the AI's reply comes back in the same
+state line, and a battle is forgotten as soon as it has a winner. A move
+sent while the AI is still thinking gets "error ID thinking". A battle
+is a Battle object plus a small __slots__ record, and damage rolls share one
+server RNG, so an idle battle costs a few hundred bytes.
+
+Commands go through one bounded queue to a scheduler task that runs them in
+time-sliced batches, so a burst from one client never stalls the event loop.
+When the queue is full, readers stop reading; a connection that is not
+reading its responses is not read from until its send buffer drains; both
+push back on fast clients through TCP flow control. Battles idle for longer
+than --idle-timeout are evicted, and a closed connection drops its battles.
+
+Hard searches (and Perfect matchups missing from the table) run in a pool
+of --search-workers processes, so they never hold up the event loop. A
+search that has not answered within SEARCH_TIMEOUT of being asked for,
+queueing included, is abandoned and the normal AI moves instead, as does
+one whose worker failed; a broken pool is replaced.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import battle
+import expectimax
+import perfect
+
+DEFAULT_PORT = 8765
+SEND_HIGH_WATER = 64 * 1024   # bytes of unsent responses before a connection stops being read
+SEARCH_BUDGET = 0.002    # seconds of expectimax per Hard move
+SEARCH_TIMEOUT = 0.05    # seconds from asking to answer before the normal AI moves instead
+# Workers come from a fork server started before the listening socket is bound, so none of
+# them holds it open, including those of a pool that replaces a broken one
+POOL_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+
+class Session:
+    __slots__ = ("id", "state", "ai", "conn", "last_active", "thinking")
+
+    def __init__(self, battle_id, state, ai, conn):
+        self.id = battle_id
+        self.state = state
+        self.ai = ai
+        self.conn = conn
+        self.last_active = time.monotonic()
+        self.thinking = None    # task waiting on a pooled search
+
+
+# --- Search workers ---
+
+search_ai = None
+
+
+def init_search_worker():
+    # A forked child inherits the parent's handlers; let terminate() and ^C reach the server only
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def search_move(state):
+    """Worker entry point: the Hard AI's move for side 1, with this process's transposition tables."""
+    global search_ai
+    if search_ai is None:
+        search_ai = expectimax.ExpectimaxAI(time_budget=SEARCH_BUDGET)
+    return search_ai.choose(state, 1)
+
+
+class Connection:
+    __slots__ = ("writer", "battles", "closed")
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.battles = set()
+        self.closed = False
+
+    def send(self, line):
+        if not self.closed:
+            self.writer.write(line.encode() + b"\n")
+
+
+class BattleServer:
+    def __init__(self, max_battles=100000, queue_size=10000, idle_timeout=120.0, slice_budget=0.005,
+                 search_workers=None, search_timeout=SEARCH_TIMEOUT):
+        self.max_battles = max_battles
+        self.idle_timeout = idle_timeout
+        self.slice_budget = slice_budget
+        self.search_timeout = search_timeout
+        self.search_workers = search_workers or os.cpu_count() or 1
+        self.pool = self.new_pool()
+        self.queue = asyncio.Queue(queue_size)
+        self.battles = OrderedDict()    # id -> Session, least recently active first
+        self.next_id = 1
+        self.rng = random.Random()
+        self.stats = {"started": 0, "finished": 0, "evicted": 0, "moves": 0, "searching": 0, "timeouts": 0,
+                      "failures": 0}
+        table = perfect.PolicyTable.load()
+        # None means the move comes from a pooled search
+        self.ais = {
+            "normal": lambda state: battle.ai_action(state, 1, self.rng),
+            "hard": lambda state: None,
+            # Matchups the table was not built with are played as Hard, as in the game
+            "perfect": lambda state: table.action(state) if table and table.covers(state.names) else None,
+        }
+        self.names = list(battle.POKEMON_STATS.keys())
+
+    # --- Connections ---
+
+    async def handle_connection(self, reader, writer):
+        conn = Connection(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if writer.transport.get_write_buffer_size() > SEND_HIGH_WATER:
+                    await writer.drain()
+                await self.queue.put((conn, line))
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            conn.closed = True
+            for battle_id in conn.battles:
+                self.battles.pop(battle_id, None)
+            conn.battles.clear()
+            writer.close()
+
+    # --- Scheduler ---
+
+    async def scheduler(self):
+        """Run queued commands in batches of at most slice_budget seconds, then yield."""
+        queue = self.queue
+        while True:
+            conn, line = await queue.get()
+            deadline = time.perf_counter() + self.slice_budget
+            while True:
+                if not conn.closed:
+                    self.execute(conn, line)
+                if queue.empty() or time.perf_counter() > deadline:
+                    break
+                conn, line = queue.get_nowait()
+            await asyncio.sleep(0)
+
+    def execute(self, conn, line):
+        parts = line.decode(errors="replace").split()
+        if not parts:
+            return
+        command = parts[0]
+        if command == "move" and len(parts) == 3:
+            self.move(conn, parts[1], parts[2])
+        elif command == "new" and len(parts) >= 3:
+            self.new(conn, parts[1], parts[2:])
+        elif command == "quit" and len(parts) == 2:
+            session = self.battles.get(parts[1])
+            if session is not None and session.conn is conn:
+                self.drop(session)
+            conn.send(f"bye {parts[1]}")
+        elif command == "stats":
+            stats = self.stats
+            conn.send(f"stats active={len(self.battles)} started={stats['started']} finished={stats['finished']} "
+                      f"evicted={stats['evicted']} moves={stats['moves']} queued={self.queue.qsize()} "
+                      f"searching={stats['searching']} timeouts={stats['timeouts']} "
+                      f"failures={stats['failures']}")
+        else:
+            conn.send(f"error {parts[1] if len(parts) > 1 else '-'} bad-command")
+
+    def new(self, conn, token, args):
+        name = args[0]
+        opponent = args[1] if len(args) > 1 else "random"
+        difficulty = args[2].lower() if len(args) > 2 else "perfect"
+        if opponent == "random":
+            opponent = self.rng.choice(self.names)
+        if name not in battle.POKEMON_STATS or opponent not in battle.POKEMON_STATS:
+            conn.send(f"error {token} unknown-pokemon")
+            return
+        if difficulty not in self.ais:
+            conn.send(f"error {token} unknown-difficulty")
+            return
+        if len(self.battles) >= self.max_battles:
+            conn.send(f"error {token} busy")
+            return
+        battle_id = str(self.next_id)
+        self.next_id += 1
+        state = battle.Battle(name, opponent)
+        self.battles[battle_id] = Session(battle_id, state, self.ais[difficulty], conn)
+        conn.battles.add(battle_id)
+        self.stats["started"] += 1
+        conn.send(f"battle {token} {battle_id} {name} {opponent} {state.hp[0]} {state.hp[1]} "
+                  f"{state.potions[0]} {state.potions[1]}")
+
+    def move(self, conn, battle_id, action):
+        session = self.battles.get(battle_id)
+        if session is None or session.conn is not conn:
+            conn.send(f"error {battle_id} no-such-battle")
+            return
+        if session.thinking is not None:
+            conn.send(f"error {battle_id} thinking")
+            return
+        state = session.state
+        if action not in state.legal_actions(0):
+            conn.send(f"error {battle_id} illegal-move")
+            return
+        self.stats["moves"] += 1
+        damage = battle.apply_action(state, action, self.rng)
+        if state.winner is not None:
+            self.reply(session, damage, None)
+            return
+        ai_action = session.ai(state)
+        if ai_action is None:
+            # The reply goes out when the search is done; the scheduler moves on
+            session.thinking = asyncio.ensure_future(self.search(session, damage))
+        else:
+            self.reply(session, damage, ai_action)
+
+    async def search(self, session, damage):
+        """Ask the worker pool for the AI's move, giving up after search_timeout."""
+        self.stats["searching"] += 1
+        pool = self.pool
+        try:
+            future = asyncio.get_running_loop().run_in_executor(pool, search_move, session.state.copy())
+            ai_action = await asyncio.wait_for(future, self.search_timeout)
+        except asyncio.TimeoutError:
+            # Workers are saturated or the search overran; a queued search is cancelled
+            self.stats["timeouts"] += 1
+            ai_action = battle.ai_action(session.state, 1, self.rng)
+        except Exception as e:
+            # A worker died or the search raised; the move is still answered
+            self.stats["failures"] += 1
+            if isinstance(e, BrokenProcessPool) and pool is self.pool:
+                # The broken pool has already failed its queued searches
+                pool.shutdown(wait=False)
+                self.pool = self.new_pool()
+            ai_action = battle.ai_action(session.state, 1, self.rng)
+        finally:
+            self.stats["searching"] -= 1
+            session.thinking = None
+        # The battle may have been evicted or its connection closed meanwhile
+        if self.battles.get(session.id) is session:
+            self.reply(session, damage, ai_action)
+
+    def new_pool(self):
+        return ProcessPoolExecutor(self.search_workers, mp_context=POOL_CONTEXT, initializer=init_search_worker)
+
+    def reply(self, session, damage, ai_action):
+        """Apply the AI's action (None once the battle is over) and send the new state."""
+        state, battle_id = session.state, session.id
+        ai_damage = "-" if ai_action is None else battle.apply_action(state, ai_action, self.rng)
+        winner = "-" if state.winner is None else state.winner
+        session.conn.send(f"state {battle_id} {state.hp[0]} {state.hp[1]} {state.potions[0]} {state.potions[1]} "
+                          f"{winner} {damage} {ai_action or '-'} {ai_damage}")
+        if state.winner is not None:
+            self.stats["finished"] += 1
+            self.drop(session)
+        else:
+            session.last_active = time.monotonic()
+            self.battles.move_to_end(battle_id)
+
+    def drop(self, session):
+        self.battles.pop(session.id, None)
+        session.conn.battles.discard(session.id)
+
+    # --- Eviction ---
+
+    async def evict_idle(self):
+        # Battles are kept in order of last activity, so eviction stops at the first fresh one
+        while True:
+            await asyncio.sleep(min(5.0, self.idle_timeout / 4))
+            cutoff = time.monotonic() - self.idle_timeout
+            while self.battles:
+                session = next(iter(self.battles.values()))
+                if session.last_active > cutoff:
+                    break
+                self.drop(session)
+                self.stats["evicted"] += 1
+
+    async def serve(self, host="127.0.0.1", port=DEFAULT_PORT, ready=None):
+        loop = asyncio.get_running_loop()
+        # Start the fork server (and a first worker) before the listening socket exists
+        await loop.run_in_executor(self.pool, int)
+        try:
+            # Shut the workers down on terminate() too, not just on ^C
+            loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        except NotImplementedError:
+            pass
+        server = await asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+        tasks = [asyncio.ensure_future(self.scheduler()), asyncio.ensure_future(self.evict_idle())]
+        if ready is not None:
+            ready(server.sockets[0].getsockname()[1])
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.pool.shutdown(cancel_futures=True)
+
+
+# --- Load test ---
+
+class LoadClient:
+    """One connection with many battles in flight; responses are matched by token or battle id."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.pending = {}
+        self.reading = asyncio.ensure_future(self.read_loop())
+
+    async def read_loop(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            parts = line.decode().split()
+            future = self.pending.pop("stats" if parts[0] == "stats" else parts[1], None)
+            if future is not None and not future.done():
+                future.set_result(parts)
+        for future in self.pending.values():
+            future.set_exception(ConnectionError("server closed the connection"))
+
+    async def request(self, key, line):
+        future = asyncio.get_running_loop().create_future()
+        self.pending[key] = future
+        self.writer.write(line.encode() + b"\n")
+        return await future
+
+
+async def play_load_battle(client, token, rng, difficulty, latencies):
+    names = list(battle.POKEMON_STATS.keys())
+    reply = await client.request(token, f"new {token} {rng.choice(names)} random {difficulty}")
+    if reply[0] != "battle":
+        return False
+    battle_id, name = reply[2], reply[3]
+    hp, potions, max_hp = int(reply[5]), int(reply[7]), int(reply[5])
+    moves = battle.move_order(name)
+    while True:
+        action = "potion" if potions and hp < max_hp // 2 and rng.random() < 0.5 else rng.choice(moves)
+        start = time.perf_counter()
+        reply = await client.request(battle_id, f"move {battle_id} {action}")
+        latencies.append(time.perf_counter() - start)
+        if reply[0] != "state":
+            return False
+        hp, potions = int(reply[2]), int(reply[4])
+        if reply[6] != "-":
+            return True
+
+
+async def loadtest(host, port, battles, concurrency, connections, difficulties, seed=0):
+    clients = []
+    for _ in range(connections):
+        reader, writer = await asyncio.open_connection(host, port)
+        clients.append(LoadClient(reader, writer))
+    remaining = [battles]
+    latencies = {difficulty: [] for difficulty in difficulties}
+    results = {"ok": 0, "errors": 0}
+
+    async def worker(index):
+        # Each battle in flight keeps one difficulty, so a slow AI shows up in its own numbers
+        client = clients[index % connections]
+        difficulty = difficulties[index % len(difficulties)]
+        rng = random.Random(seed * 100003 + index)
+        played = 0
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            played += 1
+            ok = await play_load_battle(client, f"t{index}.{played}", rng, difficulty, latencies[difficulty])
+            results["ok" if ok else "errors"] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stats = await clients[0].request("stats", "stats")
+    for client in clients:
+        client.writer.close()
+        client.reading.cancel()
+
+    moves = sum(len(times) for times in latencies.values())
+    print(f"{results['ok']} battles ({results['errors']} failed) and {moves} moves in {elapsed:.2f}s: "
+          f"{results['ok'] / elapsed:.0f} battles/s, {moves / elapsed:.0f} moves/s "
+          f"with {concurrency} battles in flight over {connections} connections")
+    for difficulty, times in latencies.items():
+        times.sort()
+        p50 = times[len(times) // 2] * 1000 if times else 0.0
+        p99 = times[len(times) * 99 // 100] * 1000 if times else 0.0
+        print(f"{difficulty:>8}: {len(times) / elapsed:.0f} moves/s, latency p50 {p50:.2f} ms, p99 {p99:.2f} ms, "
+              f"max {times[-1] * 1000 if times else 0:.2f} ms")
+    print("server:", " ".join(stats[1:]))
+    return results["errors"] == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless battle server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-battles", type=int, default=100000)
+    parser.add_argument("--queue-size", type=int, default=10000)
+    parser.add_argument("--idle-timeout", type=float, default=120.0, help="seconds before an idle battle is evicted")
+    parser.add_argument("--search-workers", type=int, default=0, help="processes for Hard searches (default: one per CPU)")
+    commands = parser.add_subparsers(dest="command")
+    load_cmd = commands.add_parser("loadtest", help="play many battles against a server and report throughput")
+    load_cmd.add_argument("--battles", type=int, default=5000)
+    load_cmd.add_argument("--concurrency", type=int, default=500, help="battles in flight")
+    load_cmd.add_argument("--connections", type=int, default=20)
+    load_cmd.add_argument("--difficulty", nargs="+", default=["perfect"], choices=["normal", "hard", "perfect"],
+                          help="several are played side by side and reported separately")
+    load_cmd.add_argument("--connect", action="store_true",
+                          help="use the server already running at --host/--port instead of starting one")
+    args = parser.parse_args()
+
+    if args.command == "loadtest":
+        server_process = None
+        if not args.connect:
+            # A separate process, so the client's own work does not count against the server
+            server_process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--port", str(args.port),
+                                               "--search-workers", str(args.search_workers)],
+                                              stdout=subprocess.PIPE, text=True)
+            server_process.stdout.readline()
+        try:
+            ok = asyncio.run(loadtest(args.host, args.port, args.battles, args.concurrency, args.connections,
+                                      args.difficulty))
+        finally:
+            if server_process is not None:
+                server_process.terminate()
+                server_process.wait()
+        sys.exit(0 if ok else 1)
+
+    server = BattleServer(args.max_battles, args.queue_size, args.idle_timeout, search_workers=args.search_workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port,
+                                 ready=lambda port: print(f"serving battles on {args.host}:{port}", flush=True)))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
@@ -0,0 +1,634 @@
+"""Spectator feed: live battles fanned out to many viewers.
+
+The game publishes what a viewer needs to redraw draw_scene() as deltas: a
+keyframe when a battle starts (names, HP, potions, turn, message), then per
+sim tick only the fields that changed plus new projectiles and damage
+popups, so an idle tick costs nothing and a whole battle is a few hundred
+bytes. Viewers run the projectiles and particles themselves from the spawns.
+
+A hub process sits between the game and the viewers. It decodes each frame
+once to keep a current state for late joiners, then writes the same bytes to
+every viewer, so per-viewer cost is one socket write per batch of frames and
+bandwidth per viewer does not depend on how many are watching. A viewer that
+stops reading is skipped once its send buffer is full and resynced with a
+keyframe when it drains; projectiles in flight at that moment are not shown.
+
+    python spectate.py hub                        # fan-out hub on port 7790
+    python main.py --broadcast 7790               # publish this game's battles
+    python spectate.py watch localhost:7790       # viewer window
+    python spectate.py bench --viewers 10 100 1000
+
+Frames (little-endian), each after a uint16 body length:
+    key:   type 1, tick, battle seed, mode, name1, name2, hp0, hp1,
+           potions0, potions1, turn, winner (255 = none), message
+    delta: type 2, tick, uint16 field mask, then the set fields in order:
+           hp0, hp1 (int16), potions0, potions1, turn, winner (uint8),
+           message, popup (text, x, y int16, timer uint8),
+           spawns (count, then attacker and action index per spawn)
+    idle:  type 3, tick; no battle is running
+Strings are a uint8 byte count and UTF-8. Action indexes are replay.action_index().
+"""
+import argparse
+import asyncio
+import json
+import os
+import select
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+import battle
+import replay
+
+AVAILABLE = sys.platform != "emscripten"   # no sockets in the browser
+DEFAULT_PORT = 7790
+RECONNECT_INTERVAL = 2.0
+MAX_BUFFER = 64 * 1024   # unsent bytes before a viewer is skipped or the game drops its backlog
+
+KEY_FRAME, DELTA_FRAME, IDLE_FRAME = 1, 2, 3
+LENGTH = struct.Struct("<H")
+KEY = struct.Struct("<BIQB16s16shhBBBB")
+DELTA = struct.Struct("<BIH")
+IDLE = struct.Struct("<BI")
+POPUP = struct.Struct("<hhB")
+SPAWN = struct.Struct("<BB")
+NO_WINNER = 255
+
+SCALARS = {"hp0": struct.Struct("<h"), "hp1": struct.Struct("<h"), "potions0": struct.Struct("<B"),
+           "potions1": struct.Struct("<B"), "turn": struct.Struct("<B"), "winner": struct.Struct("<B")}
+MESSAGE_BIT = 1 << len(SCALARS)
+POPUP_BIT = MESSAGE_BIT << 1
+SPAWNS_BIT = MESSAGE_BIT << 2
+
+
+def parse_address(text):
+    host, _, port = text.rpartition(":")
+    return (host or "localhost", int(port or DEFAULT_PORT))
+
+
+# --- Encoding ---
+
+def pack_text(text):
+    data = text.encode()[:255]
+    return bytes((len(data),)) + data
+
+
+def unpack_text(body, offset):
+    size = body[offset]
+    return bytes(body[offset + 1:offset + 1 + size]).decode(errors="replace"), offset + 1 + size
+
+
+def popup_started(old, new):
+    # Popups count down on their own; only a new one is news
+    return new is not None and (old is None or new[:3] != old[:3] or new[3] > old[3])
+
+
+def keyframe(state):
+    body = KEY.pack(KEY_FRAME, state["tick"], state["battle"], state["mode"], state["names"][0].encode(),
+                    state["names"][1].encode(), state["hp0"], state["hp1"], state["potions0"],
+                    state["potions1"], state["turn"], state["winner"]) + pack_text(state["message"])
+    return LENGTH.pack(len(body)) + body
+
+
+def encode(prev, state, spawns=()):
+    """Frame taking a viewer from prev to state (None = no battle); b"" when nothing changed."""
+    if state is None:
+        if prev is None:
+            return b""
+        body = IDLE.pack(IDLE_FRAME, prev["tick"])
+        return LENGTH.pack(len(body)) + body
+    if prev is None or prev["battle"] != state["battle"]:
+        return keyframe(state)
+    mask = 0
+    parts = []
+    for bit, (name, codec) in enumerate(SCALARS.items()):
+        if state[name] != prev[name]:
+            mask |= 1 << bit
+            parts.append(codec.pack(state[name]))
+    if state["message"] != prev["message"]:
+        mask |= MESSAGE_BIT
+        parts.append(pack_text(state["message"]))
+    popup = state["popup"]
+    if popup_started(prev["popup"], popup):
+        mask |= POPUP_BIT
+        parts.append(pack_text(popup[0]) + POPUP.pack(int(popup[1]), int(popup[2]), min(popup[3], 255)))
+    if spawns:
+        mask |= SPAWNS_BIT
+        parts.append(bytes((len(spawns),)))
+        parts.extend(SPAWN.pack(attacker, replay.action_index(state["names"][attacker], action))
+                     for attacker, action in spawns)
+    if not mask:
+        return b""
+    body = DELTA.pack(DELTA_FRAME, state["tick"], mask) + b"".join(parts)
+    return LENGTH.pack(len(body)) + body
+
+
+def apply(state, body):
+    """Apply one frame body to a viewer's state; returns (state, spawns, popup).
+
+    state is a dict, or None when no battle is running; spawns are
+    (attacker, action key) and popup is (text, x, y, timer) or None.
+    """
+    kind = body[0]
+    if kind == IDLE_FRAME:
+        return None, [], None
+    if kind == KEY_FRAME:
+        (_, tick, battle_seed, mode, name1, name2, hp0, hp1, potions0, potions1,
+         turn, winner) = KEY.unpack_from(body, 0)
+        message, _ = unpack_text(body, KEY.size)
+        names = (name1.rstrip(b"\0").decode(), name2.rstrip(b"\0").decode())
+        return ({"tick": tick, "battle": battle_seed, "mode": mode, "names": names, "hp0": hp0, "hp1": hp1,
+                 "potions0": potions0, "potions1": potions1, "turn": turn, "winner": winner,
+                 "message": message, "popup": None}, [], None)
+    if state is None:
+        # A delta without its keyframe; wait for the next one
+        return None, [], None
+    _, state["tick"], mask = DELTA.unpack_from(body, 0)
+    offset = DELTA.size
+    for bit, (name, codec) in enumerate(SCALARS.items()):
+        if mask & (1 << bit):
+            state[name] = codec.unpack_from(body, offset)[0]
+            offset += codec.size
+    if mask & MESSAGE_BIT:
+        state["message"], offset = unpack_text(body, offset)
+    popup = None
+    if mask & POPUP_BIT:
+        text, offset = unpack_text(body, offset)
+        popup = (text,) + POPUP.unpack_from(body, offset)
+        offset += POPUP.size
+        state["popup"] = popup
+    spawns = []
+    if mask & SPAWNS_BIT:
+        count = body[offset]
+        offset += 1
+        for _ in range(count):
+            attacker, index = SPAWN.unpack_from(body, offset)
+            offset += SPAWN.size
+            spawns.append((attacker, replay.action_key(state["names"][attacker], index)))
+    return state, spawns, popup
+
+
+def split_frames(buffer):
+    """Complete frame bodies at the start of buffer, and the number of bytes they span."""
+    bodies = []
+    offset = 0
+    while offset + LENGTH.size <= len(buffer):
+        size = LENGTH.unpack_from(buffer, offset)[0]
+        end = offset + LENGTH.size + size
+        if end > len(buffer):
+            break
+        bodies.append(buffer[offset + LENGTH.size:end])
+        offset = end
+    return bodies, offset
+
+
+# --- Publishing (the game's side) ---
+
+class Publisher:
+    """Non-blocking TCP link from the game to a hub; publish() never waits on the network."""
+
+    def __init__(self, address):
+        self.address = address
+        self.sock = None
+        self.connected = False
+        self.last_attempt = -RECONNECT_INTERVAL
+        self.prev = None
+        self.out = bytearray()
+        self.partial = 0    # bytes at the head of out finishing a frame the hub has started
+        self.sent = 0
+
+    def connect(self):
+        now = time.monotonic()
+        if now - self.last_attempt < RECONNECT_INTERVAL:
+            return
+        self.last_attempt = now
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setblocking(False)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.connect_ex(self.address)
+        self.connected = False
+
+    def disconnect(self):
+        if self.sock is not None:
+            self.sock.close()
+        self.sock = None
+        self.connected = False
+        self.out.clear()
+        self.partial = 0
+        # The hub gets a keyframe first once we are back
+        self.prev = None
+
+    def publish(self, state, spawns=()):
+        """Queue the delta from the last published state and send what the socket takes."""
+        if self.sock is None:
+            self.connect()
+            if self.sock is None:
+                return
+        if not self.connected:
+            if not select.select([], [self.sock], [], 0)[1]:
+                return
+            if self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR):
+                self.disconnect()
+                return
+            self.sock.sendall(b"PUB\n")
+            self.connected = True
+        self.out += encode(self.prev, state, spawns)
+        self.prev = state
+        if len(self.out) > MAX_BUFFER:
+            # The hub is not keeping up: finish the frame it has started, drop the
+            # whole frames behind it and start over from a keyframe
+            del self.out[self.partial:]
+            self.prev = None
+        if self.out:
+            try:
+                sent = self.sock.send(self.out)
+            except BlockingIOError:
+                return
+            except OSError:
+                self.disconnect()
+                return
+            self.partial = self.unsent_tail(sent)
+            del self.out[:sent]
+            self.sent += sent
+
+    def unsent_tail(self, sent):
+        """Bytes of the frame cut by a send of sent bytes that are still in out."""
+        end = self.partial
+        while end < sent:
+            end += LENGTH.size + LENGTH.unpack_from(self.out, end)[0]
+        return end - sent
+
+    def close(self):
+        if self.sock is not None and self.connected:
+            # Behind any queued frames, so a half-sent one is not cut short
+            self.out += encode(self.prev, None)
+            try:
+                self.sock.send(self.out)
+            except OSError:
+                pass
+        self.disconnect()
+
+
+# --- Hub ---
+
+class Hub:
+    def __init__(self, max_buffer=MAX_BUFFER):
+        self.max_buffer = max_buffer
+        self.state = None
+        self.publishing = False
+        self.viewers = set()    # transports
+        self.behind = set()     # viewers skipped while their buffer was full
+        self.cached_keyframe = None
+        self.stats = {"frames": 0, "bytes_in": 0, "bytes_out": 0, "resyncs": 0, "skipped": 0}
+
+    def current_frame(self):
+        # Encoded once per state change, however many viewers join or resync
+        if self.cached_keyframe is None:
+            if self.state is None:
+                body = IDLE.pack(IDLE_FRAME, 0)
+                self.cached_keyframe = LENGTH.pack(len(body)) + body
+            else:
+                self.cached_keyframe = keyframe(self.state)
+        return self.cached_keyframe
+
+    def fan_out(self, data):
+        limit = self.max_buffer
+        behind = self.behind
+        sent = 0
+        for transport in self.viewers:
+            if transport.get_write_buffer_size() > limit:
+                behind.add(transport)
+                self.stats["skipped"] += 1
+            elif transport in behind:
+                # The keyframe already includes what this batch changed
+                behind.discard(transport)
+                frame = self.current_frame()
+                transport.write(frame)
+                sent += len(frame)
+                self.stats["resyncs"] += 1
+            else:
+                transport.write(data)
+                sent += len(data)
+        self.stats["bytes_out"] += sent
+
+    async def handle(self, reader, writer):
+        try:
+            hello = await reader.readline()
+            if hello == b"PUB\n" and not self.publishing:
+                await self.receive(reader)
+            elif hello == b"WATCH\n":
+                await self.watch(reader, writer)
+            elif hello == b"STATS\n":
+                stats = dict(self.stats, viewers=len(self.viewers), cpu=time.process_time())
+                writer.write(json.dumps(stats).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def receive(self, reader):
+        self.publishing = True
+        buffer = b""
+        try:
+            while True:
+                data = await reader.read(1 << 16)
+                if not data:
+                    break
+                self.stats["bytes_in"] += len(data)
+                buffer += data
+                bodies, end = split_frames(buffer)
+                if not end:
+                    continue
+                for body in bodies:
+                    self.state = apply(self.state, body)[0]
+                self.cached_keyframe = None
+                self.stats["frames"] += len(bodies)
+                # One write per viewer for the whole batch
+                self.fan_out(buffer[:end])
+                buffer = buffer[end:]
+        finally:
+            self.publishing = False
+            if self.state is not None:
+                self.state = None
+                self.cached_keyframe = None
+                self.fan_out(self.current_frame())
+
+    async def watch(self, reader, writer):
+        transport = writer.transport
+        transport.set_write_buffer_limits(high=self.max_buffer)
+        transport.write(self.current_frame())
+        self.viewers.add(transport)
+        try:
+            # Viewers only listen; this returns when they hang up
+            while await reader.read(1024):
+                pass
+        finally:
+            self.viewers.discard(transport)
+            self.behind.discard(transport)
+
+    async def serve(self, host="", port=DEFAULT_PORT, ready=None):
+        server = await asyncio.start_server(self.handle, host or None, port, backlog=4096)
+        if ready is not None:
+            ready(port)
+        async with server:
+            await server.serve_forever()
+
+
+# --- Viewer ---
+
+def show(main, state, spawns, popup, fresh):
+    """Point main's battle globals at a received state so draw_scene() can draw it."""
+    if state is None:
+        main.battle_start = False
+        main.battle_state = None
+        main.projectiles.clear()
+        return
+    if fresh or main.battle_state is None:
+        for idx, name in enumerate(state["names"]):
+            main.players[idx] = {"name": name, "sprite": main.pokemon_data[name]["sprite"].get(),
+                                 "color": main.pokemon_data[name]["color"],
+                                 "attacks": main.pokemon_data[name]["attacks"]}
+        main.battle_state = battle.Battle(*state["names"])
+        main.mode_selected = state["mode"]
+        main.projectiles.clear()
+        main.particles.clear()
+        main.damage_popup = None
+        main.battle_start = True
+    s = main.battle_state
+    odds_changed = (s.hp[0], s.hp[1], s.potions[0], s.potions[1]) != \
+        (state["hp0"], state["hp1"], state["potions0"], state["potions1"])
+    s.hp[:] = [state["hp0"], state["hp1"]]
+    s.potions[:] = [state["potions0"], state["potions1"]]
+    s.turn = main.turn = state["turn"]
+    s.winner = None if state["winner"] == NO_WINNER else state["winner"]
+    main.game_over = s.winner is not None
+    main.winner = None if s.winner is None else state["names"][s.winner]
+    main.attack_message = state["message"]
+    if popup is not None:
+        main.damage_popup = popup
+    for attacker, action in spawns:
+        attack = main.players[attacker]["attacks"][action]
+        main.play_sound(attack["sound"])
+        main.spawn_projectile(attack["type"], main.battle_positions[attacker],
+                              main.battle_positions[1 - attacker], attacker, action)
+    if fresh or odds_changed:
+        main.update_win_odds()
+
+
+def viewer_tick(main):
+    # The animated part of main.simulate_tick(); the rules state comes from the feed
+    main.sim_ticks += 1
+    if main.damage_popup:
+        text, x, y, timer = main.damage_popup
+        main.damage_popup = (text, x, y, timer - 1) if timer > 1 else None
+    main.update_particles()
+    main.update_projectiles()
+
+
+async def watch(address):
+    import pygame
+
+    import main
+
+    main.init_display()
+    main.spectating = True
+    main.mode_select = False
+    reader, writer = await asyncio.open_connection(*address)
+    writer.write(b"WATCH\n")
+    feed = {"state": None, "buffer": b"", "open": True}
+
+    async def receive():
+        while True:
+            data = await reader.read(1 << 16)
+            if not data:
+                feed["open"] = False
+                return
+            feed["buffer"] += data
+
+    receiving = asyncio.ensure_future(receive())
+    clock = pygame.time.Clock()
+    accumulator = 0.0
+    last_time = time.perf_counter()
+    while True:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                receiving.cancel()
+                writer.close()
+                pygame.quit()
+                return
+            if event.type == pygame.WINDOWEXPOSED:
+                main.dirty_state["full"] = True
+
+        bodies, end = split_frames(feed["buffer"])
+        feed["buffer"] = feed["buffer"][end:]
+        for body in bodies:
+            fresh = body[0] == KEY_FRAME
+            feed["state"], spawns, popup = apply(feed["state"], body)
+            show(main, feed["state"], spawns, popup, fresh)
+
+        now = time.perf_counter()
+        accumulator += min(now - last_time, main.MAX_FRAME_TIME)
+        last_time = now
+        while accumulator >= main.SIM_DT:
+            viewer_tick(main)
+            accumulator -= main.SIM_DT
+
+        if main.battle_start:
+            main.draw_scene(accumulator / main.SIM_DT)
+        else:
+            main.screen.fill(main.WHITE)
+            text = "Waiting for a battle" if feed["open"] else "The feed has ended"
+            main.screen.blit(main.render_text(main.big_font, text, main.BLACK), (main.WIDTH // 2 - 240, 120))
+            main.dirty_state["full"] = True
+        main.draw_text("Spectating", (main.WIDTH - 130, main.HEIGHT - 170))
+        main.present_frame(dirty_scene=main.battle_start)
+        clock.tick(main.RENDER_FPS)
+        await asyncio.sleep(0)
+
+
+# --- Benchmark ---
+
+async def swarm(address, viewers, sample_every=100):
+    """Connect many listening viewers; every sample_every-th one decodes its feed.
+
+    Runs until stdin closes, then prints bytes received and the sampled states as JSON.
+    """
+    totals = [0]
+    samples = []
+
+    async def viewer(index):
+        reader, writer = await asyncio.open_connection(*address)
+        writer.write(b"WATCH\n")
+        sample = {"state": None} if index % sample_every == 0 else None
+        if sample is not None:
+            samples.append(sample)
+        buffer = b""
+        while True:
+            data = await reader.read(1 << 16)
+            if not data:
+                return
+            totals[0] += len(data)
+            if sample is not None:
+                buffer += data
+                bodies, end = split_frames(buffer)
+                buffer = buffer[end:]
+                for body in bodies:
+                    sample["state"] = apply(sample["state"], body)[0]
+
+    tasks = [asyncio.ensure_future(viewer(i)) for i in range(viewers)]
+    await asyncio.get_running_loop().run_in_executor(None, sys.stdin.read)
+    for task in tasks:
+        task.cancel()
+    states = [None if s["state"] is None else comparable(s["state"]) for s in samples]
+    print(json.dumps({"bytes": totals[0], "states": states}), flush=True)
+
+
+def comparable(state):
+    return [state["battle"], state["hp0"], state["hp1"], state["potions0"], state["potions1"],
+            state["turn"], state["winner"], state["message"]]
+
+
+def hub_stats(address):
+    with socket.create_connection(address) as sock:
+        sock.sendall(b"STATS\n")
+        return json.loads(sock.makefile().readline())
+
+
+def drive_battles(main, publisher, seconds):
+    """Play AI-vs-AI battles in real time through main's sim, publishing every tick."""
+    import random
+
+    rng = random.Random(0)
+    names = main.player_choice_names
+    main.broadcast = publisher
+    deadline = time.perf_counter() + seconds
+    next_tick = time.perf_counter()
+    battles = 0
+    while time.perf_counter() < deadline:
+        if main.battle_state is None or (main.game_over and main.damage_popup is None):
+            main.reset_game()
+            main.mode_select = False
+            main.mode_selected = 1
+            main.battle_start = True
+            main.player_choices = [rng.randrange(len(names)), rng.randrange(len(names))]
+            main.start_battle()
+            battles += 1
+        elif not main.game_over and main.action_lockout == 0 and not main.pending_actions:
+            main.queue_action(main.turn, battle.ai_action(main.battle_state, main.turn, rng))
+        main.simulate_tick()
+        next_tick += main.SIM_DT
+        time.sleep(max(0.0, next_tick - time.perf_counter()))
+    return battles
+
+
+def bench(viewer_counts, seconds, port):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    import main
+
+    main.init_display()
+    address = ("127.0.0.1", port)
+    script = os.path.abspath(__file__)
+    print(f"{'viewers':>8} {'B/s per viewer':>15} {'hub CPU ms/s':>13} {'us per viewer-batch':>20} "
+          f"{'resyncs':>8} {'sampled':>8}")
+    for count in viewer_counts:
+        hub = subprocess.Popen([sys.executable, script, "hub", "--port", str(port)], stdout=subprocess.PIPE)
+        hub.stdout.readline()
+        viewers = subprocess.Popen([sys.executable, script, "swarm", f"127.0.0.1:{port}", "--viewers", str(count)],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        try:
+            while hub_stats(address)["viewers"] < count:
+                time.sleep(0.1)
+            before = hub_stats(address)
+            publisher = Publisher(address)
+            drive_battles(main, publisher, seconds)
+            time.sleep(0.5)
+            after = hub_stats(address)
+            expected = comparable(main.spectator_state()) if main.battle_state is not None else None
+            out, _ = viewers.communicate("", timeout=60)
+            result = json.loads(out)
+            publisher.close()
+            main.broadcast = None
+        finally:
+            viewers.kill()
+            hub.terminate()
+            hub.wait()
+        cpu = after["cpu"] - before["cpu"]
+        batches = max(1, after["frames"] - before["frames"])
+        matched = sum(state == expected for state in result["states"])
+        print(f"{count:>8} {result['bytes'] / count / seconds:>15.0f} {cpu / seconds * 1000:>13.1f} "
+              f"{cpu / (batches * count) * 1e6:>20.2f} {after['resyncs']:>8} "
+              f"{matched:>4}/{len(result['states'])}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Spectator feed hub, viewer and benchmark.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    hub_cmd = commands.add_parser("hub", help="fan a game's broadcast out to viewers")
+    hub_cmd.add_argument("--port", type=int, default=DEFAULT_PORT)
+    watch_cmd = commands.add_parser("watch", help="watch the battles going through a hub")
+    watch_cmd.add_argument("address", nargs="?", default=f"localhost:{DEFAULT_PORT}")
+    bench_cmd = commands.add_parser("bench", help="measure bandwidth and hub CPU per viewer")
+    bench_cmd.add_argument("--viewers", type=int, nargs="+", default=[10, 100, 1000])
+    bench_cmd.add_argument("--seconds", type=float, default=10.0)
+    bench_cmd.add_argument("--port", type=int, default=DEFAULT_PORT + 1)
+    swarm_cmd = commands.add_parser("swarm", help=argparse.SUPPRESS)
+    swarm_cmd.add_argument("address")
+    swarm_cmd.add_argument("--viewers", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.command == "hub":
+        try:
+            asyncio.run(Hub().serve(port=args.port,
+                                    ready=lambda port: print(f"spectator hub on port {port}", flush=True)))
+        except KeyboardInterrupt:
+            pass
+    elif args.command == "watch":
+        asyncio.run(watch(parse_address(args.address)))
+    elif args.command == "swarm":
+        asyncio.run(swarm(parse_address(args.address), args.viewers))
+    else:
+        bench(args.viewers, args.seconds, args.port)
@@ -0,0 +1,206 @@
+"""Multi-core tournament runner.
+
+Splits a round-robin or single-elimination bracket over the roster into
+shards, runs them on a process pool and merges the results into one
+report. Every shard gets its own RNG stream derived from (seed, shard key),
+so the results do not depend on the number of workers, and finished shards
+are written to a checkpoint file so an interrupted sweep can be resumed:
+
+    python tournament.py --battles 100000000 --policies ai greedy --checkpoint sweep.json
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+
+import battle
+
+try:
+    import numpy as np
+    import montecarlo
+except ImportError:
+    np = None
+
+
+def run_shard(shard):
+    """Play one shard and return (key, p1_wins, battles, total_turns)."""
+    key, name1, policy1, name2, policy2, count, seed = shard
+    if np is not None:
+        rng = np.random.default_rng([seed, *key_numbers(key)])
+        winner, turns = montecarlo.simulate_matchup(name1, name2, (policy1, policy2), count, rng)
+        return key, int((winner == 0).sum()), count, int(turns.sum())
+
+    rng = random.Random(f"{seed}:{key}")
+    wins = total_turns = 0
+    for _ in range(count):
+        state = battle.simulate_battle(name1, name2, (policy1, policy2), rng)
+        wins += state.winner == 0
+        total_turns += state.turns
+    return key, wins, count, total_turns
+
+
+def key_numbers(key):
+    return [int(part) for part in key.split(":")]
+
+
+def entrant_name(entrant):
+    return f"{entrant[0]}/{entrant[1]}"
+
+
+def make_shards(round_idx, matches, battles_per_match, shard_size, seed):
+    """Split each match into shards; both entrants play half the battles as P1."""
+    shards = []
+    for match_idx, (a, b) in enumerate(matches):
+        for side, (first, second) in enumerate(((a, b), (b, a))):
+            remaining = battles_per_match // 2 + (battles_per_match % 2 if side == 0 else 0)
+            part = 0
+            while remaining > 0:
+                count = min(shard_size, remaining)
+                key = f"{round_idx}:{match_idx}:{side}:{part}"
+                shards.append((key, first[0], first[1], second[0], second[1], count, seed))
+                remaining -= count
+                part += 1
+    return shards
+
+
+class Checkpoint:
+    """Finished shard results, flushed atomically to a JSON file."""
+
+    def __init__(self, path, config):
+        self.path = path
+        self.config = config
+        self.done = {}
+        self.last_save = time.monotonic()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("config") != config:
+                raise SystemExit(f"{path} was written by a different tournament configuration")
+            self.done = {key: tuple(value) for key, value in data["shards"].items()}
+
+    def add(self, key, wins, count, turns, force=False):
+        self.done[key] = (wins, count, turns)
+        if force or time.monotonic() - self.last_save > 5:
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"config": self.config, "shards": self.done}, f)
+        os.replace(tmp_path, self.path)
+        self.last_save = time.monotonic()
+
+
+def run_round(pool, checkpoint, shards, progress):
+    todo = [shard for shard in shards if shard[0] not in checkpoint.done]
+    try:
+        for key, wins, count, turns in pool.imap_unordered(run_shard, todo):
+            checkpoint.add(key, wins, count, turns)
+            progress(count)
+    finally:
+        checkpoint.save()
+
+
+def merge_round(checkpoint, round_idx, matches):
+    """Per-match totals as seen from the first entrant of each match."""
+    results = []
+    for match_idx, (a, b) in enumerate(matches):
+        wins = battles = turns = 0
+        for key, (shard_wins, count, shard_turns) in checkpoint.done.items():
+            r, m, side, _ = key_numbers(key)
+            if r != round_idx or m != match_idx:
+                continue
+            wins += shard_wins if side == 0 else count - shard_wins
+            battles += count
+            turns += shard_turns
+        results.append({"a": entrant_name(a), "b": entrant_name(b), "battles": battles,
+                        "a_win_rate": wins / battles if battles else 0.0,
+                        "mean_turns": turns / battles if battles else 0.0})
+    return results
+
+
+def standings(matches):
+    totals = {}
+    for match in matches:
+        for name, rate in ((match["a"], match["a_win_rate"]), (match["b"], 1 - match["a_win_rate"])):
+            wins, battles = totals.get(name, (0.0, 0))
+            totals[name] = (wins + rate * match["battles"], battles + match["battles"])
+    table = [{"entrant": name, "win_rate": wins / battles if battles else 0.0, "battles": battles}
+             for name, (wins, battles) in totals.items()]
+    return sorted(table, key=lambda row: -row["win_rate"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a sharded tournament over the roster.")
+    parser.add_argument("--format", choices=["round-robin", "bracket"], default="round-robin")
+    parser.add_argument("--battles", type=int, default=1000000, help="total battles in the sweep")
+    parser.add_argument("--policies", nargs="+", default=["ai"], choices=sorted(battle.POLICIES))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shard-size", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--checkpoint", help="JSON file to resume from and save progress to")
+    parser.add_argument("--report", help="write the merged report as JSON")
+    args = parser.parse_args()
+
+    entrants = list(itertools.product(battle.POKEMON_STATS.keys(), args.policies))
+    config = {"format": args.format, "battles": args.battles, "policies": args.policies,
+              "shard_size": args.shard_size, "seed": args.seed,
+              "entrants": [entrant_name(e) for e in entrants]}
+    checkpoint = Checkpoint(args.checkpoint, config)
+
+    # A bracket plays one match per eliminated entrant; its rounds are built as winners become known
+    if args.format == "round-robin":
+        match_count = len(entrants) * (len(entrants) - 1) // 2
+    else:
+        match_count = len(entrants) - 1
+    battles_per_match = max(1, args.battles // max(match_count, 1))
+
+    start = time.perf_counter()
+    played = [0]
+
+    def progress(count):
+        played[0] += count
+        elapsed = time.perf_counter() - start
+        print(f"\r{played[0]} battles, {played[0] / elapsed:.0f}/s", end="", flush=True)
+
+    report = {"config": config, "rounds": []}
+    with multiprocessing.Pool(args.workers) as pool:
+        if args.format == "round-robin":
+            matches = list(itertools.combinations(entrants, 2))
+            shards = make_shards(0, matches, battles_per_match, args.shard_size, args.seed)
+            run_round(pool, checkpoint, shards, progress)
+            report["rounds"].append(merge_round(checkpoint, 0, matches))
+        else:
+            alive = entrants[:]
+            round_idx = 0
+            while len(alive) > 1:
+                matches = [(alive[i], alive[i + 1]) for i in range(0, len(alive) - 1, 2)]
+                bye = alive[-1:] if len(alive) % 2 else []
+                shards = make_shards(round_idx, matches, battles_per_match, args.shard_size, args.seed)
+                run_round(pool, checkpoint, shards, progress)
+                results = merge_round(checkpoint, round_idx, matches)
+                report["rounds"].append(results)
+                alive = [a if result["a_win_rate"] >= 0.5 else b
+                         for (a, b), result in zip(matches, results)] + bye
+                round_idx += 1
+            report["champion"] = entrant_name(alive[0])
+    print()
+
+    all_matches = [match for round_results in report["rounds"] for match in round_results]
+    report["standings"] = standings(all_matches)
+    for row in report["standings"]:
+        print(f"{row['entrant']:<24}{row['win_rate']:7.1%}  ({row['battles']} battles)")
+    if "champion" in report:
+        print(f"Champion: {report['champion']}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
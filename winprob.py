@@ -0,0 +1,139 @@
+"""Exact win probability and expected battle length.
+
+Damage is uniform over each move's damage_range and a potion is a fixed
++POTION_HEAL, so the outcome of a battle under fixed policies can be
+solved exactly instead of sampled. solve() fills a table over every
+(turn, potions0, potions1, hp0, hp1) state. The policy's move choice and
+each move's uniform roll combine into one damage distribution per state,
+which is convolved along the defender's HP axis (knockout rolls clamp onto
+HP 0); a potion reads the layer with one potion less. Attacks only lower
+HP and potions only lower the potion count, so one bottom-up pass fills
+the table.
+
+    python winprob.py Cyndaquil Totodile --policies ai greedy
+"""
+import argparse
+import functools
+
+import numpy as np
+
+import battle
+from montecarlo import MoveTable
+
+
+# --- Policy distributions: (moves, hp, max_hp, potions) -> (move probs, potion prob) ---
+# hp may be an array; move probs have shape (len(moves.keys),) + hp.shape
+
+def ai_probs(moves, hp, max_hp, potions):
+    weights = np.array([battle.AI_TACKLE_WEIGHT if k == "tackle" else battle.AI_MOVE_WEIGHT
+                        for k in moves.keys], dtype=np.float64)
+    heal = (potions > 0) & (hp < max_hp * battle.AI_HEAL_THRESHOLD)
+    move_probs = np.multiply.outer(weights / weights.sum(), ~heal)
+    return move_probs, heal.astype(np.float64)
+
+
+def random_probs(moves, hp, max_hp, potions):
+    can_heal = (potions > 0) & (hp < max_hp)
+    share = 1.0 / (len(moves.keys) + can_heal)
+    move_probs = np.multiply.outer(np.ones(len(moves.keys)), share)
+    return move_probs, np.where(can_heal, share, 0.0)
+
+
+def greedy_probs(moves, hp, max_hp, potions):
+    best = int(np.argmax(moves.low.astype(np.int32) + moves.high))
+    move_probs = np.multiply.outer(np.arange(len(moves.keys)) == best, np.ones_like(hp, dtype=np.float64))
+    return move_probs, np.zeros_like(hp, dtype=np.float64)
+
+
+POLICY_PROBS = {
+    "ai": ai_probs,
+    "random": random_probs,
+    "greedy": greedy_probs,
+}
+
+
+def damage_pmf(moves, move_probs, size):
+    """P(damage == d) for d < size, mixing each move's uniform damage_range by its probability."""
+    uniform = np.zeros((len(moves.keys), size))
+    for m in range(len(moves.keys)):
+        low, high = int(moves.low[m]), int(moves.high[m])
+        uniform[m, low:high + 1] = 1.0 / (high - low + 1)
+    return np.tensordot(uniform, move_probs, axes=(0, 0))
+
+
+class WinTable:
+    """Solved matchup: win[turn, potions0, potions1, hp0, hp1] is P(side 0 wins),
+    turns[...] the expected number of actions left."""
+
+    def __init__(self, names, policies, win, turns):
+        self.names = names
+        self.policies = policies
+        self.win = win
+        self.turns = turns
+
+    def lookup(self, state):
+        """(P(side 0 wins), expected actions left) for a battle.Battle."""
+        if state.winner is not None:
+            return (1.0 if state.winner == 0 else 0.0), 0.0
+        key = (state.turn, state.potions[0], state.potions[1], state.hp[0], state.hp[1])
+        return float(self.win[key]), float(self.turns[key])
+
+
+@functools.lru_cache(maxsize=32)
+def solve(name1, name2, policies=("ai", "ai")):
+    tables = (MoveTable(name1), MoveTable(name2))
+    probs = [POLICY_PROBS[p] for p in policies]
+    max0, max1 = tables[0].max_hp, tables[1].max_hp
+    pots = battle.POTION_COUNT + 1
+    size = int(max(t.high.max() for t in tables)) + 1
+    damages = np.arange(size)
+    h0s, h1s = np.arange(max0 + 1), np.arange(max1 + 1)
+    healed1 = np.minimum(h1s + battle.POTION_HEAL, max1)
+    # shifted[h1, d] is where side 1's HP lands after d damage (knockouts clamp to 0)
+    shifted = np.maximum(h1s[:, None] - damages, 0)
+
+    # values[turn, potions0, potions1, hp0, hp1] = (P(side 0 wins), expected actions left)
+    values = np.zeros((2, pots, pots, max0 + 1, max1 + 1, 2))
+    for p0 in range(pots):
+        move_probs, potion0 = probs[0](tables[0], h0s, max0, p0)
+        pmf0 = damage_pmf(tables[0], move_probs, size)        # (damage, hp0)
+        for p1 in range(pots):
+            move_probs, potion1 = probs[1](tables[1], h1s, max1, p1)
+            pmf1 = damage_pmf(tables[1], move_probs, size)    # (damage, hp1)
+            # Terminal states: hp1 == 0 means side 0 won, hp0 == 0 means it lost
+            values[:, p0, p1, 1:, 0, 0] = 1.0
+            for h0 in range(1, max0 + 1):
+                # Side 1 to move: its hits land on earlier hp0 rows of the side-0 table
+                rows = values[0, p0, p1][np.maximum(h0 - damages, 0)]
+                row = (pmf1[:, :, None] * rows).sum(axis=0)
+                if p1:
+                    row += potion1[:, None] * values[0, p0, p1 - 1, h0, healed1]
+                row[:, 1] += 1.0
+                values[1, p0, p1, h0, 1:] = row[1:]
+
+                # Side 0 to move: convolve the row just filled with its damage distribution
+                row = np.einsum("d,hdk->hk", pmf0[:, h0], values[1, p0, p1, h0][shifted])
+                if p0:
+                    healed0 = min(h0 + battle.POTION_HEAL, max0)
+                    row += potion0[h0] * values[1, p0 - 1, p1, healed0]
+                row[:, 1] += 1.0
+                values[0, p0, p1, h0, 1:] = row[1:]
+
+    return WinTable((name1, name2), tuple(policies), values[..., 0], values[..., 1])
+
+
+def win_probability(state, policies=("ai", "ai")):
+    """(P(side 0 wins), expected actions left) for a battle in progress."""
+    return solve(state.names[0], state.names[1], tuple(policies)).lookup(state)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exact P1 win probability and expected battle length.")
+    parser.add_argument("name1", choices=sorted(battle.POKEMON_STATS))
+    parser.add_argument("name2", choices=sorted(battle.POKEMON_STATS))
+    parser.add_argument("--policies", nargs=2, default=["ai", "ai"], choices=sorted(POLICY_PROBS))
+    args = parser.parse_args()
+
+    state = battle.Battle(args.name1, args.name2)
+    p1_win, expected_turns = win_probability(state, args.policies)
+    print(f"P1 wins {p1_win:.4%}, {expected_turns:.3f} actions on average")